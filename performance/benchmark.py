@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of pyes against an in-process stub server (see stubserver.py).
+
+Usage:
+
+    python benchmark.py                   # run all the benchmarks
+    python benchmark.py bulk_index mget   # run some benchmarks
+    python benchmark.py --save            # store the results in results.json, by commit
+    python benchmark.py --compare HEAD~1  # compare with the results stored for a commit
+
+Every benchmark reports the operations per second, the p50/p99 latency of an
+operation, the objects retained per operation (the objects tracked by the
+garbage collector still alive after it, its result included: a net count, not
+the allocations) and, where tracemalloc is available (Python 3), the peak of
+the memory allocated during an operation.
+
+The stub server runs in the same process: its time is part of the
+measures, but it is the same for every commit.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyes import ES, Search, BoolQuery, TermQuery, MatchAllQuery, RangeQuery, TermFilter, ESRange
+from pyes.facets import TermFacet, DateHistogramFacet
+from pyes.models import SearchHit
+from pyes.querycache import QueryCache, QueryTemplate, Param, freeze
+from stubserver import StubServer, make_document, make_hit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+
+BENCHMARKS = []
+
+
+def benchmark(iterations):
+    """
+    Register a benchmark: the decorated function receives the ES connection
+    and the stub server and returns the operation to measure
+    """
+    def decorator(func):
+        BENCHMARKS.append((func.__name__, func, iterations))
+        return func
+    return decorator
+
+
+def make_search(name="joe", min_age=10):
+    query = BoolQuery(must=[TermQuery("name", name), RangeQuery(ESRange("age", min_age, 40))],
+                      should=[TermQuery("tags", "lorem"), TermQuery("tags", "ipsum")])
+    search = Search(query, filter=TermFilter("active", True), fields=["name", "age"], start=10, size=20,
+                    sort=[{"date": "desc"}], facet=None)
+    search.facet.add(TermFacet("tags", size=10))
+    search.facet.add(DateHistogramFacet("date_facet", field="date", interval="month"))
+    return search
+
+
+@benchmark(iterations=5000)
+def serialize(conn, server):
+    search = make_search()
+
+    def op():
+        return conn._encode_query(search.serialize())
+    return op
+
+
+@benchmark(iterations=5000)
+def serialize_frozen(conn, server):
+    search = freeze(make_search())
+    cache = QueryCache()
+
+    def op():
+        return cache.encode(search, conn._encode_search, "search")
+    return op
+
+
+@benchmark(iterations=5000)
+def serialize_template(conn, server):
+    template = QueryTemplate(make_search(Param("name"), Param("min_age")))
+    state = {"num": 0}
+
+    def op():
+        num = state["num"] = state["num"] + 1
+        return template.bind(name="joe", min_age=num % 40).encode(conn.codec)
+    return op
+
+
+@benchmark(iterations=20000)
+def bulk_index(conn, server):
+    docs = [make_document(num) for num in xrange(100)]
+    state = {"num": 0}
+
+    def op():
+        num = state["num"] = state["num"] + 1
+        conn.index(docs[num % 100], "test-index", "test-type", num, bulk=True)
+    return op
+
+
+@benchmark(iterations=20000)
+def bulk_index_bytes(conn, server):
+    docs = [json.dumps(make_document(num)) for num in xrange(100)]
+    state = {"num": 0}
+
+    def op():
+        num = state["num"] = state["num"] + 1
+        conn.index(docs[num % 100], "test-index", "test-type", num, bulk=True)
+    return op
+
+
+@benchmark(iterations=50)
+def resultset_iteration(conn, server):
+    def op():
+        for hit in conn.search(MatchAllQuery(), "test-index", "test-type", size=100):
+            pass
+    return op
+
+
+@benchmark(iterations=50)
+def resultset_export_columns(conn, server):
+    def op():
+        return conn.search(MatchAllQuery(), "test-index", "test-type", size=100).export_columns(
+            ["_id", "name", "age"], {"age": "int64"})
+    return op
+
+
+@benchmark(iterations=20)
+def scan_iteration(conn, server):
+    def op():
+        for hit in conn.search(MatchAllQuery(), "test-index", "test-type", scan=True, size=100):
+            pass
+    return op
+
+
+@benchmark(iterations=200)
+def mget(conn, server):
+    ids = [str(num) for num in xrange(100)]
+
+    def op():
+        return conn.mget(ids, "test-index", "test-type")
+    return op
+
+
+@benchmark(iterations=200)
+def json_decode(conn, server):
+    body = server.cached_page("test-index", "test-type", 0, 100)
+
+    def op():
+        return conn.codec.loads(body)
+    return op
+
+
+@benchmark(iterations=200)
+def model_construction(conn, server):
+    hits = conn.codec.loads(json.dumps([make_hit("test-index", "test-type", num) for num in xrange(100)]))
+    model = conn.model
+
+    def op():
+        #the models consume the hits
+        return [model(conn, dict(hit, _source=dict(hit["_source"]))) for hit in hits]
+    return op
+
+
+@benchmark(iterations=200)
+def searchhit_construction(conn, server):
+    hits = conn.codec.loads(json.dumps([make_hit("test-index", "test-type", num) for num in xrange(100)]))
+
+    def op():
+        return [SearchHit(conn, hit).name for hit in hits]
+    return op
+
+
+def percentile(timings, percent):
+    index = min(len(timings) - 1, int(round(percent / 100.0 * (len(timings) - 1))))
+    return timings[index]
+
+
+def measure_retained(op, iterations):
+    """Return the objects tracked by the gc retained per operation, its result included"""
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        results = [op() for i in xrange(iterations)]
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+    del results
+    return float(after - before) / iterations
+
+
+def measure_peak_memory(op, iterations):
+    """Return the mean peak of the KiB allocated during an operation, None without tracemalloc"""
+    if tracemalloc is None:
+        return None
+    peak = 0
+    tracemalloc.start()
+    try:
+        for i in xrange(iterations):
+            # clearing the traces resets the peak too
+            tracemalloc.clear_traces()
+            op()
+            peak += tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak / 1024.0 / iterations
+
+
+def run_benchmark(name, setup, iterations, conn, server):
+    op = setup(conn, server)
+    for i in xrange(max(1, iterations // 10)):
+        op()
+    conn.force_bulk()
+
+    timings = []
+    timer = time.time
+    start = timer()
+    for i in xrange(iterations):
+        op_start = timer()
+        op()
+        timings.append(timer() - op_start)
+    conn.force_bulk()
+    elapsed = timer() - start
+    timings.sort()
+
+    retained = measure_retained(op, max(1, iterations // 10))
+    peak_memory = measure_peak_memory(op, max(1, iterations // 10))
+    conn.force_bulk()
+    return {"iterations": iterations,
+            "ops_per_sec": iterations / elapsed,
+            "p50_ms": percentile(timings, 50) * 1000,
+            "p99_ms": percentile(timings, 99) * 1000,
+            "retained_objects_per_op": retained,
+            "peak_kib_per_op": peak_memory}
+
+
+def get_commit(ref="HEAD"):
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", ref],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_results():
+    if not os.path.exists(RESULTS_FILE):
+        return {}
+    with open(RESULTS_FILE) as results_file:
+        return json.load(results_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pyes benchmarks against a stub server")
+    parser.add_argument("names", nargs="*", help="the benchmarks to run (default: all)")
+    parser.add_argument("--save", action="store_true", help="store the results in %s" % RESULTS_FILE)
+    parser.add_argument("--compare", metavar="COMMIT", help="compare with the stored results of a commit")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the iterations")
+    args = parser.parse_args()
+
+    names = [name for name, setup, iterations in BENCHMARKS]
+    for name in args.names:
+        if name not in names:
+            parser.error("unknown benchmark %r (available: %s)" % (name, ", ".join(names)))
+
+    #the searches return 1000 hits
+    server = StubServer(total_hits=1000).start()
+    conn = ES(server.url, bulk_size=400)
+    results = {}
+    try:
+        for name, setup, iterations in BENCHMARKS:
+            if args.names and name not in args.names:
+                continue
+            iterations = max(1, int(iterations * args.scale))
+            results[name] = result = run_benchmark(name, setup, iterations, conn, server)
+            line = "%-22s %12.1f ops/s  p50 %9.3f ms  p99 %9.3f ms  %10.1f retained objects/op" % (
+                name, result["ops_per_sec"], result["p50_ms"], result["p99_ms"],
+                result["retained_objects_per_op"])
+            if result["peak_kib_per_op"] is not None:
+                line += "  %9.1f KiB peak/op" % result["peak_kib_per_op"]
+            print line
+    finally:
+        for node in conn.connection.nodes:
+            node.pool.close()
+        server.stop()
+
+    commit = get_commit()
+    stored = load_results()
+    if args.compare:
+        compare = stored.get(get_commit(args.compare))
+        if compare is None:
+            print "No results stored for %s" % args.compare
+        else:
+            print "\nCompared with %s:" % args.compare
+            for name, result in sorted(results.items()):
+                old = compare["benchmarks"].get(name)
+                if old:
+                    print "%-22s %+7.1f%% ops/s  %+7.1f%% p99" % (
+                        name, (result["ops_per_sec"] / old["ops_per_sec"] - 1) * 100,
+                        (result["p99_ms"] / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0)
+    if args.save:
+        entry = stored.setdefault(commit, {"benchmarks": {}})
+        entry.update(date=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(),
+                     platform=platform.platform())
+        entry["benchmarks"].update(results)
+        with open(RESULTS_FILE, "w") as results_file:
+            json.dump(stored, results_file, indent=2, sort_keys=True)
+        print "\nResults stored for commit %s in %s" % (commit, RESULTS_FILE)
+
+
+if __name__ == '__main__':
+    main()
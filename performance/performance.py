@@ -1,13 +1,14 @@
 import sys
 
-#sys.path.insert(0, "../")
+sys.path.insert(0, "../")
 
-#from pyes import ES
-from brainaetic.echidnasearch.es import ES
+from pyes import ES
 from datetime import datetime
 import shelve
-#conn = ES('127.0.0.1:9200')
-conn = ES('192.168.2.50:9200')
+
+#Usage: python performance.py [server], the server defaults to 127.0.0.1:9200
+#The benchmarks without an ES server are in benchmark.py
+conn = ES(sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1:9200')
 try:
     conn.delete_index("test-index")
 except:
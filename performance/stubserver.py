@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+An in-process HTTP server answering as ElasticSearch to the requests of the
+benchmarks: /_bulk, /_search (paged and scan), /_search/scroll, /_mget and
+the get of a document. The documents are generated from their id, so every
+run returns the same data.
+"""
+import BaseHTTPServer
+import SocketServer
+import json
+import threading
+import urlparse
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipisicing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua").split()
+
+NAMES = ["Alberto", "Joe", "Bill", "Maria", "Anna", "Paul", "Laura", "Marco", "Luca", "Sara"]
+
+
+def make_document(num):
+    """
+    The source of the document with the given number
+    """
+    return {"name": NAMES[num % len(NAMES)],
+            "age": num % 100,
+            "date": "2012-%02d-%02dT10:11:12" % (num % 12 + 1, num % 28 + 1),
+            "tags": [WORDS[num % len(WORDS)], WORDS[(num * 7) % len(WORDS)]],
+            "description": " ".join(WORDS[(num + i) % len(WORDS)] for i in xrange(50))}
+
+
+def make_hit(index, doc_type, num):
+    return {"_index": index, "_type": doc_type, "_id": str(num), "_score": 1.0,
+            "_source": make_document(num)}
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    #send the headers and the body in a single packet
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else ""
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        parts = [part for part in url.path.split("/") if part]
+        server = self.server
+        with server.lock:
+            server.requests += 1
+
+        if parts and parts[-1] == "_bulk":
+            data = self._bulk(body)
+        elif parts[-2:] == ["_search", "scroll"]:
+            data = self._scroll(body.strip(), params)
+        elif parts and parts[-1] == "_search":
+            data = self._search(parts, body, params)
+        elif parts and parts[-1] == "_mget":
+            data = self._mget(body)
+        elif len(parts) == 3 and not parts[0].startswith("_"):
+            data = json.dumps(dict(make_hit(parts[0], parts[1], int(parts[2])), exists=True))
+        else:
+            data = '{"ok": true}'
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def _bulk(self, body):
+        items = []
+        lines = body.splitlines()
+        pos = 0
+        while pos < len(lines):
+            if not lines[pos].strip():
+                pos += 1
+                continue
+            action = json.loads(lines[pos])
+            op, meta = action.items()[0]
+            items.append({op: {"_index": meta.get("_index"), "_type": meta.get("_type"),
+                               "_id": meta.get("_id", str(pos)), "_version": 1, "ok": True}})
+            pos += 1 if op == "delete" else 2
+        return json.dumps({"took": 1, "items": items})
+
+    def _page(self, index, doc_type, start, size):
+        """The encoded hits from start to start + size"""
+        total = self.server.total_hits
+        return self.server.cached_page(index, doc_type, start, min(size, max(total - start, 0)))
+
+    def _search(self, parts, body, params):
+        query = json.loads(body) if body else {}
+        index = parts[0] if len(parts) > 1 else "test-index"
+        doc_type = parts[1] if len(parts) > 2 else "test-type"
+        size = int(query.get("size", params.get("size", 10)))
+        start = int(query.get("from", params.get("from", 0)))
+        total = self.server.total_hits
+        if "scroll" in params:
+            scroll_id = "%s:%s:%d:%d" % (index, doc_type, 0, size)
+            if params.get("search_type") == "scan":
+                hits = "[]"
+            else:
+                hits = self._page(index, doc_type, 0, size)
+                scroll_id = "%s:%s:%d:%d" % (index, doc_type, size, size)
+            return ('{"_scroll_id": "%s", "took": 1, "timed_out": false, "hits": {"total": %d, '
+                    '"max_score": 1.0, "hits": %s}}' % (scroll_id, total, hits))
+        return ('{"took": 1, "timed_out": false, "hits": {"total": %d, "max_score": 1.0, "hits": %s}}'
+                % (total, self._page(index, doc_type, start, size)))
+
+    def _scroll(self, scroll_id, params):
+        index, doc_type, start, size = scroll_id.split(":")
+        start, size = int(start), int(size)
+        scroll_id = "%s:%s:%d:%d" % (index, doc_type, start + size, size)
+        return ('{"_scroll_id": "%s", "took": 1, "timed_out": false, "hits": {"total": %d, '
+                '"max_score": 1.0, "hits": %s}}' % (scroll_id, self.server.total_hits,
+                                                     self._page(index, doc_type, start, size)))
+
+    def _mget(self, body):
+        docs = []
+        for doc in json.loads(body)["docs"]:
+            hit = make_hit(doc["_index"], doc["_type"], int(doc["_id"]))
+            hit["exists"] = True
+            docs.append(hit)
+        return json.dumps({"docs": docs})
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The stub server: start() serves from a daemon thread on a free port of
+    127.0.0.1, ``total_hits`` is the number of documents of the searches.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, total_hits=10000):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.total_hits = total_hits
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._pages = {}
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.server_address
+
+    def cached_page(self, index, doc_type, start, size):
+        key = (index, doc_type, start, size)
+        page = self._pages.get(key)
+        if page is None:
+            page = self._pages[key] = json.dumps([make_hit(index, doc_type, num)
+                                                  for num in xrange(start, start + size)])
+        return page
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="stub-server")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
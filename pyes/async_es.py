@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Non blocking ElasticSearch client.
+
+It runs on the tornado IOLoop: you need tornado installed to use it.
+Just do a "pip install tornado".
+
+Example:
+
+    from tornado import gen, ioloop
+
+    @gen.coroutine
+    def main():
+        conn = AsyncES("127.0.0.1:9200")
+        results = yield conn.search(TermQuery("name", "joe"), "test-index")
+        for hit in results:
+            print hit.name
+
+        scroller = conn.scan(MatchAllQuery(), "test-index")
+        while True:
+            hits = yield scroller.next_page()
+            if not hits:
+                break
+
+    ioloop.IOLoop.current().run_sync(main)
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from time import time
+from urllib import urlencode
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPError
+
+from . import logger
+from .connection_http import Connection, Node
+from .es import ES, _split_missing, _split_msearch_item
+from .exceptions import InvalidQuery, NoServerAvailable, NotFoundException, ReduceSearchPhaseException
+from .fakettypes import Method, RestResponse
+from .instrumentation import RequestEvent, body_size
+from .models import DotDict, ListBulker, _merge_bulk_results, _raise_exception_if_bulk_item_failed
+from .query import Search, Query
+from .utils import make_path
+
+__all__ = ["AsyncES", "AsyncConnection", "AsyncBulker", "AsyncResultSet", "AsyncScroller"]
+
+
+def _unsupported(name):
+    """
+    Return a method of AsyncES rejecting a blocking method of ES
+    """
+    def method(self, *args, **kwargs):
+        raise ValueError("AsyncES doesn't support %s()" % name)
+    method.__name__ = name
+    method.__doc__ = "Not supported by AsyncES: it blocks on the responses"
+    return method
+
+
+class AsyncConnection(Connection):
+    """
+    A non blocking http connection to the ES servers.
+
+    It shares the server selection and failover of the http Connection, while
+    the requests are executed by a tornado AsyncHTTPClient holding up to
+    ``max_clients`` concurrent connections: the nodes have no urllib3 pool.
+    """
+
+    def __init__(self, servers=None, retry_time=60, max_retries=3, timeout=None,
+                 basic_auth=None, max_clients=10, selector="least_outstanding"):
+        super(AsyncConnection, self).__init__(servers, retry_time=retry_time, max_retries=max_retries,
+                                              timeout=timeout, basic_auth=basic_auth, selector=selector)
+        self._client = AsyncHTTPClient(force_instance=True, max_clients=max_clients)
+
+    def _new_node(self, url):
+        return Node(url, 0)
+
+    @gen.coroutine
+    def execute(self, request, event=None):
+        """Execute a request and return a Future of the response"""
+        url = request.uri
+        if request.parameters:
+            url += '?' + urlencode(request.parameters)
+
+        if request.headers:
+            headers = dict(self._headers, **request.headers)
+        else:
+            headers = self._headers
+
+        body = request.body
+        if isinstance(body, bytearray):
+            body = str(body)
+
+        kwargs = dict(
+            method=Method._VALUES_TO_NAMES[request.method],
+            headers=headers,
+            body=body or None,
+            allow_nonstandard_methods=True,
+        )
+        if self._timeout is not None:
+            kwargs['request_timeout'] = self._timeout
+
+        retry = 0
+        while True:
+            node = self._get_node()
+            if event is not None:
+                event.server = node.url
+                event.retries = retry
+            self._acquire(node)
+            start = time()
+            try:
+                response = yield self._client.fetch(HTTPRequest(node.url + url, **kwargs),
+                                                    raise_error=False)
+                if response.code == 599:
+                    # connection failure or timeout
+                    raise response.error
+            except (IOError, HTTPError), ex:
+                self._drop_node(node)
+                if retry >= self._max_retries:
+                    logger.error("Client error: bailing out after %d failed retries",
+                                 self._max_retries, exc_info=1)
+                    raise NoServerAvailable(ex)
+                logger.exception("Client error: %d retries left", self._max_retries - retry)
+                retry += 1
+                continue
+            finally:
+                self._release(node, time() - start)
+            raise gen.Return(RestResponse(status=response.code,
+                                          body=response.body,
+                                          headers=response.headers))
+
+    def close(self):
+        super(AsyncConnection, self).close()
+        self._client.close()
+
+
+class AsyncBulker(ListBulker):
+    """
+    A bulker whose flush_bulk returns a Future of the bulk response
+    """
+
+    @gen.coroutine
+    def flush_bulk(self, forced=False):
+        results = []
+        while True:
+            with self.bulk_lock:
+                batch = self._take_batch(forced)
+            if batch is None:
+                break
+            payload, ends = batch
+            bulk_result = DotDict((yield self._post_bulk(payload)))
+
+            if self.raise_on_bulk_item_failure:
+                _raise_exception_if_bulk_item_failed(bulk_result, payload, ends)
+
+            results.append(bulk_result)
+
+        raise gen.Return(_merge_bulk_results(results))
+
+
+class AsyncResultSet(object):
+    """
+    The results of a search: iterating over it yields the hits as models
+    """
+
+    def __init__(self, connection, results, model):
+        self.connection = connection
+        self.results = results
+        self.model = model
+        self.hits = results.get("hits", {}).get("hits", [])
+
+    @property
+    def total(self):
+        return self.results.get("hits", {}).get("total", 0)
+
+    @property
+    def facets(self):
+        return self.results.get("facets", {})
+
+    def __len__(self):
+        return len(self.hits)
+
+    def __iter__(self):
+        for hit in self.hits:
+            yield self.model(self.connection, hit)
+
+    def __getitem__(self, val):
+        if isinstance(val, slice):
+            return [self.model(self.connection, hit) for hit in self.hits[val]]
+        return self.model(self.connection, self.hits[val])
+
+    def __getattr__(self, name):
+        #took, timed_out, _shards
+        try:
+            return self.results[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class AsyncScroller(object):
+    """
+    Scan a search, a page at a time.
+
+    next_page() returns a Future of the models of the next page, an empty
+    list when all the hits have been returned.
+    """
+
+    def __init__(self, connection, search, indices=None, doc_types=None, scroll="10m",
+                 model=None, query_params=None):
+        self.connection = connection
+        self.search = search
+        self.indices = indices
+        self.doc_types = doc_types
+        self.scroll = scroll
+        self.model = model or connection.model
+        self.query_params = query_params or {}
+        self.scroller_id = None
+        self.total = None
+        self._done = False
+
+    @gen.coroutine
+    def next_page(self):
+        if self._done:
+            raise gen.Return([])
+        if self.scroller_id is None:
+            results = yield self.connection.search_raw(self.search, indices=self.indices,
+                                                       doc_types=self.doc_types, search_type="scan",
+                                                       scroll=self.scroll, **self.query_params)
+            self.total = results["hits"]["total"]
+            self.scroller_id = results["_scroll_id"]
+        try:
+            results = yield self.connection.search_scroll(self.scroller_id, self.scroll)
+        except ReduceSearchPhaseException:
+            #as in ResultSet, there are no hits on the last iteration
+            results = None
+        hits = results["hits"]["hits"] if results else []
+        if not hits:
+            self._done = True
+            raise gen.Return([])
+        self.scroller_id = results["_scroll_id"]
+        raise gen.Return([self.model(self.connection, hit) for hit in hits])
+
+
+class AsyncES(ES):
+    """
+    Non blocking ES connection object.
+
+    It accepts the ES parameters and ``max_clients``, the max number of
+    concurrent connections. Only http servers are supported, without
+    sniffing, mapping decoding, response cache and compression.
+
+    The requests return tornado Futures. These methods are redefined: search,
+    get, mget, multi_search, scan (an AsyncScroller), bulk and force_bulk. These ones send a
+    single request and return its raw response as in ES:
+
+    - index, delete, exists, count, delete_by_query, search_raw and
+      search_scroll (without streaming), morelikethis, reindex, put_file,
+      create_river, delete_river, create_percolator and percolate
+    - indices: aliases, change_aliases, stats, status, create_index,
+      delete_index, exists_index, close_index, open_index, optimize, analyze,
+      gateway_snapshot, get_mapping, delete_mapping and get_settings, and
+      flush and refresh when no bulk data is pending
+    - cluster: shutdown, health, state, nodes_info and node_stats
+
+    The others wait for a response before sending another request: they are
+    not supported, and collect_info, ensure_index, get_file, update,
+    update_mapping_meta, iter_mget (use mget with chunk_size), parallel_scan
+    and resumable_scan raise a ValueError.
+    """
+
+    asynchronous = True
+
+    def __init__(self, server="localhost:9200", max_clients=10, **kwargs):
+        self.max_clients = max_clients
+        if kwargs.get("sniff_interval") or kwargs.get("sniff_on_connection_fail"):
+            raise ValueError("AsyncES doesn't support sniffing")
+        if kwargs.get("decode_datetimes") == "mapping":
+            raise ValueError("AsyncES doesn't support the mapping decoding")
+        if kwargs.get("response_cache"):
+            raise ValueError("AsyncES doesn't support the response cache")
+        if kwargs.get("compression"):
+            raise ValueError("AsyncES doesn't support the compression")
+        kwargs.setdefault("bulker_class", AsyncBulker)
+        super(AsyncES, self).__init__(server, **kwargs)
+
+    def __del__(self):
+        # the pending bulk data can't be sent without the IOLoop running
+        if self.bulker:
+            logger.error("pyes object %s is being destroyed, but bulk "
+                         "operations have not been flushed. Call force_bulk()!",
+                         self)
+        self.close()
+
+    def _init_connection(self):
+        """
+        Create the non blocking connection
+        """
+        servers = [server for server in self.servers if server.scheme in ["http", "https"]]
+        if not servers:
+            raise RuntimeError("No http server defined")
+        self.connection = AsyncConnection(servers, timeout=self.timeout, basic_auth=self.basic_auth,
+                                          max_retries=self.max_retries, max_clients=self.max_clients,
+                                          selector=self.selector)
+
+    @gen.coroutine
+    def _send_request(self, method, path, body=None, params=None, headers=None, raw=False):
+        if not self.connection:
+            self._init_connection()
+        if self.instrumentation is not None:
+            result = yield self._send_instrumented_request(method, path, body, params, headers, raw)
+            raise gen.Return(result)
+        request = self._prepare_request(method, path, body, params, headers)
+        response = yield self.connection.execute(request)
+        raise gen.Return(self._process_response(method, response, raw))
+
+    def _send_stream_request(self, method, path, body=None, params=None):
+        # urllib3 would block the IOLoop while reading the response
+        raise ValueError("AsyncES doesn't support the streamed responses")
+
+    @gen.coroutine
+    def _send_instrumented_request(self, method, path, body=None, params=None, headers=None, raw=False):
+        event = RequestEvent(method, path)
+        instrumentation = self.instrumentation
+        try:
+            start = time()
+            request = self._prepare_request(method, path, body, params, headers)
+            event.body_bytes = body_size(request.body)
+            wire_start = time()
+            event.encode_time = wire_start - start
+            instrumentation.request_started(event)
+
+            response = yield self.connection.execute(request, event)
+            decode_start = time()
+            event.wire_time = decode_start - wire_start
+            event.status = response.status
+            try:
+                result = self._process_response(method, response, raw)
+            finally:
+                event.decode_time = time() - decode_start
+            if isinstance(result, dict):
+                event.took = result.get("took")
+        except Exception, e:
+            event.error = e
+            raise
+        finally:
+            instrumentation.request_finished(event)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def get(self, index, doc_type, id, fields=None, model=None, **query_params):
+        """
+        Get a typed JSON document from an index based on its id.
+        """
+        path = make_path(index, doc_type, id)
+        if fields is not None:
+            query_params["fields"] = ",".join(fields)
+        model = model or self.model
+        result = yield self._send_request('GET', path, params=query_params)
+        raise gen.Return(model(self, result))
+
+    @gen.coroutine
+    def mget(self, ids, index=None, doc_type=None, chunk_size=None, workers=1, missing="include",
+             **query_params):
+        """
+        Get multi JSON documents.
+
+        ids can be:
+            list of tuple: (index, type, id)
+            list of ids: index and doc_type are required
+
+        chunk_size, workers and missing are the ones of ES.mget: up to
+        workers requests of chunk_size documents are sent concurrently.
+        """
+        if not ids:
+            raise gen.Return([])
+
+        body = self._build_mget_docs(ids, index, doc_type)
+        chunk_size = chunk_size or len(body)
+        chunks = [body[pos:pos + chunk_size] for pos in xrange(0, len(body), chunk_size)]
+        workers = max(workers, 1)
+        docs = []
+        not_found = []
+        for pos in xrange(0, len(chunks), workers):
+            responses = yield [self._send_request('GET', "/_mget", body={'docs': chunk},
+                                                  params=dict(query_params))
+                               for chunk in chunks[pos:pos + workers]]
+            for results in responses:
+                kept, missing_docs = _split_missing(results.get('docs', []), missing)
+                docs.extend(kept)
+                not_found.extend(missing_docs)
+        if not_found and missing == "raise":
+            raise NotFoundException("%d documents not found" % len(not_found), result=not_found)
+        model = self.model
+        raise gen.Return([model(self, doc) for doc in docs])
+
+    @gen.coroutine
+    def search(self, query, indices=None, doc_types=None, model=None, **query_params):
+        """Execute a search against one or more indices and return an AsyncResultSet
+        of the hits of the requested page.
+
+        `query` must be a Search object, a Query object, or a custom
+        dictionary of search parameters using the query DSL to be passed
+        directly.
+        """
+        search = self._get_search(query)
+        results = yield self.search_raw(search, indices=indices, doc_types=doc_types, **query_params)
+        raise gen.Return(AsyncResultSet(self, results, model or self.model))
+
+    @gen.coroutine
+    def multi_search(self, searches, model=None, raise_on_error=True):
+        """Execute several searches in a single _msearch request and return the
+        list of their AsyncResultSets, in the order of the searches.
+
+        The searches are the ones of ES.multi_search. The from and size
+        parameters of a search set its page, search_type, preference and
+        routing are sent with the _msearch request and the others are ignored.
+        If raise_on_error is False, a failed search is returned as its
+        exception instead of raising it.
+        """
+        if not searches:
+            raise gen.Return([])
+        lines = []
+        for item in searches:
+            query, indices, doc_types, query_params = _split_msearch_item(item)
+            body = self._get_search(query).serialize()
+            for name in ("from", "size"):
+                if query_params.get(name) is not None:
+                    body[name] = query_params[name]
+            lines.extend(self._msearch_lines(indices, doc_types, query_params, body))
+        lines.append("")
+
+        results = yield self._send_request("GET", "/_msearch", "\n".join(lines))
+        model = model or self.model
+        raise gen.Return([response if isinstance(response, Exception) else AsyncResultSet(self, response, model)
+                          for response in self._msearch_responses(results, len(searches), raise_on_error)])
+
+    def scan(self, query, indices=None, doc_types=None, scroll="10m", model=None, **query_params):
+        """Return an AsyncScroller over all the hits of a search.
+        """
+        search = self._get_search(query)
+        return AsyncScroller(self, search, indices=indices, doc_types=doc_types, scroll=scroll,
+                             model=model, query_params=query_params)
+
+    def bulk(self):
+        """
+        Send all the pending bulk data and return a Future of the bulk response
+        """
+        return self.force_bulk()
+
+    iter_mget = _unsupported("iter_mget")
+    collect_info = _unsupported("collect_info")
+    ensure_index = _unsupported("ensure_index")
+    get_file = _unsupported("get_file")
+    update = _unsupported("update")
+    update_mapping_meta = _unsupported("update_mapping_meta")
+    parallel_scan = _unsupported("parallel_scan")
+    resumable_scan = _unsupported("resumable_scan")
+
+    def _get_search(self, query):
+        if isinstance(query, Search):
+            return query
+        elif isinstance(query, (Query, dict)):
+            return Search(query)
+        raise InvalidQuery("search() must be supplied with a Search or Query object, or a dict")
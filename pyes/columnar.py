@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ["ColumnBuilder", "Columns"]
+
+#the array.array typecodes of the dtypes, used when NumPy is missing ("l"
+#is 64 bits on the LP64 platforms only); the other dtypes are stored in lists
+ARRAY_TYPECODES = {"float64": "d", "f8": "d", "float": "d", "float32": "f", "f4": "f",
+                   "int64": "l", "i8": "l", "int": "l", "int32": "i", "i4": "i", "int16": "h", "i2": "h",
+                   "int8": "b", "i1": "b", "uint8": "B", "u1": "B", "bool": "b"}
+
+#the metadata of the hits which can be exported as fields
+HIT_FIELDS = frozenset(["_id", "_type", "_index", "_score", "_version"])
+
+_MISSING = object()
+
+
+class Columns(object):
+    """
+    The fields of the hits exported in columns: ``columns[name]`` is the
+    array of the values of a field (a fill value where the value is missing:
+    NaN, NaT, 0, "" or None, depending on the dtype) and ``masks[name]`` the
+    array of booleans telling where the value is missing.
+    """
+
+    def __init__(self, names, columns, masks, count):
+        self.names = names
+        self.columns = columns
+        self.masks = masks
+        self.count = count
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.count
+
+    def masked(self, name):
+        """
+        Return the column as a numpy.ma.MaskedArray
+        """
+        if numpy is None:
+            raise RuntimeError("masked() requires NumPy")
+        return numpy.ma.MaskedArray(self.columns[name], mask=self.masks[name])
+
+
+def _make_getter(name):
+    """
+    Return a function returning the value of a field in a hit (given with
+    its fields and its _source), _MISSING if missing
+    """
+    if name in HIT_FIELDS:
+        def get(hit, fields, source):
+            return hit.get(name, _MISSING)
+        return get
+
+    path = name.split(".")
+    if len(path) == 1:
+        def get(hit, fields, source):
+            if fields is not None and name in fields:
+                return fields[name]
+            if source is None:
+                return _MISSING
+            return source.get(name, _MISSING)
+        return get
+
+    def get(hit, fields, source):
+        if fields is not None and name in fields:
+            return fields[name]
+        value = source
+        for part in path:
+            if not isinstance(value, dict):
+                return _MISSING
+            value = value.get(part, _MISSING)
+        return value
+    return get
+
+
+class _Column(object):
+    def __init__(self, name, dtype, capacity, use_numpy):
+        self.name = name
+        self.use_numpy = use_numpy
+        if use_numpy:
+            self.dtype = numpy.dtype(dtype)
+            self.values = numpy.empty(capacity, self.dtype)
+            self.mask = numpy.empty(capacity, numpy.bool_)
+            kind = self.dtype.kind
+            if kind in "fc":
+                self.fill = float("nan")
+            elif kind in "Mm":
+                self.fill = numpy.datetime64("NaT")
+            elif kind in "SU":
+                self.fill = ""
+            elif kind == "O":
+                self.fill = None
+            else:
+                self.fill = 0
+        else:
+            typecode = ARRAY_TYPECODES.get(dtype)
+            if typecode is None:
+                self.values = []
+                self.fill = None
+                self.convert = None
+            else:
+                self.values = array(typecode)
+                # array.array doesn't convert the strings and the floats as NumPy does
+                if typecode in "df":
+                    self.fill = float("nan")
+                    self.convert = float
+                else:
+                    self.fill = 0
+                    self.convert = int
+            self.mask = array("b")
+
+    def store(self, count, values):
+        """
+        Store the values of the rows from ``count``
+        """
+        fill = self.fill
+        mask = [value is _MISSING or value is None for value in values]
+        values = [fill if missing else value for value, missing in zip(values, mask)]
+        if any(isinstance(value, list) for value in values):
+            values = [value[0] if isinstance(value, list) and len(value) == 1 else value for value in values]
+        if self.use_numpy:
+            end = count + len(values)
+            if end > len(self.values):
+                capacity = max(end, 2 * len(self.values))
+                self.values = _grow(self.values, count, capacity)
+                self.mask = _grow(self.mask, count, capacity)
+            self.values[count:end] = values
+            self.mask[count:end] = mask
+        else:
+            convert = self.convert
+            if convert is not None:
+                values = [convert(value) for value in values]
+            self.values.extend(values)
+            self.mask.extend(mask)
+
+    def finish(self, count):
+        if self.use_numpy and len(self.values) > count:
+            return self.values[:count].copy(), self.mask[:count].copy()
+        return self.values, self.mask
+
+
+def _grow(values, count, capacity):
+    grown = numpy.empty(capacity, values.dtype)
+    grown[:count] = values[:count]
+    return grown
+
+
+class ColumnBuilder(object):
+    """
+    Fill arrays with the fields of raw hits, without building their models.
+
+    ``fields`` are the names of the fields: dotted paths in the _source, the
+    names of the requested ``fields`` of the hits, or the _id, _type, _index,
+    _score and _version of the hits. ``dtypes`` are their types (a list, or
+    a dict by name; "object" by default): NumPy dtypes, or the ones of
+    ARRAY_TYPECODES when NumPy is missing or ``use_numpy`` is False, the
+    values of the other dtypes being kept in lists.
+
+    The NumPy arrays are preallocated with ``size_hint`` rows and grown as
+    needed. The values are converted by chunks of ``chunk_size`` rows. A
+    field with a single value in a list (i.e. a stored field) is unwrapped.
+
+    Example:
+
+        builder = ColumnBuilder(["_id", "age", "address.zip"], ["S20", "i4", "object"])
+        for hit in hits:
+            builder.add(hit)
+        columns = builder.finish()
+        ages = columns.masked("age")
+    """
+
+    def __init__(self, fields, dtypes=None, size_hint=0, use_numpy=None, chunk_size=4096):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise RuntimeError("NumPy is not installed")
+        if dtypes is None:
+            dtypes = {}
+        if isinstance(dtypes, dict):
+            dtypes = [dtypes.get(name, "object") for name in fields]
+        elif len(dtypes) != len(fields):
+            raise ValueError("%d dtypes given for %d fields" % (len(dtypes), len(fields)))
+        self.names = list(fields)
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._columns = [_Column(name, dtype, size_hint, use_numpy) for name, dtype in zip(fields, dtypes)]
+        self._getters = [_make_getter(name) for name in fields]
+        self._rows = []
+
+    def add(self, hit):
+        """
+        Add the fields of a raw hit as a row
+        """
+        fields = hit.get("fields")
+        source = hit.get("_source")
+        self._rows.append([get(hit, fields, source) for get in self._getters])
+        if len(self._rows) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        rows = self._rows
+        if not rows:
+            return
+        for column, values in zip(self._columns, zip(*rows)):
+            column.store(self.count, values)
+        self.count += len(rows)
+        self._rows = []
+
+    def finish(self):
+        """
+        Return the Columns of the rows added
+        """
+        self._flush()
+        columns = {}
+        masks = {}
+        for column in self._columns:
+            columns[column.name], masks[column.name] = column.finish(self.count)
+        return Columns(self.names, columns, masks, self.count)
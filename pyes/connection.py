@@ -141,22 +141,31 @@ class ThreadLocalConnection(object):
 
     def __getattr__(self, attr):
         def _client_call(*args, **kwargs):
-            for retry in xrange(self._max_retries + 1):
-                try:
-                    conn = self._ensure_connection()
-                    return getattr(conn.client, attr)(*args, **kwargs)
-                except (Thrift.TException, socket.timeout, socket.error), exc:
-                    logger.exception('Client error: %s', exc)
-                    self.close()
-
-                    if retry < self._max_retries:
-                        continue
-
-                    raise NoServerAvailable(exc)
+            return self._client_call(attr, *args, **kwargs)
 
         setattr(self, attr, _client_call)
         return getattr(self, attr)
 
+    def _client_call(self, attr, *args, **kwargs):
+        for retry in xrange(self._max_retries + 1):
+            try:
+                conn = self._ensure_connection()
+                return getattr(conn.client, attr)(*args, **kwargs)
+            except (Thrift.TException, socket.timeout, socket.error), exc:
+                logger.exception('Client error: %s', exc)
+                self.close()
+
+                if retry < self._max_retries:
+                    continue
+
+                raise NoServerAvailable(exc)
+
+    def execute(self, request, event=None):
+        if isinstance(request.body, bytearray):
+            # thrift only serializes str bodies (i.e. the bulk payloads)
+            request.body = str(request.body)
+        return self._client_call("execute", request)
+
     def _ensure_connection(self):
         """Make certain we have a valid connection and return it."""
         conn = self.connect()
@@ -1,38 +1,134 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+from __future__ import with_statement
 from . import logger
 from .exceptions import NoServerAvailable
 from .fakettypes import Method, RestResponse
 from time import time
 from urllib import urlencode
-from urlparse import urlparse
+import atexit
 import random
 import threading
 import urllib3
-import heapq
+import weakref
+import zlib
 
 __all__ = ["connect"]
 
 DEFAULT_SERVER = ("http", "127.0.0.1", 9200)
-POOL_MANAGER = urllib3.PoolManager()
+DEFAULT_POOL_MAXSIZE = 10
+
+#weight of the last request in the average latency of a node
+EWMA_ALPHA = 0.3
+
+#the zlib window bits of the request body encodings
+COMPRESSIONS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+#the size of the chunks of a compressed response which are decompressed at once
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+#the connections pinging their failed servers, whose pingers are stopped at
+#the interpreter exit, before the modules they use are torn down
+_pinging_connections = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_pingers():
+    pingers = []
+    for connection in list(_pinging_connections):
+        connection._stopped.set()
+        pingers.append(connection._pinger)
+    for pinger in pingers:
+        if pinger is not None:
+            pinger.join(1)
+
 
 def update_connection_pool(maxsize=1):
-    """Update the global connection pool manager parameters.
+    """Update the default size of the connection pools.
 
-    maxsize: Number of connections to save that can be reused (default=1).
+    maxsize: Number of connections to save that can be reused for every
+             server, used when a Connection does not set `pool_maxsize`.
              More than 1 is useful in multithreaded situations.
     """
-    POOL_MANAGER.connection_pool_kw.update(maxsize=maxsize)
+    global DEFAULT_POOL_MAXSIZE
+    DEFAULT_POOL_MAXSIZE = maxsize
+
+
+class Node(object):
+    """An ES server with its own connection pool and load statistics.
+
+    `outstanding` is the number of requests in flight, `latency` the
+    exponentially weighted moving average of the request time in seconds.
+    `pool` is None if `pool_maxsize` is 0 (the nodes of the connections
+    which don't send their requests with urllib3).
+    """
+
+    def __init__(self, url, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        self.url = url
+        if pool_maxsize:
+            self.pool = urllib3.connection_from_url(url, maxsize=pool_maxsize)
+        else:
+            self.pool = None
+        self.outstanding = 0
+        self.latency = None
+
+    def __repr__(self):
+        return "Node(%r, outstanding=%d, latency=%r)" % (self.url, self.outstanding, self.latency)
+
+    def record_latency(self, elapsed):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += EWMA_ALPHA * (elapsed - self.latency)
+
+    def load(self):
+        """The expected time to serve a new request"""
+        return (self.latency or 0.0) * (self.outstanding + 1)
+
+
+def least_outstanding(nodes):
+    """Select the node with the fewest requests in flight"""
+    fewest = min(node.outstanding for node in nodes)
+    return random.choice([node for node in nodes if node.outstanding == fewest])
+
+
+def lowest_latency(nodes):
+    """Select the node with the lowest average latency, weighted by its requests in flight.
+
+    Nodes without a latency yet are tried first.
+    """
+    lowest = min(node.load() for node in nodes)
+    return random.choice([node for node in nodes if node.load() == lowest])
+
+
+def random_node(nodes):
+    """Select a random node"""
+    return random.choice(nodes)
+
+
+SELECTORS = {"least_outstanding": least_outstanding,
+             "ewma": lowest_latency,
+             "random": random_node}
+
 
 class Connection(object):
-    """An ElasticSearch connection to a randomly chosen server of the list.
+    """An ElasticSearch connection to a set of servers.
+
+    Every server has its own pool of up to `pool_maxsize` reusable
+    connections, and every request is sent to the server chosen by the
+    `selector`:
 
-    If the connection fails, it attempts to connect to another random server
-    of the list until one succeeds. If it is unable to find an active server,
-    it throws a NoServerAvailable exception.
+    - "least_outstanding": the server with the fewest requests in flight
+    - "ewma": the server with the lowest average latency, weighted by its
+      requests in flight
+    - "random": a random server
+    - a callable returning a Node from a list of active ones
 
-    Failing servers are kept on a separate list and eventually retried, no
-    sooner than `retry_time` seconds after failure.
+    If a request fails, it is retried on another server. If it is unable to
+    find an active server, it throws a NoServerAvailable exception.
+
+    Failing servers are kept on a separate list and pinged from a background
+    thread every `retry_time` seconds: they are reinstated once they answer.
+    close() stops the pinger and closes the pools.
 
     Parameters
     ----------
@@ -40,7 +136,7 @@ class Connection(object):
     servers: List of ES servers represented as (`scheme`, `hostname`, `port`)
              tuples. Default: [("http", "127.0.0.1", 9200)]
 
-    retry_time: Minimum time in seconds until a failed server is reinstated.
+    retry_time: Time in seconds between the pings of the failed servers.
                 Default: 60
 
     max_retries: Max number of attempts to connect to some server.
@@ -49,26 +145,109 @@ class Connection(object):
 
     basic_auth: Use HTTP Basic Auth. A (`username`, `password`) tuple or a dict
                 with `username` and `password` keys.
+
+    pool_maxsize: Number of connections to save that can be reused for every
+                  server. Default: DEFAULT_POOL_MAXSIZE
+
+    selector: The policy choosing the server of a request. Default: "least_outstanding"
+
+    on_node_failure: A callable called with the Node removed from the active
+                     ones after a failure.
+
+    compression: "gzip" or "deflate" to compress the request bodies of at
+                 least `compression_threshold` bytes, at the zlib level
+                 `compression_level`, and to accept compressed responses,
+                 which are decompressed as they are read. Default: None
     """
 
     def __init__(self, servers=None, retry_time=60, max_retries=3, timeout=None,
-                 basic_auth=None):
+                 basic_auth=None, pool_maxsize=None, selector="least_outstanding",
+                 on_node_failure=None, compression=None, compression_threshold=1024,
+                 compression_level=6):
         if servers is None:
             servers = [DEFAULT_SERVER]
-        self._active_servers = [server.geturl() for server in servers]
-        self._inactive_servers = []
+        self._pool_maxsize = pool_maxsize or DEFAULT_POOL_MAXSIZE
+        self._active_nodes = [self._new_node(server.geturl()) for server in servers]
+        self._inactive_nodes = []
         self._retry_time = retry_time
         self._max_retries = max_retries
         self._timeout = timeout
+        if isinstance(selector, basestring):
+            selector = SELECTORS[selector]
+        self._selector = selector
         if basic_auth:
             self._headers = urllib3.make_headers(basic_auth="%(username)s:%(password)s" % basic_auth)
         else:
             self._headers = {}
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression %r: use one of %s" % (compression, ", ".join(COMPRESSIONS)))
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+        if compression is not None:
+            self._headers = dict(self._headers, **{"Accept-Encoding": "gzip, deflate"})
         self._lock = threading.RLock()
-        self._local = threading.local()
+        self._pinger = None
+        self._stopped = threading.Event()
+        self.on_node_failure = on_node_failure
+
+    @property
+    def nodes(self):
+        """The active nodes"""
+        return list(self._active_nodes)
+
+    def update_servers(self, urls):
+        """
+        Replace the servers with the given urls, keeping the pools of the
+        servers already known.
+
+        :return: the (added, removed) urls
+        """
+        urls = set(urls)
+        with self._lock:
+            known = set(node.url for node in self._active_nodes + self._inactive_nodes)
+            added = urls - known
+            removed = known - urls
+            for url in sorted(added):
+                self._active_nodes.append(self._new_node(url))
+                logger.info("Added server %s to active pool", url)
+            for nodes in (self._active_nodes, self._inactive_nodes):
+                for node in [node for node in nodes if node.url in removed]:
+                    nodes.remove(node)
+                    if node.pool is not None:
+                        node.pool.close()
+                    logger.info("Removed server %s from the servers", node.url)
+        return sorted(added), sorted(removed)
+
+    def _new_node(self, url):
+        return Node(url, self._pool_maxsize)
+
+    def execute(self, request, event=None):
+        """Execute a request and return a response.
+
+        If given, the server, the retries and the bytes sent and received are
+        recorded in the RequestEvent `event`.
+        """
+        if self._compression is not None:
+            return self.read_response(self.open(request, event), event)
+
+        response = self._urlopen(self._request_kwargs(request, event), event)
+        if event is not None:
+            event.received_bytes = event.response_bytes = len(response.data or "")
+        return RestResponse(status=response.status,
+                            body=response.data,
+                            headers=response.headers)
+
+    def open(self, request, event=None):
+        """Send a request and return its urllib3 response, without reading its body.
 
-    def execute(self, request):
-        """Execute a request and return a response"""
+        The body is read with response.stream(), which decompresses it if
+        needed, then the connection is released with response.release_conn()
+        (after response.close() if the body was not read to the end).
+        """
+        return self._urlopen(self._request_kwargs(request, event, preload_content=False), event)
+
+    def _request_kwargs(self, request, event=None, preload_content=True):
         url = request.uri
         if request.parameters:
             url += '?' + urlencode(request.parameters)
@@ -78,64 +257,151 @@ class Connection(object):
         else:
             headers = self._headers
 
-        kwargs = dict(
+        body = request.body
+        if self._compression is not None and body and len(body) >= self._compression_threshold:
+            body = self._compress(body)
+            headers = dict(headers, **{"Content-Encoding": self._compression})
+        if event is not None:
+            event.sent_bytes = len(body or "")
+
+        return dict(
             method=Method._VALUES_TO_NAMES[request.method],
             url=url,
-            body=request.body,
+            body=body,
             headers=headers,
             timeout=self._timeout,
+            preload_content=preload_content,
         )
 
+    def read_response(self, response, event=None):
+        """
+        Read the body of an opened response in chunks, decompressed as they come
+        """
+        try:
+            data = "".join(response.stream(DECOMPRESS_CHUNK_SIZE, decode_content=True))
+        except (IOError, urllib3.exceptions.HTTPError), ex:
+            response.close()
+            raise NoServerAvailable(ex)
+        finally:
+            response.release_conn()
+        if event is not None:
+            event.response_bytes = len(data)
+            event.received_bytes = response.tell() if hasattr(response, "tell") else len(data)
+        return RestResponse(status=response.status, body=data, headers=response.headers)
+
+    def _compress(self, body):
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        elif isinstance(body, bytearray):
+            body = buffer(body)
+        compressor = zlib.compressobj(self._compression_level, zlib.DEFLATED,
+                                      COMPRESSIONS[self._compression])
+        return compressor.compress(body) + compressor.flush()
+
+    def _urlopen(self, kwargs, event=None):
+        """
+        Send a request to a node, retrying on the other nodes if it fails
+        """
         retry = 0
-        server = getattr(self._local, "server", None)
         while True:
-            if not server:
-                self._local.server = server = self._get_server()
+            node = self._get_node()
+            self._acquire(node)
+            start = time()
+            if event is not None:
+                event.server = node.url
+                event.retries = retry
             try:
-                parse_result = urlparse(server)
-                conn = POOL_MANAGER.connection_from_host(parse_result.hostname,
-                                                         parse_result.port,
-                                                         parse_result.scheme)
-                response = conn.urlopen(**kwargs)
-                return RestResponse(status=response.status,
-                                    body=response.data,
-                                    headers=response.headers)
+                return node.pool.urlopen(**kwargs)
             except (IOError, urllib3.exceptions.HTTPError), ex:
-                self._drop_server(server)
-                self._local.server = server = None
+                self._drop_node(node)
                 if retry >= self._max_retries:
                     logger.error("Client error: bailing out after %d failed retries",
                                  self._max_retries, exc_info=1)
                     raise NoServerAvailable(ex)
                 logger.exception("Client error: %d retries left", self._max_retries - retry)
                 retry += 1
+            finally:
+                self._release(node, time() - start)
 
-    def _get_server(self):
+    def _get_node(self):
         with self._lock:
-            try:
-                ts, server = heapq.heappop(self._inactive_servers)
-            except IndexError:
-                pass
-            else:
-                if ts > time():  # Not yet, put it back
-                    heapq.heappush(self._inactive_servers, (ts, server))
-                else:
-                    self._active_servers.append(server)
-                    logger.info("Restored server %s into active pool", server)
+            if not self._active_nodes:
+                raise NoServerAvailable("All the servers are unavailable")
+            return self._selector(self._active_nodes)
 
-            try:
-                return random.choice(self._active_servers)
-            except IndexError, ex:
-                raise NoServerAvailable(ex)
+    def _acquire(self, node):
+        with self._lock:
+            node.outstanding += 1
 
-    def _drop_server(self, server):
+    def _release(self, node, elapsed):
+        with self._lock:
+            node.outstanding -= 1
+            node.record_latency(elapsed)
+
+    def _drop_node(self, node):
         with self._lock:
             try:
-                self._active_servers.remove(server)
+                self._active_nodes.remove(node)
             except ValueError:
-                pass
-            else:
-                heapq.heappush(self._inactive_servers, (time() + self._retry_time, server))
-                logger.warning("Removed server %s from active pool", server)
+                return
+            self._inactive_nodes.append(node)
+            logger.warning("Removed server %s from active pool", node.url)
+            if self._pinger is None and not self._stopped.is_set():
+                self._pinger = threading.Thread(target=self._ping_inactive_nodes,
+                                                name="pyes-http-pinger")
+                self._pinger.daemon = True
+                self._pinger.start()
+                _pinging_connections.add(self)
+        if self.on_node_failure is not None:
+            self.on_node_failure(node)
+
+    def _ping_inactive_nodes(self):
+        """
+        Ping the inactive nodes every retry_time seconds, until all of them are
+        restored or the connection is closed
+        """
+        while True:
+            with self._lock:
+                nodes = list(self._inactive_nodes)
+                if not nodes or self._stopped.is_set():
+                    self._pinger = None
+                    return
+            self._stopped.wait(self._retry_time)
+            for node in nodes:
+                if self._stopped.is_set():
+                    break
+                if self._ping(node):
+                    with self._lock:
+                        if node in self._inactive_nodes:
+                            self._inactive_nodes.remove(node)
+                            node.latency = None
+                            self._active_nodes.append(node)
+                            logger.info("Restored server %s into active pool", node.url)
+
+    def _ping(self, node):
+        pool = node.pool
+        if pool is None:
+            pool = urllib3.connection_from_url(node.url, maxsize=1)
+        try:
+            pool.urlopen("HEAD", "/", headers=self._headers, retries=False,
+                         timeout=self._timeout)
+            return True
+        except Exception:
+            logger.debug("Ping of %s failed", node.url, exc_info=1)
+            return False
+        finally:
+            if pool is not node.pool:
+                pool.close()
+
+    def close(self):
+        """
+        Stop the pinger and close the pools of the servers
+        """
+        self._stopped.set()
+        with self._lock:
+            nodes = self._active_nodes + self._inactive_nodes
+        for node in nodes:
+            if node.pool is not None:
+                node.pool.close()
 
 connect = Connection
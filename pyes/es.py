@@ -1,11 +1,11 @@
 from __future__ import with_statement
 
-from datetime import date, datetime
-from decimal import Decimal
+from datetime import datetime
 from urllib import urlencode
 from urlparse import urlunsplit, urlparse
 import base64
 import codecs
+import logging
 import random
 import time
 import urllib
@@ -16,18 +16,26 @@ except ImportError:
     import json
 
 from . import logger
+from .columnar import ColumnBuilder
 from .connection_http import connect as http_connect
 from .convert_errors import raise_if_error
 from .decorators import deprecated
 from .exceptions import ElasticSearchException, ReduceSearchPhaseException, \
-    InvalidQuery, VersionConflictEngineException
+    InvalidQuery, VersionConflictEngineException, NotFoundException
 from .helpers import SettingsBuilder
+from .instrumentation import RequestEvent, body_size
+from .jsoncodec import JSONCodec, ESJsonEncoder, ESJsonDecoder
 from .managers import Indices, Cluster
-from .mappings import Mapper
-from .models import DotDict, ListBulker, ElasticSearchModel
+from .mappings import Mapper, MappingDecoder
+from .models import ListBulker, BulkHeaders, ElasticSearchModel
 from .odm import model_factory
 from .query import Search, Query, MatchAllQuery
+from .querycache import QueryCache, BoundTemplate
+from .responsecache import ResponseCache, bulk_indices, path_indices
 from .rivers import River
+from .scroll import ParallelScan, ResumableScan, PagePrefetcher, OrderedFetcher
+from .sniffer import Sniffer
+from .streaming import HitStream
 from .utils import make_path
 try:
     from .connection import connect as thrift_connect
@@ -51,59 +59,43 @@ def file_to_attachment(filename, filehandler=None):
         }
 
 
-class ESJsonEncoder(json.JSONEncoder):
-    def default(self, value):
-        """Convert rogue and mysterious data types.
-        Conversion notes:
+#the size of the chunks read from the socket by the streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
 
-        - ``datetime.date`` and ``datetime.datetime`` objects are
-        converted into datetime strings.
-        """
-
-        if isinstance(value, datetime):
-            return value.isoformat()
-        elif isinstance(value, date):
-            dt = datetime(value.year, value.month, value.day, 0, 0, 0)
-            return dt.isoformat()
-        elif isinstance(value, Decimal):
-            return float(str(value))
-        elif isinstance(value, set):
-            return list(value)
-        # raise TypeError
-        return super(ESJsonEncoder, self).default(value)
 
+def _is_missing(doc):
+    """
+    Return if a document of a mget response doesn't exist
+    """
+    return not doc.get("exists", doc.get("found", True))
 
-class ESJsonDecoder(json.JSONDecoder):
-    def __init__(self, *args, **kwargs):
-        kwargs['object_hook'] = self.dict_to_object
-        super(ESJsonDecoder, self).__init__(*args, **kwargs)
 
-    def string_to_datetime(self, obj):
-        """
-        Decode a datetime string to a datetime object
-        """
-        if isinstance(obj, basestring) and len(obj) == 19:
-            try:
-                return datetime(*time.strptime(obj, "%Y-%m-%dT%H:%M:%S")[:6])
-            except ValueError:
-                pass
-        return obj
+def _split_msearch_item(item):
+    """
+    Return the (query, indices, doc_types, query_params) of a search given
+    to ES.multi_search
+    """
+    if isinstance(item, tuple):
+        query, indices, doc_types = item[:3]
+        query_params = dict(item[3]) if len(item) > 3 else {}
+        return query, indices, doc_types, query_params
+    return item, None, None, {}
 
 
-    def dict_to_object(self, d):
-        """
-        Decode datetime value from string to datetime
-        """
-        for k, v in d.items():
-            if isinstance(v, basestring) and len(v) == 19:
-                # Decode a datetime string to a datetime object
-                try:
-                    d[k] = datetime(*time.strptime(v, "%Y-%m-%dT%H:%M:%S")[:6])
-                except ValueError:
-                    pass
-            elif isinstance(v, list):
-                d[k] = [self.string_to_datetime(elem) for elem in v]
-        return DotDict(d)
+def _split_missing(docs, missing):
+    """
+    Return the docs of a mget response to keep (see ES.mget ``missing``) and
+    the (index, type, id) of the ones which don't exist
+    """
+    kept = []
+    not_found = []
+    for doc in docs:
+        if _is_missing(doc):
+            not_found.append((doc.get("_index"), doc.get("_type"), doc.get("_id")))
+            if missing != "include":
+                continue
+        kept.append(doc)
+    return kept, not_found
 
 
 class ES(object):
@@ -113,6 +105,8 @@ class ES(object):
     #static to easy overwrite
     encoder = ESJsonEncoder
     decoder = ESJsonDecoder
+    #True if the requests return Futures instead of their responses
+    asynchronous = False
 
     def __init__(self, server="localhost:9200", timeout=30.0, bulk_size=400,
                  encoder=None, decoder=None,
@@ -125,7 +119,19 @@ class ES(object):
                  basic_auth=None,
                  raise_on_bulk_item_failure=False,
                  document_object_field=None,
-                 bulker_class=ListBulker):
+                 bulker_class=ListBulker,
+                 bulk_bytes=None,
+                 pool_maxsize=None,
+                 selector="least_outstanding",
+                 sniff_interval=None,
+                 sniff_on_connection_fail=False,
+                 json_engine=None,
+                 decode_datetimes=True,
+                 instrumentation=None,
+                 query_cache=None,
+                 response_cache=None,
+                 compression=None,
+                 compression_threshold=1024):
         """
         Init a es object.
         Servers can be defined in different forms:
@@ -155,6 +161,41 @@ class ES(object):
         bulk operation fails
 
         :param document_object_field: a class to use as base document field in mapper
+
+        :param bulk_bytes: if set, a bulk request is also sent as soon as its
+        payload reaches this size in bytes
+
+        :param pool_maxsize: number of reusable http connections for every
+        server (more than 1 is useful in multithreaded situations)
+        :param selector: how an http request chooses its server:
+        "least_outstanding", "ewma", "random" or a callable (see connection_http.Connection)
+
+        :param sniff_interval: if set, the http servers are updated with the
+        nodes of the cluster every sniff_interval seconds
+        :param sniff_on_connection_fail: if truthy, the http servers are
+        updated with the nodes of the cluster when a server fails
+
+        :param json_engine: the name of the engine decoding the responses:
+        "json" (default) or "ujson" (see jsoncodec.JSONCodec)
+        :param decode_datetimes: if truthy, the "%Y-%m-%dT%H:%M:%S" strings of
+        the responses are decoded to datetime objects. If "mapping", the
+        values of the documents are converted by the type of their field in
+        the mapping (see mappings.MappingDecoder) and no other string is decoded
+
+        :param instrumentation: an instrumentation.Instrumentation whose hooks
+        are called around every request (i.e. an instrumentation.MemoryCollector)
+
+        :param query_cache: if set, the encoded bodies of the frozen Search/Query/Filter
+        objects are cached by structure in a querycache.QueryCache of this
+        size (or in this QueryCache)
+        :param response_cache: if set, the responses of the searches, counts
+        and mgets are cached in this responsecache.ResponseCache (True for a
+        ResponseCache with the default ttl and size). The aliases of the
+        cluster are then loaded every ResponseCache.alias_ttl seconds
+
+        :param compression: "gzip" or "deflate" to compress the http request
+        bodies of at least compression_threshold bytes and to accept
+        compressed responses (see connection_http.Connection)
         """
         if default_indices is None:
             default_indices = ["_all"]
@@ -165,6 +206,17 @@ class ES(object):
         self.debug_dump = False
         self.cluster_name = "undefined"
         self.basic_auth = basic_auth
+        self.pool_maxsize = pool_maxsize
+        self.instrumentation = instrumentation
+        self.selector = selector
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        if isinstance(query_cache, (int, long)):
+            query_cache = QueryCache(query_cache)
+        self.query_cache = query_cache
+        if response_cache is True:
+            response_cache = ResponseCache()
+        self.response_cache = response_cache
         self.connection = None
         self._mappings = None
         self.document_object_field = document_object_field
@@ -186,16 +238,27 @@ class ES(object):
 
         #used in bulk
         self._bulk_size = bulk_size  #size of the bulk
+        self._bulk_bytes = bulk_bytes  #max size in bytes of the bulk
         self.bulker = bulker_class(weakref.proxy(self), bulk_size=bulk_size,
-                                   raise_on_bulk_item_failure=raise_on_bulk_item_failure)
+                                   raise_on_bulk_item_failure=raise_on_bulk_item_failure,
+                                   bulk_bytes=bulk_bytes)
         self.bulker_class = bulker_class
         self._raise_on_bulk_item_failure = raise_on_bulk_item_failure
+        self.bulk_headers = BulkHeaders()
 
         self.info = {}  #info about the current server
         if encoder:
             self.encoder = encoder
         if decoder:
             self.decoder = decoder
+        if decode_datetimes == "mapping":
+            self.mapping_decoder = MappingDecoder(weakref.proxy(self))
+            decode_datetimes = False
+        else:
+            self.mapping_decoder = None
+        self.codec = JSONCodec(engine=json_engine, decode_datetimes=decode_datetimes,
+                               encoder=self.encoder,
+                               decoder=self.decoder if self.decoder is not ESJsonDecoder else None)
         if isinstance(server, (str, unicode)):
             self.servers = [server]
         elif isinstance(server, tuple):
@@ -210,8 +273,15 @@ class ES(object):
         self.default_types = default_types or []
         #check the servers variable
         self._check_servers()
+        if sniff_interval or sniff_on_connection_fail:
+            self.sniffer = Sniffer(weakref.proxy(self), interval=sniff_interval,
+                                   on_connection_fail=sniff_on_connection_fail)
+        else:
+            self.sniffer = None
         #init connections
         self._init_connection()
+        if self.sniffer:
+            self.sniffer.start()
 
 
     def __del__(self):
@@ -229,6 +299,24 @@ class ES(object):
                          self)
             # Do our best to save the client anyway...
             self.bulker.flush_bulk(True)
+        self.close()
+
+    def close(self):
+        """
+        Close the connection: stop its background threads and close its pooled
+        connections. The bulk operations are not flushed, unless the bulker
+        has to send them to stop its own threads (see ThreadedBulker.close).
+        """
+        if getattr(self, "sniffer", None):
+            self.sniffer.stop()
+        bulker = getattr(self, "bulker", None)
+        try:
+            if bulker is not None and hasattr(bulker, "close"):
+                bulker.close()
+        finally:
+            connection = getattr(self, "connection", None)
+            if connection is not None and hasattr(connection, "close"):
+                connection.close()
 
     def _check_servers(self):
         """Check the servers variable and convert in a valid tuple form"""
@@ -291,7 +379,10 @@ class ES(object):
         if server.scheme in ["http", "https"]:
             self.connection = http_connect(
                 filter(lambda server: server.scheme in ["http", "https"], self.servers),
-                timeout=self.timeout, basic_auth=self.basic_auth, max_retries=self.max_retries)
+                timeout=self.timeout, basic_auth=self.basic_auth, max_retries=self.max_retries,
+                pool_maxsize=self.pool_maxsize, selector=self.selector,
+                on_node_failure=self.sniffer.node_failed if self.sniffer else None,
+                compression=self.compression, compression_threshold=self.compression_threshold)
             return
         elif server.scheme == "thrift":
             self.connection = thrift_connect(
@@ -302,15 +393,24 @@ class ES(object):
         """
         Find other servers asking nodes to given server
         """
-        data = self.cluster_nodes()
-        self.cluster_name = data["cluster_name"]
-        for _, nodedata in data["nodes"].items():
-            server = nodedata['http_address'].replace("]", "").replace("inet[", "http:/")
-            if server not in self.servers:
-                self.servers.append(server)
-        self._init_connection()
+        Sniffer(weakref.proxy(self)).sniff()
         return self.servers
 
+    def _set_http_servers(self, urls):
+        """
+        Replace the http servers with the given urls, keeping the pooled
+        connections of the known ones.
+
+        :return: the (added, removed) urls
+        """
+        servers = [server for server in self.servers if server.scheme not in ["http", "https"]]
+        servers.extend(urlparse(url) for url in sorted(set(urls)))
+        self.servers = servers
+        if hasattr(self.connection, "update_servers"):
+            return self.connection.update_servers(urls)
+        self._init_connection()
+        return [], []
+
     def _get_bulk_size(self):
         """
         Get the current bulk_size
@@ -330,6 +430,25 @@ class ES(object):
 
     bulk_size = property(_get_bulk_size, _set_bulk_size)
 
+    def _get_bulk_bytes(self):
+        """
+        Get the current bulk_bytes
+
+        :return a int: the max size in bytes of a bulk request, None if unlimited
+        """
+        return self._bulk_bytes
+
+    def _set_bulk_bytes(self, bulk_bytes):
+        """
+        Set the bulk bytes
+
+        :param bulk_bytes the max size in bytes of a bulk request, None if unlimited
+        """
+        self._bulk_bytes = bulk_bytes
+        self.bulker.bulk_bytes = bulk_bytes
+
+    bulk_bytes = property(_get_bulk_bytes, _set_bulk_bytes)
+
     def _get_raise_on_bulk_item_failure(self):
         """
         Get the raise_on_bulk_item_failure status
@@ -350,6 +469,132 @@ class ES(object):
     raise_on_bulk_item_failure = property(_get_raise_on_bulk_item_failure, _set_raise_on_bulk_item_failure)
 
     def _send_request(self, method, path, body=None, params=None, headers=None, raw=False):
+        if not self.connection:
+            self._init_connection()
+        if self.instrumentation is not None:
+            return self._send_instrumented_request(method, path, body, params, headers, raw)
+        request = self._prepare_request(method, path, body, params, headers)
+
+        # execute the request
+        response = self._execute(request)
+
+        return self._process_response(method, response, raw)
+
+    def _send_stream_request(self, method, path, body=None, params=None):
+        """
+        Send a search or scroll request and return its response as a
+        streaming.HitStream, whose hits are decoded as they are read. The
+        streamed requests are neither cached nor instrumented.
+        """
+        if not self.connection:
+            self._init_connection()
+        if not hasattr(self.connection, "open"):
+            raise ValueError("The streamed responses need an http connection")
+        request = self._prepare_request(method, path, body, params)
+        connection = self.connection
+        response = connection.open(request)
+        if response.status >= 400:
+            return self._process_response(method, connection.read_response(response))
+
+        def close(complete):
+            if not complete:
+                response.close()
+            response.release_conn()
+
+        convert = None
+        if self.mapping_decoder is not None:
+            convert = self.mapping_decoder.convert_document
+        return HitStream(response.stream(STREAM_CHUNK_SIZE, decode_content=True), self.codec.raw_decode,
+                         close, convert)
+
+    def _execute(self, request, event=None):
+        """
+        Execute a request, through the response cache if any
+        """
+        cache = self.response_cache
+        if cache is None:
+            return self.connection.execute(request, event)
+        if request.method == Method.GET:
+            if not cache.is_cacheable(request):
+                return self.connection.execute(request, event)
+            key = cache.make_key(request)
+            response = cache.get(key)
+            if response is not None:
+                return response
+            if cache.aliases_expired():
+                self._load_cache_aliases(cache)
+            pending = cache.begin(key)
+            try:
+                response = self.connection.execute(request, event)
+                if response.status == 200:
+                    cache.put(key, response, pending)
+            finally:
+                cache.discard(pending)
+            return response
+        if request.method == Method.HEAD:
+            return self.connection.execute(request, event)
+
+        if request.uri == "/_bulk":
+            # every batch names its own indices: no state is shared with the bulker
+            indices = bulk_indices(request.body)
+        else:
+            indices = path_indices(request.uri)
+        try:
+            return self.connection.execute(request, event)
+        finally:
+            if request.uri.startswith("/_aliases"):
+                cache.expire_aliases()
+            cache.invalidate(indices)
+
+    def _load_cache_aliases(self, cache):
+        """
+        Load the aliases of the cluster in the response cache, so that the
+        writes invalidate the entries of the aliases of their indices
+        """
+        request = RestRequest(method=Method.GET, uri="/_aliases", parameters={}, headers={}, body="")
+        try:
+            response = self.connection.execute(request)
+            aliases = self.codec.loads(response.body, wrap=False) if response.status == 200 else {}
+        except Exception, e:
+            logger.warning("Unable to load the aliases of the response cache: %s", e)
+            aliases = {}
+        cache.set_aliases(aliases)
+
+    def _send_instrumented_request(self, method, path, body=None, params=None, headers=None, raw=False):
+        """
+        Send a request measuring it for the instrumentation
+        """
+        event = RequestEvent(method, path)
+        instrumentation = self.instrumentation
+        try:
+            start = time.time()
+            request = self._prepare_request(method, path, body, params, headers)
+            event.body_bytes = body_size(request.body)
+            wire_start = time.time()
+            event.encode_time = wire_start - start
+            instrumentation.request_started(event)
+
+            response = self._execute(request, event)
+            decode_start = time.time()
+            event.wire_time = decode_start - wire_start
+            event.status = response.status
+            try:
+                result = self._process_response(method, response, raw)
+            finally:
+                event.decode_time = time.time() - decode_start
+            if isinstance(result, dict):
+                event.took = result.get("took")
+            return result
+        except Exception, e:
+            event.error = e
+            raise
+        finally:
+            instrumentation.request_finished(event)
+
+    def _prepare_request(self, method, path, body=None, params=None, headers=None):
+        """
+        Build the RestRequest to execute, encoding the body
+        """
         if params is None:
             params = {}
         elif "routing" in params and params["routing"] is None:
@@ -359,13 +604,11 @@ class ES(object):
             headers = {}
         if not path.startswith("/"):
             path = "/" + path
-        if not self.connection:
-            self._init_connection()
         if body:
             if isinstance(body, SettingsBuilder):
                 body = body.as_dict()
             if isinstance(body, dict):
-               body = json.dumps(body, cls=self.encoder)
+               body = self.codec.dumps(body)
         else:
             body = ""
 
@@ -378,31 +621,30 @@ class ES(object):
         if self.dump_curl is not None:
             print >> self.dump_curl, "# [%s]" % datetime.now().isoformat()
             print >> self.dump_curl, self._get_curl_request(request)
-        if self.log_curl:
+        if self.log_curl and logger.isEnabledFor(logging.DEBUG):
             logger.debug(self._get_curl_request(request))
+        return request
 
-        # execute the request
-        response = self.connection.execute(request)
-
+    def _process_response(self, method, response, raw=False):
+        """
+        Decode the response of a request, raising the matching exception on errors
+        """
         if method == "HEAD":
             return response.status == 200
 
         # handle the response
         try:
-            decoded = json.loads(response.body, cls=self.decoder)
+            decoded = self.codec.loads(response.body, wrap=not raw)
         except ValueError:
-            try:
-                decoded = json.loads(response.body, cls=ESJsonDecoder)
-            except ValueError:
-                # The only known place where we get back a body which can't be
-                # parsed as JSON is when no handler is found for a request URI.
-                # In this case, the body is actually a good message to return
-                # in the exception.
-                raise ElasticSearchException(response.body, response.status, response.body)
+            # The only known place where we get back a body which can't be
+            # parsed as JSON is when no handler is found for a request URI.
+            # In this case, the body is actually a good message to return
+            # in the exception.
+            raise ElasticSearchException(response.body, response.status, response.body)
         if response.status != 200:
             raise_if_error(response.status, decoded)
-        if not raw and isinstance(decoded, dict):
-            decoded = DotDict(decoded)
+        if self.mapping_decoder is not None and not raw and isinstance(decoded, dict):
+            self.mapping_decoder.convert_response(decoded)
         return decoded
 
     def _make_path(self, indices, doc_types, *components, **kwargs):
@@ -439,7 +681,7 @@ class ES(object):
         body = request.body
         if body:
             if not isinstance(body, unicode):
-                body = unicode(body, "utf8")
+                body = body.decode("utf8")
             curl_cmd += u" -d '%s'" % body
         return curl_cmd
 
@@ -467,7 +709,8 @@ class ES(object):
         Create a bulker object and return it to allow to manage custom bulk policies
         """
         return  self.bulker_class(self, bulk_size=self.bulk_size,
-                                  raise_on_bulk_item_failure=self.raise_on_bulk_item_failure)
+                                  raise_on_bulk_item_failure=self.raise_on_bulk_item_failure,
+                                  bulk_bytes=self.bulk_bytes)
 
     #---- Indices commands
     @deprecated(deprecation="0.19.1", removal="0.20", alternative="[self].indices.aliases")
@@ -909,16 +1152,20 @@ class ES(object):
         """
         Function helper for fast inserting
 
-        :param header: a string with the bulk header must be ended with a newline
-        :param header: a json document string must be ended with a newline
+        :param header: a string with the bulk header (see ES.bulk_headers), with or without a trailing newline
+        :param document: a json document string, with or without a trailing newline. UTF-8 encoded
+        documents (str, bytearray, buffer) are copied as they are in the bulk payload
         """
-        self.bulker.add(u"%s%s" % (header, document))
+        self.bulker.add_raw(header, document)
         return self.flush_bulk()
 
     def index(self, doc, index, doc_type, id=None, parent=None, force_insert=False,
               op_type=None, bulk=False, version=None, querystring_args=None):
         """
         Index a typed JSON document into a specific index and make it searchable.
+
+        In bulk mode, a document already encoded as UTF-8 JSON (str, bytearray,
+        buffer) is copied as it is in the bulk payload.
         """
         if querystring_args is None:
             querystring_args = {}
@@ -928,22 +1175,13 @@ class ES(object):
                 op_type = "index"
             if force_insert:
                 op_type = "create"
-            cmd = {op_type: {"_index": index, "_type": doc_type}}
-            if parent:
-                cmd[op_type]['_parent'] = parent
-            if version:
-                cmd[op_type]['_version'] = version
-            if 'routing' in querystring_args:
-                cmd[op_type]['_routing'] = querystring_args['routing']
-            if 'percolate' in querystring_args:
-                cmd[op_type]['percolate'] = querystring_args['percolate']
-            if id is not None:  #None to support 0 as id
-                cmd[op_type]['_id'] = id
-
+            header = self.bulk_headers.header(op_type, index, doc_type, id,
+                                              parent=parent or None, version=version or None,
+                                              routing=querystring_args.get('routing'),
+                                              percolate=querystring_args.get('percolate'))
             if isinstance(doc, dict):
-                doc = json.dumps(doc, cls=self.encoder)
-            command = "%s\n%s" % (json.dumps(cmd, cls=self.encoder), doc)
-            self.bulker.add(command)
+                doc = self.codec.dumps(doc)
+            self.bulker.add_raw(header, doc)
             return self.flush_bulk()
 
         if force_insert:
@@ -1053,9 +1291,9 @@ class ES(object):
         If bulk is True, the delete operation is put in bulk mode.
         """
         if bulk:
-            cmd = {"delete": {"_index": index, "_type": doc_type,
-                              "_id": id}}
-            self.bulker.add(json.dumps(cmd, cls=self.encoder))
+            self.bulker.add_raw(self.bulk_headers.header("delete", index, doc_type, id,
+                                                         parent=query_params.get("parent"),
+                                                         routing=query_params.get("routing")))
             return self.flush_bulk()
 
         path = make_path(index, doc_type, id)
@@ -1109,17 +1347,94 @@ class ES(object):
             obj.force_vertex()
         return obj
 
-    def mget(self, ids, index=None, doc_type=None, **query_params):
+    def mget(self, ids, index=None, doc_type=None, chunk_size=None, workers=1, missing="include",
+             **query_params):
         """
         Get multi JSON documents.
 
         ids can be:
             list of tuple: (index, type, id)
             list of ids: index and doc_type are required
+
+        :param chunk_size: if set, the documents are fetched in requests of
+        at most chunk_size documents
+        :param workers: the number of requests sent in parallel
+        :param missing: what to do with the documents which don't exist:
+        "include" them (as models with exists False), "skip" them or "raise" a
+        NotFoundException whose result is the list of their (index, type, id)
+
+        The documents are returned in the order of the ids.
         """
         if not ids:
             return []
 
+        if chunk_size is None and missing == "include":
+            body = self._build_mget_docs(ids, index, doc_type)
+            results = self._send_request('GET', "/_mget", body={'docs': body},
+                                         params=query_params)
+            if 'docs' in results:
+                model = self.model
+                return [model(self, item) for item in results['docs']]
+            return []
+
+        docs = []
+        not_found = []
+        for chunk in self._iter_mget_chunks(ids, index, doc_type, chunk_size, workers, query_params):
+            kept, missing_docs = _split_missing(chunk, missing)
+            docs.extend(kept)
+            not_found.extend(missing_docs)
+        if not_found and missing == "raise":
+            raise NotFoundException("%d documents not found" % len(not_found), result=not_found)
+        model = self.model
+        return [model(self, doc) for doc in docs]
+
+    def iter_mget(self, ids, index=None, doc_type=None, chunk_size=1000, workers=1, missing="include",
+                  **query_params):
+        """
+        Get multi JSON documents in requests of chunk_size documents (see
+        mget), yielding the models as every request returns, in the order of
+        the ids. With workers > 1, up to workers requests are sent in
+        parallel.
+
+        If missing is "raise", the NotFoundException is raised by the chunk
+        holding the missing documents, after the documents of the previous
+        chunks are yielded.
+        """
+        model = self.model
+        for chunk in self._iter_mget_chunks(ids, index, doc_type, chunk_size, workers, query_params):
+            docs, not_found = _split_missing(chunk, missing)
+            for doc in docs:
+                yield model(self, doc)
+            if not_found and missing == "raise":
+                raise NotFoundException("%d documents not found" % len(not_found), result=not_found)
+
+    def _iter_mget_chunks(self, ids, index, doc_type, chunk_size, workers, query_params):
+        """
+        Yield the docs of the mget requests of the ids, in order
+        """
+        if not ids:
+            return
+        body = self._build_mget_docs(ids, index, doc_type)
+        chunk_size = chunk_size or len(body)
+        chunks = (body[pos:pos + chunk_size] for pos in xrange(0, len(body), chunk_size))
+
+        def fetch(chunk):
+            results = self._send_request('GET', "/_mget", body={'docs': chunk},
+                                         params=dict(query_params))
+            return results.get('docs', [])
+
+        if workers > 1:
+            fetcher = OrderedFetcher(fetch, chunks, workers=workers)
+            for docs in fetcher:
+                yield docs
+        else:
+            for chunk in chunks:
+                yield fetch(chunk)
+
+    def _build_mget_docs(self, ids, index=None, doc_type=None):
+        """
+        Build the docs of a mget request
+        """
         body = []
         for value in ids:
             if isinstance(value, tuple):
@@ -1143,35 +1458,42 @@ class ES(object):
                 body.append({"_index": index,
                              "_type": doc_type,
                              "_id": value})
+        return body
 
-        results = self._send_request('GET', "/_mget", body={'docs': body},
-                                     params=query_params)
-        if 'docs' in results:
-            model = self.model
-            return [model(self, item) for item in results['docs']]
-        return []
-
-    def search_raw(self, query, indices=None, doc_types=None, **query_params):
+    def search_raw(self, query, indices=None, doc_types=None, stream=False, **query_params):
         """Execute a search against one or more indices to get the search hits.
 
         `query` must be a Search object, a Query object, or a custom
         dictionary of search parameters using the query DSL to be passed
         directly.
+
+        :param stream: if truthy, return a streaming.HitStream decoding the
+        hits one at a time as the response is read (http only)
         """
-        if isinstance(query, Query):
-            query = query.search()
-        if isinstance(query, Search):
-            query = query.serialize()
-        body = self._encode_query(query)
+        if isinstance(query, BoundTemplate):
+            body = query.encode(self.codec)
+        elif self.query_cache is not None and isinstance(query, (Query, Search)):
+            body = self.query_cache.encode(query, self._encode_search, "search")
+        else:
+            body = self._encode_search(query)
         path = self._make_path(indices, doc_types, "_search")
+        if stream:
+            return self._send_stream_request('GET', path, body, params=query_params)
         return self._send_request('GET', path, body, params=query_params)
 
-    def search(self, query, indices=None, doc_types=None, model=None, scan=False, **query_params):
+    def search(self, query, indices=None, doc_types=None, model=None, scan=False, prefetch=0,
+               stream=False, **query_params):
         """Execute a search against one or more indices to get the resultset.
 
         `query` must be a Search object, a Query object, or a custom
         dictionary of search parameters using the query DSL to be passed
         directly.
+
+        :param prefetch: if set, while iterating over the resultset up to
+        `prefetch` next pages are fetched in a background thread.
+        :param stream: if truthy, iterating over the resultset decodes the
+        hits one at a time as the responses are read, without keeping the
+        pages (see ResultSet).
         """
         if isinstance(query, Search):
             search = query
@@ -1185,7 +1507,131 @@ class ES(object):
             query_params.setdefault("scroll", "10m")
 
         return ResultSet(self, search, indices=indices, doc_types=doc_types,
-                         model=model, query_params=query_params)
+                         model=model, query_params=query_params, prefetch=prefetch, stream=stream)
+
+    def multi_search(self, searches, model=None, raise_on_error=True):
+        """Execute several searches in a single _msearch request.
+
+        Every item of `searches` is a Search object, a Query object, a dict
+        (as in search()) or a tuple (query, indices, doc_types) or
+        (query, indices, doc_types, query_params). Only the search_type,
+        preference and routing parameters are sent with the _msearch request,
+        the others are used to fetch the next pages.
+
+        Returns a list of ResultSet, in the order of the searches, holding
+        their first page. If raise_on_error is False, a failed search is
+        returned as its exception instead of raising it.
+        """
+        if not searches:
+            return []
+        result_sets = []
+        lines = []
+        for item in searches:
+            query, indices, doc_types, query_params = _split_msearch_item(item)
+            result_set = self.search(query, indices=indices, doc_types=doc_types, model=model,
+                                     **query_params)
+            result_sets.append(result_set)
+            body = result_set.search.serialize()
+            body["from"] = result_set.start
+            body["size"] = result_set.chuck_size
+            lines.extend(self._msearch_lines(indices, doc_types, query_params, body))
+        lines.append("")
+
+        results = self._send_request("GET", "/_msearch", "\n".join(lines))
+        responses = self._msearch_responses(results, len(result_sets), raise_on_error)
+        for pos, (result_set, response) in enumerate(zip(result_sets, responses)):
+            if isinstance(response, Exception):
+                result_sets[pos] = response
+                continue
+            result_set._results = response
+            result_set._process_results()
+        return result_sets
+
+    def _msearch_lines(self, indices, doc_types, query_params, body):
+        """
+        Return the header and body lines of a search of a _msearch request
+        """
+        header = {"index": ",".join(self._validate_indices(indices))}
+        if doc_types is None:
+            doc_types = self.default_types
+        if doc_types:
+            header["type"] = doc_types if isinstance(doc_types, basestring) else ",".join(doc_types)
+        for name in ("search_type", "preference", "routing"):
+            if query_params.get(name) is not None:
+                header[name] = query_params[name]
+        return [self.codec.dumps(header), self.codec.dumps(body)]
+
+    def _msearch_responses(self, results, count, raise_on_error):
+        """
+        Return the responses of a _msearch request, a failed search being
+        replaced by its exception (or raised if raise_on_error)
+        """
+        responses = results["responses"]
+        if len(responses) != count:
+            raise ElasticSearchException("The _msearch request returned %d responses for %d searches" %
+                                         (len(responses), count), result=results)
+        responses = list(responses)
+        for pos, response in enumerate(responses):
+            if "error" in response:
+                try:
+                    raise_if_error(500, response)
+                except ElasticSearchException, e:
+                    if raise_on_error:
+                        raise
+                    responses[pos] = e
+        return responses
+
+    def parallel_scan(self, query, indices=None, doc_types=None, slices=None, workers=4,
+                      prefetch=4, scroll="10m", model=None, **query_params):
+        """Scan a search with several concurrent scroll contexts and iterate over the hits.
+
+        `query` must be a Search object, a Query object, or a custom
+        dictionary of search parameters using the query DSL to be passed
+        directly.
+
+        :param slices: a list of ScanSlice or Filter objects, every one opening its
+        own scroll context. If None, a slice is opened for every shard of the indices.
+        :param workers: the number of threads draining the slices
+        :param prefetch: the max number of pages fetched ahead of the consumer
+
+        Returns a ParallelScan, an iterable over the hits.
+        """
+        if isinstance(query, Search):
+            search = query
+        elif isinstance(query, (Query, dict)):
+            search = Search(query)
+        else:
+            raise InvalidQuery("parallel_scan() must be supplied with a Search or Query object, or a dict")
+
+        return ParallelScan(self, search, indices=indices, doc_types=doc_types, slices=slices,
+                            workers=workers, prefetch=prefetch, scroll=scroll, model=model,
+                            query_params=query_params)
+
+    def resumable_scan(self, query, checkpoint, indices=None, doc_types=None, sort_field="_uid", size=100,
+                       scroll="10m", checkpoint_interval=5.0, model=None, **query_params):
+        """Scroll a search sorted on `sort_field`, saving its state to the file `checkpoint`.
+
+        `query` must be a Search object, a Query object, or a custom
+        dictionary of search parameters using the query DSL to be passed
+        directly.
+
+        :param checkpoint: the path of the JSON state file. If the file holds the state of
+        an interrupted scan of the same search, the scan resumes after the last hit saved.
+        :param sort_field: the field sorting the hits (then _uid), whose values bound the resumed scroll
+        :param checkpoint_interval: the seconds between the saves of the state
+
+        Returns a ResumableScan, an iterable over the hits.
+        """
+        if isinstance(query, Search):
+            search = query
+        elif isinstance(query, (Query, dict)):
+            search = Search(query)
+        else:
+            raise InvalidQuery("resumable_scan() must be supplied with a Search or Query object, or a dict")
+
+        return ResumableScan(self, search, checkpoint, indices=indices, doc_types=doc_types,
+                             sort_field=sort_field, size=size, scroll=scroll,
+                             checkpoint_interval=checkpoint_interval, model=model, query_params=query_params)
 
     #    scan method is no longer working due to change in ES.search behavior.  May no longer warrant its own method.
     #    def scan(self, query, indices=None, doc_types=None, scroll="10m", **query_params):
@@ -1205,10 +1651,14 @@ class ES(object):
     #                break
     #            yield results
 
-    def search_scroll(self, scroll_id, scroll="10m"):
+    def search_scroll(self, scroll_id, scroll="10m", stream=False):
         """
         Executes a scrolling given an scroll_id
+
+        If stream is truthy, return a streaming.HitStream (see search_raw).
         """
+        if stream:
+            return self._send_stream_request('GET', "_search/scroll", scroll_id, {"scroll": scroll})
         return self._send_request('GET', "_search/scroll", scroll_id, {"scroll": scroll})
 
     def reindex(self, query, indices=None, doc_types=None, **query_params):
@@ -1216,6 +1666,7 @@ class ES(object):
         Execute a search query against one or more indices and and reindex the hits.
         query must be a dictionary or a Query object that will convert to Query DSL.
         Note: reindex is only available in my ElasticSearch branch on github.
+        See reindex.Reindexer for a client side reindex.
         """
         path = self._make_path(indices, doc_types, "_reindexbyquery")
         if isinstance(query, dict) and "query" in query:
@@ -1310,7 +1761,7 @@ class ES(object):
             query.update(kwargs)
 
         path = make_path('_percolator', index, name)
-        body = json.dumps(query, cls=self.encoder)
+        body = self.codec.dumps(query)
         return self._send_request('PUT', path, body)
 
     def delete_percolator(self, index, name):
@@ -1334,27 +1785,50 @@ class ES(object):
         """
         Serialize to json a serializable object (Search, Query, Filter, etc).
         """
-        return json.dumps(serializable.serialize(), cls=self.encoder)
+        if self.query_cache is not None:
+            return self.query_cache.encode(serializable, self._encode_serializable, "serialize")
+        return self._encode_serializable(serializable)
 
-    def _encode_query(self, query):
+    def _encode_serializable(self, serializable):
+        return self.codec.dumps(serializable.serialize())
+
+    def _encode_search(self, query):
         if isinstance(query, Query):
+            query = query.search()
+        if isinstance(query, Search):
             query = query.serialize()
+        return self._encode_query(query)
+
+    def _encode_query(self, query):
+        if isinstance(query, BoundTemplate):
+            return query.encode(self.codec, search=False)
+        if isinstance(query, Query):
+            return self.encode_json(query)
         if isinstance(query, dict):
-            return json.dumps(query, cls=self.encoder)
+            return self.codec.dumps(query)
 
         raise InvalidQuery("`query` must be Query or dict instance, not %s"
                            % query.__class__)
 
 
 class ResultSet(object):
+    _prefetcher = None
+    _streamed_hits = None
+    _first_stream = None
 
     def __init__(self, connection, search, indices=None, doc_types=None, query_params=None,
-                 auto_fix_keys=False, auto_clean_highlight=False, model=None):
+                 auto_fix_keys=False, auto_clean_highlight=False, model=None, prefetch=0,
+                 stream=False):
         """
         results: an es query results dict
         fix_keys: remove the "_" from every key, useful for django views
         clean_highlight: removed empty highlight
         search: a Search object.
+        prefetch: the number of pages to fetch in background while iterating.
+        stream: if truthy, the iteration decodes the hits one at a time as
+        the responses are read (see ES.search_raw), so that a page is never
+        held in memory. The total is read from the first response, the
+        facets once its hits are iterated.
         """
         if not isinstance(search, Search):
             raise InvalidQuery("ResultSet must be supplied with a Search object")
@@ -1374,6 +1848,8 @@ class ResultSet(object):
         self._hits = []
         self.auto_fix_keys = auto_fix_keys
         self.auto_clean_highlight = auto_clean_highlight
+        self.prefetch = prefetch
+        self.stream = stream
 
         self.iterpos = 0  #keep track of iterator position
         self.start = query_params.get("start", search.start) or 0
@@ -1413,19 +1889,166 @@ class ResultSet(object):
                 self._results['hits']['hits'] = []
 
         if process_post_query:
-            self._facets = self._results.get('facets', {})
-            if 'hits' in self._results:
-                self.valid = True
-                self._hits = self._results['hits']['hits']
-            else:
-                self._hits = []
-            if self.auto_fix_keys:
-                self._fix_keys()
-            if self.auto_clean_highlight:
-                self.clean_highlight()
+            self._process_results()
+
+    def _process_results(self):
+        self._facets = self._results.get('facets', {})
+        if 'hits' in self._results:
+            self.valid = True
+            self._hits = self._results['hits']['hits']
+        else:
+            self._hits = []
+        if self.auto_fix_keys:
+            self._fix_keys()
+        if self.auto_clean_highlight:
+            self.clean_highlight()
+
+    def _load_next_page(self):
+        """
+        Load the page following the current one
+        """
+        if not self.prefetch:
+            self._do_search(auto_increment=True)
+            return
+
+        if self._prefetcher is None:
+            self._start_prefetch()
+        results = self._prefetcher.get()
+        self.iterpos = 0
+        if results is None:
+            self._hits = []
+            return
+        if self.scroller_id is None:
+            self.start += self.chuck_size
+        else:
+            self.scroller_id = results['_scroll_id']
+        self._results = results
+        self._process_results()
+
+    def _start_prefetch(self):
+        """
+        Start fetching the pages following the current one in background.
+
+        The fetch does not reference the resultset, so an abandoned resultset
+        can be collected (and its prefetch closed).
+        """
+        connection = self.connection
+        if self.scroller_id is not None:
+            scroll = self.scroller_parameters.get("scroll", "10m")
+            state = {"scroll_id": self.scroller_id}
+
+            def fetch_page():
+                try:
+                    results = connection.search_scroll(state["scroll_id"], scroll)
+                except ReduceSearchPhaseException:
+                    return None
+                state["scroll_id"] = results["_scroll_id"]
+                return results
+        else:
+            search, indices, doc_types = self.search, self.indices, self.doc_types
+            query_params = dict(self.query_params)
+            size = self.chuck_size
+            limit = self.total
+            if self._max_item is not None:
+                # the items of the previous pages are already consumed
+                limit = min(limit, self.start + self._max_item - (self._current_item - self.iterpos))
+            state = {"start": self.start + size}
+
+            def fetch_page():
+                if state["start"] >= limit:
+                    return None
+                query_params["from"] = state["start"]
+                query_params["size"] = size
+                state["start"] += size
+                return connection.search_raw(search, indices=indices, doc_types=doc_types,
+                                             **query_params)
+
+        self._prefetcher = PagePrefetcher(fetch_page, self.prefetch)
+
+    def close(self):
+        """
+        Stop fetching the next pages in background, if prefetching, and the
+        streamed response being read, if streaming
+        """
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+        if self._streamed_hits is not None:
+            self._streamed_hits.close()
+            self._streamed_hits = None
+        if self._first_stream is not None:
+            self._first_stream.close()
+            self._first_stream = None
+
+    def _open_first_stream(self):
+        if self._first_stream is None:
+            self._first_stream = self._search_raw(self.start, self.chuck_size, stream=True)
+            self._total = self._first_stream.total
+        return self._first_stream
+
+    def _iter_streamed(self):
+        """
+        Return a generator of the hits of the pages, decoded as the responses
+        are read.
+
+        The generator does not reference the resultset, so an abandoned
+        resultset can be collected (and its response closed).
+        """
+        stream = self._open_first_stream()
+        self._first_stream = None
+        connection = self.connection
+        search, indices, doc_types = self.search, self.indices, self.doc_types
+        query_params = dict(self.query_params)
+        scroll = query_params.get("scroll")
+        size = self.chuck_size
+        total = self._total
+        resultset_ref = weakref.ref(self)
+
+        def iter_hits(stream, start):
+            first = True
+            try:
+                while True:
+                    count = 0
+                    for hit in stream:
+                        count += 1
+                        yield hit
+                    if first:
+                        resultset = resultset_ref()
+                        if resultset is not None:
+                            resultset._facets = stream.facets
+                    stream.close()
+                    scroll_id = stream.scroll_id
+                    if scroll_id is not None:
+                        # the first page of a scan has no hits
+                        if not count and not first:
+                            return
+                        try:
+                            stream = connection.search_scroll(scroll_id, scroll or "10m", stream=True)
+                        except ReduceSearchPhaseException:
+                            return
+                    else:
+                        start += count
+                        if count < size or start >= total:
+                            return
+                        query_params["from"] = start
+                        query_params["size"] = size
+                        stream = connection.search_raw(search, indices=indices, doc_types=doc_types,
+                                                       stream=True, **query_params)
+                    first = False
+            finally:
+                stream.close()
+
+        return iter_hits(stream, self.start)
+
+    def __del__(self):
+        self.close()
 
     @property
     def total(self):
+        if self.stream and self._results is None:
+            if self._total is None:
+                self._open_first_stream()
+            return self._total
         if self._results is None:
             self._do_search()
         if self._total is None:
@@ -1436,6 +2059,8 @@ class ResultSet(object):
 
     @property
     def facets(self):
+        if self.stream and self._results is None:
+            return self._facets
         if self._results is None:
             self._do_search()
         return self._facets
@@ -1542,8 +2167,24 @@ class ResultSet(object):
         return [model(self.connection, hit) for hit in hits]
 
     def next(self):
+        return self.model(self.connection, self._next_hit())
+
+    def _next_hit(self):
+        """
+        Return the next raw hit of the iteration
+        """
         if self._max_item is not None and self._current_item == self._max_item:
+            self.close()
             raise StopIteration
+        if self.stream:
+            if self._streamed_hits is None:
+                self._streamed_hits = self._iter_streamed()
+            hit = next(self._streamed_hits, None)
+            if hit is None:
+                self.close()
+                raise StopIteration
+            self._current_item += 1
+            return hit
         if self._results is None:
             self._do_search()
         if "_scroll_id" in self._results and self._total != 0 and self._current_item == 0 and len(
@@ -1551,32 +2192,63 @@ class ResultSet(object):
             self._do_search()
         if len(self.hits) == 0:
             raise StopIteration
+        if self.prefetch and self._prefetcher is None:
+            self._start_prefetch()
         if self.iterpos < len(self.hits):
             res = self.hits[self.iterpos]
             self.iterpos += 1
             self._current_item += 1
-            return self.model(self.connection, res)
+            return res
 
         if self.start + self.iterpos == self.total:
+            self.close()
             raise StopIteration
-        self._do_search(auto_increment=True)
+        self._load_next_page()
         self.iterpos = 0
         if len(self.hits) == 0:
+            self.close()
             raise StopIteration
         res = self.hits[self.iterpos]
         self.iterpos += 1
         self._current_item += 1
-        return self.model(self.connection, res)
+        return res
 
     def __iter__(self):
         self.iterpos = 0
         if self._current_item != 0:
+            self.close()
             self._results = None
         self._current_item = 0
 
         return self
 
-    def _search_raw(self, start=None, size=None):
+    def export_columns(self, fields, dtypes=None, use_numpy=None, chunk_size=4096):
+        """
+        Iterate over the hits and return their fields in arrays, as a
+        columnar.Columns, without building the models of the hits.
+
+        `fields` are dotted paths in the _source, requested fields or the
+        _id/_type/_index/_score/_version of the hits, `dtypes` their NumPy
+        dtypes (array.array ones without NumPy), see columnar.ColumnBuilder.
+        The missing values are reported by the masks of the Columns.
+        """
+        size_hint = self.total
+        if self._max_item is not None:
+            size_hint = min(size_hint, self._max_item)
+        builder = ColumnBuilder(fields, dtypes, size_hint=size_hint, use_numpy=use_numpy,
+                                chunk_size=chunk_size)
+        self.__iter__()
+        add = builder.add
+        next_hit = self._next_hit
+        while True:
+            try:
+                hit = next_hit()
+            except StopIteration:
+                break
+            add(hit)
+        return builder.finish()
+
+    def _search_raw(self, start=None, size=None, stream=False):
         if start is None and size is None:
             query_params = self.query_params
         else:
@@ -1587,4 +2259,4 @@ class ResultSet(object):
                 query_params["size"] = size
 
         return self.connection.search_raw(self.search, indices=self.indices,
-                                          doc_types=self.doc_types, **query_params)
+                                          doc_types=self.doc_types, stream=stream, **query_params)
@@ -147,11 +147,18 @@ class TypeMissingException(ElasticSearchException):
 
 
 class BulkOperationException(ElasticSearchException, EqualityComparableUsingAttributeDictionary):
-    def __init__(self, errors, bulk_result):
+    """
+    ``errors`` are the failed items of the bulk response, ``failures`` their
+    models.BulkItemFailure, holding their position and the action sent, when
+    known.
+    """
+
+    def __init__(self, errors, bulk_result, failures=None):
         super(BulkOperationException, self).__init__(
             u"At least one operation in the bulk request has failed: %s" % errors)
         self.errors = errors
         self.bulk_result = bulk_result
+        self.failures = failures
 
 
 class ElasticModelException(Exception):
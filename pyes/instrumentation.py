@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import bisect
+import threading
+
+__all__ = ["RequestEvent", "Instrumentation", "MemoryCollector", "endpoint_name"]
+
+#the upper bounds in milliseconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float("inf"))
+
+
+def endpoint_name(method, path):
+    """
+    Return the endpoint of a request, i.e. "GET _search" for
+    "GET /test-index/test-type/_search", "PUT <document>" for
+    "PUT /test-index/test-type/1"
+    """
+    parts = [part for part in path.split("/") if part]
+    for pos, part in enumerate(parts):
+        if part.startswith("_"):
+            return "%s %s" % (method, "/".join(parts[pos:pos + 2]))
+    return "%s %s" % (method, ("/", "<index>", "<type>", "<document>")[min(len(parts), 3)])
+
+
+def body_size(body):
+    """
+    Return the size in bytes of a request body, UTF-8 encoded if unicode
+    """
+    if isinstance(body, unicode):
+        return len(body.encode("utf-8"))
+    return len(body)
+
+
+def compression_ratio(size, wire_size):
+    """
+    Return size / wire_size, 1.0 if nothing went on the wire
+    """
+    if not wire_size:
+        return 1.0
+    return float(size) / wire_size
+
+
+class RequestEvent(object):
+    """
+    The measures of a request to ES. The times are in seconds:
+
+    - encode_time: building the request, with the encoding of the body
+    - wire_time: sending the request and reading the response
+    - decode_time: decoding the response and checking the errors
+
+    ``server`` is the url of the server which answered (http only),
+    ``retries`` the number of failed attempts before, ``took`` the time in
+    milliseconds reported by ES and ``error`` the exception raised, if any.
+
+    ``body_bytes`` is the size of the request body, ``sent_bytes`` its size
+    on the wire, ``response_bytes`` the size of the response body and
+    ``received_bytes`` its size on the wire: they differ when the http
+    connection compresses the requests and accepts compressed responses
+    (http only).
+    """
+    __slots__ = ("method", "path", "endpoint", "body_bytes", "sent_bytes", "response_bytes",
+                 "received_bytes", "server", "retries", "status", "encode_time", "wire_time",
+                 "decode_time", "took", "error")
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint_name(method, path)
+        self.body_bytes = 0
+        self.sent_bytes = 0
+        self.response_bytes = 0
+        self.received_bytes = 0
+        self.server = None
+        self.retries = 0
+        self.status = None
+        self.encode_time = 0.0
+        self.wire_time = 0.0
+        self.decode_time = 0.0
+        self.took = None
+        self.error = None
+
+    @property
+    def total_time(self):
+        return self.encode_time + self.wire_time + self.decode_time
+
+    @property
+    def request_compression_ratio(self):
+        """The size of the request body divided by its size on the wire"""
+        return compression_ratio(self.body_bytes, self.sent_bytes)
+
+    @property
+    def response_compression_ratio(self):
+        """The size of the response body divided by its size on the wire"""
+        return compression_ratio(self.response_bytes, self.received_bytes)
+
+    def __repr__(self):
+        return "<RequestEvent %s %s status=%s total=%.3fms>" % (self.method, self.path, self.status,
+                                                                 self.total_time * 1000)
+
+
+class Instrumentation(object):
+    """
+    The hooks called around every request by an ES object with this
+    instrumentation (ES(instrumentation=...)).
+    """
+
+    def request_started(self, event):
+        """
+        Called when the request is encoded, before sending it
+        """
+        pass
+
+    def request_finished(self, event):
+        """
+        Called after the response is decoded, or the request failed
+        """
+        pass
+
+
+class EndpointStats(object):
+    """
+    The aggregated measures of the requests of an endpoint
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.body_bytes = 0
+        self.sent_bytes = 0
+        self.response_bytes = 0
+        self.received_bytes = 0
+        self.encode_time = 0.0
+        self.wire_time = 0.0
+        self.decode_time = 0.0
+        self.took = 0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, event):
+        self.count += 1
+        if event.error is not None:
+            self.errors += 1
+        self.retries += event.retries
+        self.body_bytes += event.body_bytes
+        self.sent_bytes += event.sent_bytes
+        self.response_bytes += event.response_bytes
+        self.received_bytes += event.received_bytes
+        self.encode_time += event.encode_time
+        self.wire_time += event.wire_time
+        self.decode_time += event.decode_time
+        self.took += event.took or 0
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, event.total_time * 1000)] += 1
+
+    def percentile(self, percent):
+        """
+        Return the upper bound in milliseconds of the bucket of the latency
+        histogram holding the given percentile
+        """
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+    def as_dict(self):
+        count = self.count or 1
+        return {"count": self.count,
+                "errors": self.errors,
+                "retries": self.retries,
+                "body_bytes": self.body_bytes,
+                "sent_bytes": self.sent_bytes,
+                "response_bytes": self.response_bytes,
+                "received_bytes": self.received_bytes,
+                "request_compression_ratio": compression_ratio(self.body_bytes, self.sent_bytes),
+                "response_compression_ratio": compression_ratio(self.response_bytes, self.received_bytes),
+                "avg_encode_ms": self.encode_time * 1000 / count,
+                "avg_wire_ms": self.wire_time * 1000 / count,
+                "avg_decode_ms": self.decode_time * 1000 / count,
+                "avg_took_ms": float(self.took) / count,
+                "p50_ms": self.percentile(50),
+                "p99_ms": self.percentile(99),
+                "histogram": zip(LATENCY_BUCKETS, self.histogram)}
+
+
+class MemoryCollector(Instrumentation):
+    """
+    An instrumentation aggregating the requests by endpoint (see
+    endpoint_name) in memory.
+
+    Example:
+
+        collector = MemoryCollector()
+        conn = ES("127.0.0.1:9200", instrumentation=collector)
+        ...
+        print collector.stats()["GET _search"]["p99_ms"]
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def request_finished(self, event):
+        with self._lock:
+            stats = self.endpoints.get(event.endpoint)
+            if stats is None:
+                stats = self.endpoints[event.endpoint] = EndpointStats()
+            stats.add(event)
+
+    def stats(self):
+        """
+        Return the measures of every endpoint as dicts
+        """
+        with self._lock:
+            return dict((endpoint, stats.as_dict()) for endpoint, stats in self.endpoints.items())
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from datetime import date, datetime
+from decimal import Decimal
+import re
+import time
+try:
+    import simplejson as json
+except ImportError:
+    import json
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from .models import DotDict, _wrap
+
+__all__ = ["JSONCodec", "ESJsonEncoder", "ESJsonDecoder", "string_to_datetime", "JSON_ENGINES"]
+
+_DATETIME_RE = re.compile(r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d$")
+
+
+def string_to_datetime(value):
+    """
+    Decode a "%Y-%m-%dT%H:%M:%S" string to a datetime object, return other
+    values unchanged
+    """
+    if isinstance(value, basestring) and len(value) == 19 and _DATETIME_RE.match(value):
+        try:
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                            int(value[11:13]), int(value[14:16]), int(value[17:19]))
+        except ValueError:
+            pass
+    return value
+
+
+def _decode_datetimes(d):
+    for k, v in d.iteritems():
+        if isinstance(v, basestring):
+            if len(v) == 19:
+                d[k] = string_to_datetime(v)
+        elif isinstance(v, list):
+            d[k] = [string_to_datetime(elem) for elem in v]
+    return d
+
+
+class ESJsonEncoder(json.JSONEncoder):
+    def default(self, value):
+        """Convert rogue and mysterious data types.
+        Conversion notes:
+
+        - ``datetime.date`` and ``datetime.datetime`` objects are
+        converted into datetime strings.
+        """
+
+        if isinstance(value, datetime):
+            return value.isoformat()
+        elif isinstance(value, date):
+            dt = datetime(value.year, value.month, value.day, 0, 0, 0)
+            return dt.isoformat()
+        elif isinstance(value, Decimal):
+            return float(str(value))
+        elif isinstance(value, set):
+            return list(value)
+        # raise TypeError
+        return super(ESJsonEncoder, self).default(value)
+
+
+class ESJsonDecoder(json.JSONDecoder):
+    def __init__(self, *args, **kwargs):
+        kwargs['object_hook'] = self.dict_to_object
+        super(ESJsonDecoder, self).__init__(*args, **kwargs)
+
+    def string_to_datetime(self, obj):
+        """
+        Decode a datetime string to a datetime object
+        """
+        if isinstance(obj, basestring) and len(obj) == 19:
+            try:
+                return datetime(*time.strptime(obj, "%Y-%m-%dT%H:%M:%S")[:6])
+            except ValueError:
+                pass
+        return obj
+
+
+    def dict_to_object(self, d):
+        """
+        Decode datetime value from string to datetime
+        """
+        for k, v in d.items():
+            if isinstance(v, basestring) and len(v) == 19:
+                # Decode a datetime string to a datetime object
+                try:
+                    d[k] = datetime(*time.strptime(v, "%Y-%m-%dT%H:%M:%S")[:6])
+                except ValueError:
+                    pass
+            elif isinstance(v, list):
+                d[k] = [self.string_to_datetime(elem) for elem in v]
+        return DotDict(d)
+
+
+def _json_loads(data, object_hook=None):
+    return json.loads(data, object_hook=object_hook)
+
+
+def _ujson_loads(data, object_hook=None):
+    obj = ujson.loads(data)
+    if object_hook is not None:
+        obj = _apply_hook(obj, object_hook)
+    return obj
+
+
+def _apply_hook(obj, object_hook):
+    """Apply an object_hook bottom up, as the json decoder does"""
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            if isinstance(v, (dict, list)):
+                obj[k] = _apply_hook(v, object_hook)
+        return object_hook(obj)
+    elif isinstance(obj, list):
+        return [_apply_hook(v, object_hook) if isinstance(v, (dict, list)) else v for v in obj]
+    return obj
+
+
+#the available decoding engines, by name
+JSON_ENGINES = {"json": _json_loads}
+if ujson is not None:
+    JSON_ENGINES["ujson"] = _ujson_loads
+
+
+class JSONCodec(object):
+    """
+    Encode the request bodies and decode the response ones.
+
+    :param engine: the name of the decoding engine in JSON_ENGINES: "json"
+    (simplejson if installed, the json module otherwise, the default) or
+    "ujson", faster but opt-in: its float parsing is not exact, so some
+    values may differ from the json module in the last digit.
+    :param decode_datetimes: if truthy, the "%Y-%m-%dT%H:%M:%S" strings are
+    decoded to datetime objects
+    :param encoder: the JSONEncoder class used to encode
+    :param decoder: a JSONDecoder class used to decode, in place of the engine
+    (the decoded dicts are then left as it returns them)
+    """
+
+    def __init__(self, engine=None, decode_datetimes=True, encoder=ESJsonEncoder, decoder=None):
+        if engine is None:
+            engine = "json"
+        if engine not in JSON_ENGINES:
+            raise ValueError("Unknown JSON engine: %r (available: %s)" %
+                             (engine, ", ".join(sorted(JSON_ENGINES))))
+        self.engine = engine
+        self.decode_datetimes = decode_datetimes
+        self.encoder = encoder
+        self.decoder = decoder
+        self._loads = JSON_ENGINES[engine]
+        self._object_hook = _decode_datetimes if decode_datetimes else None
+        self._raw_decoders = {}
+
+    def dumps(self, obj):
+        return json.dumps(obj, cls=self.encoder)
+
+    def loads(self, data, wrap=True):
+        """
+        Decode a response body: the dicts are returned as DotDict if wrap is
+        truthy, as plain dicts (without datetime decoding) otherwise. The
+        DotDict wraps the dicts it holds as they are read (see DotDict).
+        """
+        if self.decoder is not None and wrap:
+            try:
+                return json.loads(data, cls=self.decoder)
+            except ValueError:
+                pass
+        if not wrap:
+            return self._loads(data)
+        return _wrap(self._loads(data, self._object_hook))
+
+    def raw_decode(self, data, idx=0, wrap=True):
+        """
+        Decode the JSON value starting at data[idx], without leading
+        whitespace, as loads does: return the value and the index where it
+        ends. Raise ValueError if no whole value starts there.
+        """
+        decoder = self._raw_decoders.get(wrap)
+        if decoder is None:
+            if self.decoder is not None and wrap:
+                decoder = self.decoder()
+            else:
+                decoder = json.JSONDecoder(object_hook=self._object_hook if wrap else None)
+            self._raw_decoders[wrap] = decoder
+        if not wrap or self.decoder is not None:
+            return decoder.raw_decode(data, idx)
+        value, end = decoder.raw_decode(data, idx)
+        return _wrap(value), end
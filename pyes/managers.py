@@ -394,7 +394,10 @@ class Indices(object):
         else:
             path = self.conn._make_path(indices, (), "_mapping")
 
-        return self.conn._send_request('PUT', path, mapping)
+        result = self.conn._send_request('PUT', path, mapping)
+        if self.conn.mapping_decoder is not None:
+            self.conn.mapping_decoder.clear()
+        return result
 
     def get_mapping(self, doc_type=None, indices=None):
         """
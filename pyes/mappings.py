@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import re
 import threading
 import datetime
 from .exceptions import FieldValidationException
@@ -28,6 +29,66 @@ def to_bool(value):
         elif value=="yes":
             return True
 
+_DATE_RE = re.compile(r"^(\d{4})-(\d\d)-(\d\d)"
+                      r"(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:[.,](\d{1,6})\d*)?)?)?"
+                      r"(Z|[+-]\d\d:?\d\d)?$")
+
+
+def to_datetime(value):
+    """
+    Convert an ISO 8601 date (with an optional time and timezone) or a number
+    of milliseconds since the epoch to a naive UTC datetime. Other values are
+    returned unchanged.
+    """
+    if isinstance(value, basestring):
+        match = _DATE_RE.match(value)
+        if not match:
+            return value
+        year, month, day, hour, minute, second, fraction, tz = match.groups()
+        try:
+            result = datetime.datetime(int(year), int(month), int(day), int(hour or 0),
+                                       int(minute or 0), int(second or 0),
+                                       int(fraction.ljust(6, "0")) if fraction else 0)
+        except ValueError:
+            return value
+        if tz and tz != "Z":
+            offset = datetime.timedelta(hours=int(tz[1:3]), minutes=int(tz[-2:]))
+            result = result - offset if tz[0] == "+" else result + offset
+        return result
+    elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+        return datetime.datetime.utcfromtimestamp(value / 1e3)
+    return value
+
+
+def _to_number(number_type, convert_types=(basestring,)):
+    def convert(value):
+        if isinstance(value, convert_types) and not isinstance(value, bool):
+            try:
+                return number_type(value)
+            except ValueError:
+                pass
+        return value
+    return convert
+
+
+def to_geo_point(value):
+    """
+    Convert a geo point given as "lat,lon", [lon, lat] or {"lat": lat, "lon": lon}
+    to a {"lat": lat, "lon": lon} DotDict. Geohashes are returned unchanged.
+    """
+    try:
+        if isinstance(value, basestring):
+            if "," in value:
+                lat, lon = value.split(",")
+                return DotDict(lat=float(lat), lon=float(lon))
+        elif isinstance(value, (list, tuple)) and len(value) == 2:
+            return DotDict(lat=float(value[1]), lon=float(value[0]))
+        elif isinstance(value, dict) and "lat" in value and "lon" in value:
+            return DotDict(lat=float(value["lat"]), lon=float(value["lon"]))
+    except (TypeError, ValueError):
+        pass
+    return value
+
 check_values = {
     'index': ['no', 'analyzed', 'not_analyzed'],
     'term_vector': ['no', 'yes', 'with_offsets', 'with_positions', 'with_positions_offsets'],
@@ -66,6 +127,13 @@ class ModelField(object):
         if self.name in obj and not obj[self.name]:
             del obj[self.name]
 
+    def get_converter(self):
+        """
+        Return the function converting a value of the field to its python type,
+        or None if the value is kept as decoded
+        """
+        return None
+
 class AbstractField(ModelField):
     def __init__(self, index="not_analyzed", store="no", boost=1.0,
                  term_vector="no", omit_norms=True,
@@ -165,6 +233,9 @@ class GeoPointField(AbstractField):
         self.validate_lon = validate_lon
         self.type = "geo_point"
 
+    def get_converter(self):
+        return to_geo_point
+
     def as_dict(self):
         result = super(GeoPointField, self).as_dict()
         if self.null_value is not None:
@@ -232,30 +303,45 @@ class ShortField(NumericFieldAbstract):
         super(ShortField, self).__init__(*args, **kwargs)
         self.type = "short"
 
+    def get_converter(self):
+        return _to_number(int)
+
 
 class IntegerField(NumericFieldAbstract):
     def __init__(self, *args, **kwargs):
         super(IntegerField, self).__init__(*args, **kwargs)
         self.type = "integer"
 
+    def get_converter(self):
+        return _to_number(int)
+
 
 class LongField(NumericFieldAbstract):
     def __init__(self, *args, **kwargs):
         super(LongField, self).__init__(*args, **kwargs)
         self.type = "long"
 
+    def get_converter(self):
+        return _to_number(long)
+
 
 class FloatField(NumericFieldAbstract):
     def __init__(self, *args, **kwargs):
         super(FloatField, self).__init__(*args, **kwargs)
         self.type = "float"
 
+    def get_converter(self):
+        return _to_number(float, (basestring, int, long))
+
 
 class DoubleField(NumericFieldAbstract):
     def __init__(self, *args, **kwargs):
         super(DoubleField, self).__init__(*args, **kwargs)
         self.type = "double"
 
+    def get_converter(self):
+        return _to_number(float, (basestring, int, long))
+
 
 class DateField(NumericFieldAbstract):
     def __init__(self, format=None, auto_now=False, auto_now_add=False, **kwargs):
@@ -265,6 +351,9 @@ class DateField(NumericFieldAbstract):
         self.auto_now = auto_now
         self.auto_now_add = auto_now_add
 
+    def get_converter(self):
+        return to_datetime
+
     def as_dict(self):
         result = super(DateField, self).as_dict()
         if self.format:
@@ -310,6 +399,13 @@ class MultiField(ModelField):
                 for field in fields:
                     self.fields[field.name] = field.as_dict()
 
+    def get_converter(self):
+        #the value is indexed by the default field, named as the multi field
+        field = self.fields.get(self.name)
+        if isinstance(field, ModelField):
+            return field.get_converter()
+        return None
+
     def as_dict(self):
         result = {"type": self.type,
                   "fields": {}}
@@ -402,6 +498,19 @@ class ObjectField(ModelField):
     def __str__(self):
         return str(self.as_dict())
 
+    def get_converter(self):
+        """
+        Return the converters of the properties as a dict {name: converter},
+        where the converter of an object is a nested dict, or None if no
+        property is converted
+        """
+        converters = {}
+        for name, prop in self.properties.items():
+            converter = prop.get_converter()
+            if converter is not None:
+                converters[name] = converter
+        return converters or None
+
     def save(self):
         if self.connection is None:
             raise RuntimeError("No connection available")
@@ -699,6 +808,126 @@ class Mapper(object):
 
         return self.indices[index][doctype].properties[name]
 
+def _is_lon_lat(value):
+    return len(value) == 2 and all(isinstance(item, (int, long, float)) for item in value)
+
+
+def convert_document(doc, converters):
+    """
+    Convert in place the values of a document (a dict) with a dict of
+    converters as returned by ObjectField.get_converter
+    """
+    for name, converter in converters.iteritems():
+        value = doc.get(name)
+        if value is None:
+            continue
+        if isinstance(converter, dict):
+            if isinstance(value, dict):
+                convert_document(value, converter)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        convert_document(item, converter)
+        elif isinstance(value, list) and not (converter is to_geo_point and _is_lon_lat(value)):
+            doc[name] = [converter(item) for item in value]
+        else:
+            doc[name] = converter(value)
+
+
+def _flatten_converters(converters, prefix=""):
+    """
+    Return the converters by dotted path, as the keys of the "fields" of a hit
+    """
+    result = {}
+    for name, converter in converters.iteritems():
+        if isinstance(converter, dict):
+            result.update(_flatten_converters(converter, prefix + name + "."))
+        else:
+            result[prefix + name] = converter
+    return result
+
+
+class MappingDecoder(object):
+    """
+    Convert the fields of the documents returned by ES to the python types
+    of their mapping: DateField values to datetime, IntegerField ones to int,
+    GeoPointField ones to {"lat": lat, "lon": lon}...
+
+    The converters of every index/doc_type are compiled once from the Mapper
+    of the connection (ES.mappings) or, for the indices missing there (or
+    after clear()), from the mapping read the first time a document of the
+    index is decoded.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._converters = {}
+        self._lock = threading.Lock()
+        self._use_mapper = True
+
+    def clear(self):
+        """
+        Forget the compiled converters (i.e. after a mapping change): the
+        mappings are read again
+        """
+        with self._lock:
+            self._converters = {}
+            self._use_mapper = False
+
+    def get_converters(self, index, doc_type):
+        """
+        Return the (source converters, fields converters) of a doc_type, or None
+        """
+        key = (index, doc_type)
+        try:
+            return self._converters[key]
+        except KeyError:
+            pass
+        doctypes = self._get_doctypes(index)
+        with self._lock:
+            for name, doctype in doctypes.items():
+                converters = doctype.get_converter()
+                if converters:
+                    converters = (converters, _flatten_converters(converters))
+                self._converters[(index, name)] = converters
+            self._converters.setdefault(key, None)
+            return self._converters[key]
+
+    def _get_doctypes(self, index):
+        indices = dict(self.connection.mappings.indices) if self._use_mapper else {}
+        if index not in indices:
+            mapper = Mapper(self.connection.get_mapping(indices=[index]), connection=self.connection,
+                            document_object_field=self.connection.document_object_field)
+            indices = dict(mapper.indices)
+        return dict(indices.get(index, []))
+
+    def convert_document(self, doc):
+        """
+        Convert the _source and the fields of a hit or of a get result
+        """
+        converters = self.get_converters(doc.get("_index"), doc.get("_type"))
+        if not converters:
+            return
+        source_converters, fields_converters = converters
+        if isinstance(doc.get("_source"), dict):
+            convert_document(doc["_source"], source_converters)
+        if isinstance(doc.get("fields"), dict):
+            convert_document(doc["fields"], fields_converters)
+
+    def convert_response(self, response):
+        """
+        Convert the documents of a search, scroll, get or mget response
+        """
+        hits = response.get("hits")
+        if isinstance(hits, dict) and isinstance(hits.get("hits"), list):
+            for hit in hits["hits"]:
+                self.convert_document(hit)
+        elif isinstance(response.get("docs"), list):
+            for doc in response["docs"]:
+                self.convert_document(doc)
+        elif "_index" in response and ("_source" in response or "fields" in response):
+            self.convert_document(response)
+
 MAPPING_NAME_TYPE = {
     "attachment": AttachmentField,
     "boolean": BooleanField,
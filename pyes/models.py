@@ -3,24 +3,96 @@
 from __future__ import absolute_import
 from __future__ import with_statement
 
+import bisect
 import copy
+import random
+import re
 import threading
+import time
+import Queue
 try:
     import simplejson as json
 except ImportError:
     import json
 from types import GeneratorType
 
-from .exceptions import BulkOperationException
+from . import logger
+from .exceptions import BulkOperationException, ElasticSearchException
 
 __author__ = 'alberto'
 
+class DotList(list):
+    """
+    A list whose plain dicts are wrapped in DotDict
+    """
+
+
+def _wrap(value):
+    """
+    Return a plain dict wrapped in a DotDict, a plain list as a DotList whose
+    plain dicts and lists are wrapped, other values unchanged
+    """
+    cls = value.__class__
+    if cls is dict:
+        return DotDict(value)
+    if cls is list:
+        return DotList([_wrap(elem) if elem.__class__ is dict or elem.__class__ is list else elem
+                        for elem in value])
+    return value
+
+
 class DotDict(dict):
+    """
+    A dict whose items are also read as attributes.
+
+    The plain dicts and lists it holds (i.e. decoded by the JSON codec) are
+    wrapped when they are read, and stored wrapped: the decoding doesn't
+    build a DotDict for every object.
+    """
+
     def __getattr__(self, attr):
         if attr.startswith('__'):
             raise AttributeError
         return self.get(attr, None)
 
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        cls = value.__class__
+        if cls is dict or cls is list:
+            value = _wrap(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        value = dict.get(self, key, default)
+        cls = value.__class__
+        if (cls is dict or cls is list) and value is not default:
+            value = _wrap(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def _wrap_values(self):
+        for key, value in dict.items(self):
+            cls = value.__class__
+            if cls is dict or cls is list:
+                dict.__setitem__(self, key, _wrap(value))
+
+    def values(self):
+        self._wrap_values()
+        return dict.values(self)
+
+    def items(self):
+        self._wrap_values()
+        return dict.items(self)
+
+    def itervalues(self):
+        self._wrap_values()
+        return dict.itervalues(self)
+
+    def iteritems(self):
+        self._wrap_values()
+        return dict.iteritems(self)
+
     __setattr__ = dict.__setitem__
 
     __delattr__ = dict.__delitem__
@@ -119,6 +191,199 @@ class ElasticSearchModel(DotDict):
 
 
 
+class HitMeta(object):
+    """
+    The read-only metadata of a SearchHit: meta.id, meta.index, meta.score...
+    are read from the _id, _index, _score... keys of the hit.
+    """
+    __slots__ = ("_hit", "connection")
+
+    def __init__(self, connection, hit):
+        self._hit = hit
+        self.connection = connection
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name, default=None):
+        if name == "connection":
+            return self.connection
+        hit = self._hit
+        key = "_" + name
+        if key in hit:
+            return hit[key]
+        if name == "parent":
+            return (hit.get("fields") or {}).get("_parent", default)
+        return default
+
+
+class SearchHit(object):
+    """
+    A lightweight read-only view of a hit, a model for ES.search(model=SearchHit).
+
+    The values of _source and fields are read as attributes or items of the
+    hit without copying them, and the metadata from hit._meta (see HitMeta).
+    When the hit is changed, saved, deleted or reloaded, a full model is built
+    by the model of the connection and used from then on.
+    """
+    __slots__ = ("_conn", "_hit", "_model", "_view", "_hit_meta")
+
+    def __init__(self, conn=None, hit=None):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_hit", hit or {})
+        object.__setattr__(self, "_model", None)
+        object.__setattr__(self, "_view", None)
+        object.__setattr__(self, "_hit_meta", None)
+
+    def _values(self):
+        model = self._model
+        if model is not None:
+            return model
+        view = self._view
+        if view is None:
+            view = self._build_view()
+            object.__setattr__(self, "_view", view)
+        return view
+
+    def _build_view(self):
+        """
+        Return the values of the hit, merging _source and fields only if both
+        are present
+        """
+        hit = self._hit
+        fields = hit.get("fields")
+        if not fields:
+            return hit.get("_source") or {}
+        if "_source" not in hit and "_parent" not in fields:
+            return fields
+        #as the models, without the _parent of the metadata
+        values = dict(hit.get("_source") or {})
+        values.update(fields)
+        values.pop("_parent", None)
+        return values
+
+    def materialize(self):
+        """
+        Return the full model of the hit, building it on the first call
+        """
+        model = self._model
+        if model is None:
+            from .odm import model_factory
+            factory = getattr(self._conn, "model", None)
+            if factory is None or factory is SearchHit:
+                factory = model_factory(ElasticSearchModel)
+            hit = dict(self._hit)
+            if "_source" in hit:
+                hit["_source"] = dict(hit["_source"])
+            if "fields" in hit:
+                hit["fields"] = dict(hit["fields"])
+            model = factory(self._conn, hit)
+            object.__setattr__(self, "_model", model)
+        return model
+
+    @property
+    def _meta(self):
+        if self._model is not None:
+            return self._model._meta
+        meta = self._hit_meta
+        if meta is None:
+            meta = HitMeta(self._conn, self._hit)
+            object.__setattr__(self, "_hit_meta", meta)
+        return meta
+
+    def get_meta(self):
+        return self._meta
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self._values().get(name)
+
+    def __getitem__(self, name):
+        return self._values()[name]
+
+    def get(self, name, default=None):
+        return self._values().get(name, default)
+
+    def __contains__(self, name):
+        return name in self._values()
+
+    def __iter__(self):
+        return iter(self._values())
+
+    def __len__(self):
+        return len(self._values())
+
+    def keys(self):
+        return self._values().keys()
+
+    def values(self):
+        return self._values().values()
+
+    def items(self):
+        return self._values().items()
+
+    def iteritems(self):
+        return self._values().iteritems()
+
+    def to_dict(self):
+        return dict(self._values())
+
+    def __eq__(self, other):
+        if isinstance(other, SearchHit):
+            other = other._values()
+        return self._values() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<SearchHit %s/%s/%s>" % (self._meta.index, self._meta.type, self._meta.id)
+
+    #--- the changes are done on the full model
+
+    def __setattr__(self, name, value):
+        setattr(self.materialize(), name, value)
+
+    def __setitem__(self, name, value):
+        self.materialize()[name] = value
+
+    def __delattr__(self, name):
+        delattr(self.materialize(), name)
+
+    def __delitem__(self, name):
+        del self.materialize()[name]
+
+    def update(self, *args, **kwargs):
+        self.materialize().update(*args, **kwargs)
+
+    def pop(self, *args):
+        return self.materialize().pop(*args)
+
+    def setdefault(self, name, default=None):
+        return self.materialize().setdefault(name, default)
+
+    def save(self, *args, **kwargs):
+        return self.materialize().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.materialize().delete(*args, **kwargs)
+
+    def reload(self):
+        return self.materialize().reload()
+
+    def get_id(self):
+        return self.materialize().get_id()
+
+    def get_bulk(self, *args, **kwargs):
+        return self.materialize().get_bulk(*args, **kwargs)
+
+
 #--------
 # Bulkers
 #--------
@@ -129,9 +394,10 @@ class BaseBulker(object):
 
     """
 
-    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False):
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, bulk_bytes=None):
         self.conn = conn
         self._bulk_size = bulk_size
+        self._bulk_bytes = bulk_bytes
         # protects bulk_data
         self.bulk_lock = threading.RLock()
         with self.bulk_lock:
@@ -157,9 +423,36 @@ class BaseBulker(object):
 
     bulk_size = property(get_bulk_size, set_bulk_size)
 
+    def get_bulk_bytes(self):
+        """
+        Get the current bulk_bytes
+
+        :return a int: the max size in bytes of a bulk request, None if unlimited
+        """
+        return self._bulk_bytes
+
+    def set_bulk_bytes(self, bulk_bytes):
+        """
+        Set the bulk bytes
+
+        :param bulk_bytes the max size in bytes of a bulk request, None if unlimited
+        """
+        self._bulk_bytes = bulk_bytes
+        self.flush_bulk()
+
+    bulk_bytes = property(get_bulk_bytes, set_bulk_bytes)
+
     def add(self, content):
         raise NotImplementedError
 
+    def add_raw(self, header, source=None):
+        """
+        Add a command given its encoded action line and document, if any
+        """
+        if source is not None:
+            header = "%s\n%s" % (header, source)
+        self.add(header)
+
     def flush_bulk(self, forced=False):
         raise NotImplementedError
 
@@ -167,13 +460,41 @@ class BaseBulker(object):
 class ListBulker(BaseBulker):
     """
     A bulker that store data in a list
+
+    The commands are encoded in a single payload buffer as they are added;
+    ``bulk_data`` holds the end offset of every command in the buffer.
+
+    A batch is sent when it holds ``bulk_size`` commands or ``bulk_bytes``
+    bytes, whichever comes first. A request never exceeds ``bulk_bytes``
+    unless a single command is bigger than that.
+
+    With ``max_attempts`` > 1, the items rejected by a saturated cluster
+    (EsRejectedExecutionException, status 429 or 503) are sent again, alone,
+    up to ``max_attempts`` times in all, waiting a jittered exponential
+    backoff between the attempts: from ``backoff`` seconds, doubled at every
+    attempt up to ``max_backoff``. A whole request answered 429 or 503 is
+    sent again the same way. The retries are sent by the thread flushing the
+    batch, which slows the producers down while the cluster is saturated.
+
+    The items still failed at the end (the permanent failures, like the
+    mapping errors, and the rejections past the attempts budget) are passed
+    to ``on_dead_letter(failures, bulk_result)`` as BulkItemFailure objects,
+    whose actions can be stored or queued again later; the dead-letter
+    callback takes the place of ``raise_on_bulk_item_failure``.
     """
 
-    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False):
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, bulk_bytes=None,
+                 max_attempts=1, backoff=0.1, max_backoff=10.0, on_dead_letter=None):
         super(ListBulker, self).__init__(conn=conn, bulk_size=bulk_size,
-                                         raise_on_bulk_item_failure=raise_on_bulk_item_failure)
+                                         raise_on_bulk_item_failure=raise_on_bulk_item_failure,
+                                         bulk_bytes=bulk_bytes)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_dead_letter = on_dead_letter
         with self.bulk_lock:
             self.bulk_data = []
+            self.bulk_payload = bytearray()
 
     def __nonzero__(self):
         # This is needed for __del__ in ES to correctly detect if there is
@@ -181,42 +502,478 @@ class ListBulker(BaseBulker):
         return not not self.bulk_data
 
     def add(self, content):
+        if isinstance(content, unicode):
+            content = content.encode("utf-8")
         with self.bulk_lock:
-            self.bulk_data.append(content)
+            self.bulk_payload += content
+            self.bulk_payload += "\n"
+            self.bulk_data.append(len(self.bulk_payload))
 
-    def flush_bulk(self, forced=False):
+    def add_raw(self, header, source=None):
+        """
+        Add a command given its action line and its document, if any, as
+        UTF-8 JSON: str, bytearray, buffer or memoryview objects, with or
+        without a trailing newline. The parts are copied once, straight into
+        the payload.
+        """
+        if isinstance(header, unicode):
+            header = header.encode("utf-8")
+        if isinstance(source, unicode):
+            source = source.encode("utf-8")
         with self.bulk_lock:
-            if forced or len(self.bulk_data) >= self.bulk_size:
-                batch = self.bulk_data
-                self.bulk_data = []
+            payload = self.bulk_payload
+            payload += header
+            if header[-1:] != "\n":
+                payload += "\n"
+            if source is not None:
+                payload += source
+                if source[-1:] != "\n":
+                    payload += "\n"
+            self.bulk_data.append(len(payload))
+
+    def flush_bulk(self, forced=False):
+        results = []
+        while True:
+            with self.bulk_lock:
+                batch = self._take_batch(forced)
+            if batch is None:
+                break
+            payload, ends = batch
+            if self.max_attempts <= 1 and self.on_dead_letter is None:
+                bulk_result = DotDict(self._post_bulk(payload))
+                if self.raise_on_bulk_item_failure:
+                    _raise_exception_if_bulk_item_failed(bulk_result, payload, ends)
             else:
-                return None
+                bulk_result, failures = self._send_bulk(payload, ends)
+                if failures:
+                    if self.on_dead_letter is not None:
+                        self.on_dead_letter(failures, bulk_result)
+                    elif self.raise_on_bulk_item_failure:
+                        raise BulkOperationException([failure.item for failure in failures],
+                                                     bulk_result, failures)
+
+            results.append(bulk_result)
+
+        return _merge_bulk_results(results)
+
+    def _take_batch(self, forced=False):
+        """
+        Detach the next batch to send, if any.
+
+        Must be called holding ``bulk_lock``.
+
+        :return a tuple: (payload, end offsets of its commands) or None
+        """
+        ends = self.bulk_data
+        if not ends:
+            return None
+        count = len(ends)
+        if self._bulk_bytes is not None and ends[-1] >= self._bulk_bytes:
+            count = max(1, bisect.bisect_right(ends, self._bulk_bytes))
+        elif not forced and count < self._bulk_size:
+            return None
+
+        payload = self.bulk_payload
+        if count == len(ends):
+            self.bulk_payload = bytearray()
+            self.bulk_data = []
+            return payload, ends
+
+        size = ends[count - 1]
+        self.bulk_payload = payload[size:]
+        self.bulk_data = [end - size for end in ends[count:]]
+        del payload[size:]
+        return payload, ends[:count]
+
+    def _post_bulk(self, payload):
+        """
+        Send a bulk payload and return the bulk response, decoded as plain
+        dicts (without datetime and mapping decoding)
+        """
+        return self.conn._send_request("POST", "/_bulk", payload, raw=True)
+
+    def _send_bulk(self, payload, ends):
+        """
+        Send a batch, sending again its rejected items while the attempts
+        budget allows it. The responses of the retried items replace the
+        rejections in the bulk response.
+
+        :return a tuple: (bulk response, BulkItemFailure of the items still failed)
+        """
+        attempt = 1
+        while True:
+            try:
+                bulk_result = DotDict(self._post_bulk(payload))
+                break
+            except ElasticSearchException, e:
+                if e.status not in RETRYABLE_STATUSES or attempt >= self.max_attempts:
+                    raise
+            self._sleep_backoff(attempt)
+            attempt += 1
+
+        failures = _get_bulk_item_failures(bulk_result, payload, ends)
+        retries = [failure for failure in failures if _is_bulk_failure_retryable(failure)]
+        while retries and attempt < self.max_attempts:
+            self._sleep_backoff(attempt)
+            attempt += 1
+            retry_payload = bytearray()
+            for failure in retries:
+                retry_payload += failure.action
+                retry_payload += "\n"
+            try:
+                retry_result = self._post_bulk(retry_payload)
+            except ElasticSearchException, e:
+                if e.status not in RETRYABLE_STATUSES:
+                    raise
+                continue
+            items = bulk_result["items"]
+            rejected = []
+            for failure, item in zip(retries, retry_result["items"]):
+                items[failure.position] = item
+                failure.item = item
+                if not _is_bulk_item_ok(item) and _is_bulk_failure_retryable(failure):
+                    rejected.append(failure)
+            retries = rejected
+
+        if attempt > 1:
+            failures = [failure for failure in failures if not _is_bulk_item_ok(failure.item)]
+            if "errors" in bulk_result:
+                bulk_result["errors"] = bool(failures)
+        return bulk_result, failures
+
+    def _sleep_backoff(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        # half fixed, half random, so that the senders rejected together
+        # don't come back together
+        time.sleep(delay / 2.0 + random.uniform(0, delay / 2.0))
+
+
+_STOP_SENDER = object()
+
+
+class ThreadedBulker(ListBulker):
+    """
+    A bulker that sends its batches from background sender threads.
+
+    Full batches are handed to ``workers`` sender threads through a queue
+    holding at most ``queue_size`` batches, so the producer keeps filling the
+    next batch while the previous one is on the wire. When the queue is full,
+    the call that completes a batch blocks until a sender frees a slot.
+
+    The bulk responses come back on the sender threads, so they are reported
+    through callbacks:
+
+    - ``on_bulk_result(bulk_result)`` for every bulk response;
+    - ``on_bulk_item_failure(errors, bulk_result)`` for the failed items of a
+      bulk response;
+    - ``on_bulk_error(exception, payload)`` when sending a batch raises (with
+      ``raise_on_bulk_item_failure`` a ``BulkOperationException`` is reported
+      here too);
+    - ``on_dead_letter(failures, bulk_result)`` for the items still failed
+      after the retries (see ListBulker).
+
+    Without ``on_bulk_error`` the first exception is kept and raised by the
+    next forced flush. A forced flush (``ES.force_bulk``) waits until every
+    queued batch has been sent and returns the response of the last queued
+    batch.
+
+    The batches are queued in order, but with more than one worker they may
+    be sent, and applied by ES, out of order: keep ``workers=1`` when several
+    commands of a bulk session can touch the same document.
+
+    The extra parameters can be passed through ``ES(bulker_class=...)`` with
+    ``functools.partial``.
+    """
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, bulk_bytes=None,
+                 workers=1, queue_size=2, on_bulk_result=None,
+                 on_bulk_item_failure=None, on_bulk_error=None,
+                 max_attempts=1, backoff=0.1, max_backoff=10.0, on_dead_letter=None):
+        super(ThreadedBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                             raise_on_bulk_item_failure=raise_on_bulk_item_failure,
+                                             bulk_bytes=bulk_bytes, max_attempts=max_attempts,
+                                             backoff=backoff, max_backoff=max_backoff,
+                                             on_dead_letter=on_dead_letter)
+        self.workers = workers
+        self.on_bulk_result = on_bulk_result
+        self.on_bulk_item_failure = on_bulk_item_failure
+        self.on_bulk_error = on_bulk_error
+        self.last_result = None
+        self._queue = Queue.Queue(maxsize=queue_size)
+        self._senders = []
+        self._errors = []
+        self._errors_lock = threading.Lock()
+        self._handoff_lock = threading.Lock()
+        #the number of the last queued batch and of the batch of last_result
+        self._sequence = 0
+        self._result_sequence = 0
+
+    def __nonzero__(self):
+        return not not self.bulk_data or self._queue.unfinished_tasks > 0
+
+    def flush_bulk(self, forced=False):
+        while True:
+            # the handoff lock keeps the batches queued in the order they are
+            # taken; bulk_lock is only held to take a batch, so the blocked
+            # producer doesn't stop the others from adding their commands
+            with self._handoff_lock:
+                with self.bulk_lock:
+                    batch = self._take_batch(forced)
+                    if batch is None:
+                        break
+                    self._sequence += 1
+                    sequence = self._sequence
+                self._start_senders()
+                # blocks while the queue is full
+                self._queue.put((sequence,) + batch)
+
+        if not forced:
+            return None
+
+        self._queue.join()
+        with self._errors_lock:
+            errors = self._errors
+            self._errors = []
+        if errors:
+            raise errors[0]
+        return self.last_result
+
+    def close(self):
+        """
+        Send the pending data and stop the sender threads
+        """
+        try:
+            self.flush_bulk(True)
+        finally:
+            with self._handoff_lock:
+                for _ in self._senders:
+                    self._queue.put(_STOP_SENDER)
+                senders = self._senders
+                self._senders = []
+            for sender in senders:
+                sender.join()
+
+    def _start_senders(self):
+        while len(self._senders) < self.workers:
+            sender = threading.Thread(target=self._sender_loop,
+                                      name="pyes-bulk-sender-%d" % len(self._senders))
+            sender.daemon = True
+            sender.start()
+            self._senders.append(sender)
+
+    def _sender_loop(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is _STOP_SENDER:
+                    return
+                self._send_batch(batch)
+            finally:
+                self._queue.task_done()
+
+    def _send_batch(self, batch):
+        sequence, payload, ends = batch
+        try:
+            bulk_result, failures = self._send_bulk(payload, ends)
+        except Exception, exc:
+            self._report_error(exc, payload)
+            return
+        with self._errors_lock:
+            # the senders may complete their batches out of order
+            if sequence > self._result_sequence:
+                self._result_sequence = sequence
+                self.last_result = bulk_result
+        if self.on_bulk_result is not None:
+            self._run_callback(self.on_bulk_result, bulk_result)
+
+        if failures:
+            errors = [failure.item for failure in failures]
+            if self.on_bulk_item_failure is not None:
+                self._run_callback(self.on_bulk_item_failure, errors, bulk_result)
+            if self.on_dead_letter is not None:
+                self._run_callback(self.on_dead_letter, failures, bulk_result)
+            elif self.raise_on_bulk_item_failure:
+                self._report_error(BulkOperationException(errors, bulk_result, failures), payload)
+
+    def _report_error(self, exc, payload):
+        if self.on_bulk_error is not None:
+            self._run_callback(self.on_bulk_error, exc, payload)
+            return
+        logger.error("Bulk sender failed to send %d bytes: %s", len(payload), exc)
+        with self._errors_lock:
+            self._errors.append(exc)
+
+    def _run_callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Error in bulk callback %r", callback)
+
+
+_SAFE_STRING_RE = re.compile(r'^[A-Za-z0-9_.:+-]*$')
+
+
+def _encode_header_value(value):
+    cls = value.__class__
+    if cls is int or cls is long:
+        return str(value)
+    if cls is str and _SAFE_STRING_RE.match(value):
+        return '"%s"' % value
+    return json.dumps(value)
+
 
-        if len(batch) > 0:
-            bulk_result = self.conn._send_request("POST",
-                                                  "/_bulk",
-                                                  "\n".join(batch) + "\n")
+class BulkHeaders(object):
+    """
+    Build the compact action lines of the bulk commands: the start of a line
+    is encoded once for every (op_type, index, doc_type) and cached, only
+    the id, the parent and so on are encoded for every command.
+
+    Example:
 
-            if self.raise_on_bulk_item_failure:
-                _raise_exception_if_bulk_item_failed(bulk_result)
+        headers = BulkHeaders()
+        conn.index_raw_bulk(headers.header("index", "test-index", "test-type", id=1), source)
+    """
 
-            return bulk_result
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._prefixes = {}
+
+    def header(self, op_type, index, doc_type, id=None, parent=None, version=None, routing=None,
+               percolate=None):
+        """
+        Return the action line of a command, as UTF-8 JSON without newline
+        """
+        key = op_type, index, doc_type
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            if len(self._prefixes) >= self.maxsize:
+                self._prefixes.clear()
+            prefix = self._prefixes[key] = '{%s:{"_index":%s,"_type":%s' % (
+                _encode_header_value(op_type), _encode_header_value(index), _encode_header_value(doc_type))
+        if parent is None and version is None and routing is None and percolate is None:
+            if id is None:
+                return prefix + "}}"
+            return '%s,"_id":%s}}' % (prefix, _encode_header_value(id))
+        parts = [prefix]
+        if parent is not None:
+            parts.append(',"_parent":')
+            parts.append(_encode_header_value(parent))
+        if version is not None:
+            parts.append(',"_version":')
+            parts.append(_encode_header_value(version))
+        if routing is not None:
+            parts.append(',"_routing":')
+            parts.append(_encode_header_value(routing))
+        if percolate is not None:
+            parts.append(',"percolate":')
+            parts.append(_encode_header_value(percolate))
+        if id is not None:
+            parts.append(',"_id":')
+            parts.append(_encode_header_value(id))
+        parts.append("}}")
+        return "".join(parts)
+
+
+def _merge_bulk_results(results):
+    """
+    Combine the responses of the requests sent by a single flush
+    """
+    if not results:
+        return None
+    if len(results) == 1:
+        return results[0]
+    return DotDict(took=sum(result.get("took", 0) for result in results),
+                   items=[item for result in results for item in result["items"]])
+
+
+class BulkItemFailure(object):
+    """
+    A failed item of a bulk request: ``position`` is its position in the
+    request, ``item`` the item of the response and ``action`` the command
+    sent (the action line and the document, if any), which can be queued
+    again with ES.bulker.add.
+    """
+    __slots__ = ("position", "item", "action")
+
+    def __init__(self, position, item, action=None):
+        self.position = position
+        self.item = item
+        self.action = action
+
+    @property
+    def op(self):
+        """The operation: index, create, delete..."""
+        return iter(self.item).next()
+
+    @property
+    def error(self):
+        return self.item[self.op].get("error")
+
+    def __repr__(self):
+        return "<BulkItemFailure %d %s: %s>" % (self.position, self.op, self.error)
 
 
 def _is_bulk_item_ok(item):
-    if "index" in item:
-        return "ok" in item["index"]
-    elif "delete" in item:
-        return "ok" in item["delete"]
-    else:
-        # unknown response type; be conservative
+    for result in item.itervalues():
+        if "error" in result:
+            return False
+        return "ok" in result or 200 <= result.get("status", 0) < 300
+    # empty item; be conservative
+    return False
+
+
+#the statuses of the bulk items and requests rejected by a saturated cluster
+RETRYABLE_STATUSES = (429, 503)
+
+
+def _is_bulk_failure_retryable(failure):
+    """
+    Return if a BulkItemFailure is a rejection which can be sent again
+    """
+    if failure.action is None:
         return False
+    result = failure.item[failure.op]
+    if result.get("status") in RETRYABLE_STATUSES:
+        return True
+    error = result.get("error")
+    return error is not None and "EsRejectedExecutionException" in unicode(error)
+
 
+def _get_bulk_item_errors(bulk_result):
+    if bulk_result.get("errors") is False:
+        return []
+    return [item for item in bulk_result["items"] if not _is_bulk_item_ok(item)]
 
-def _raise_exception_if_bulk_item_failed(bulk_result):
-    errors = [item for item in bulk_result["items"] if not _is_bulk_item_ok(item)]
+
+def _get_bulk_item_failures(bulk_result, payload=None, ends=None):
+    """
+    Return the BulkItemFailure of the failed items of a bulk response. The
+    actions are taken from the payload of the request, given the end offsets
+    of its commands.
+    """
+    if bulk_result.get("errors") is False:
+        return []
+    failures = []
+    for position, item in enumerate(bulk_result["items"]):
+        if not _is_bulk_item_ok(item):
+            action = None
+            if ends is not None and position < len(ends):
+                start = ends[position - 1] if position else 0
+                # without the trailing newline
+                action = str(payload[start:ends[position] - 1])
+            failures.append(BulkItemFailure(position, item, action))
+    return failures
+
+
+def _raise_exception_if_bulk_item_failed(bulk_result, payload=None, ends=None):
+    if payload is None:
+        errors = _get_bulk_item_errors(bulk_result)
+        failures = None
+    else:
+        failures = _get_bulk_item_failures(bulk_result, payload, ends)
+        errors = [failure.item for failure in failures]
     if len(errors) > 0:
-        raise BulkOperationException(errors, bulk_result)
+        raise BulkOperationException(errors, bulk_result, failures)
     return None
 
 class SortedDict(dict):
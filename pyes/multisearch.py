@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import threading
+
+__all__ = ["MultiSearch", "SearchBatcher"]
+
+
+class MultiSearch(object):
+    """
+    Collect searches to execute them in a single _msearch request (see
+    ES.multi_search). With an AsyncES connection, execute() returns a
+    Future of the list of AsyncResultSets.
+
+    Example:
+
+        searches = MultiSearch(conn)
+        searches.add(TermQuery("tag", "foo"), "test-index")
+        searches.add(Search(MatchAllQuery(), size=0, facet=facets), "test-index", "test-type")
+        foo, facets = searches.execute()
+    """
+
+    def __init__(self, conn, model=None, raise_on_error=True):
+        self.conn = conn
+        self.model = model
+        self.raise_on_error = raise_on_error
+        self.searches = []
+
+    def add(self, query, indices=None, doc_types=None, **query_params):
+        """
+        Add a search, return its position in the results
+        """
+        self.searches.append((query, indices, doc_types, query_params))
+        return len(self.searches) - 1
+
+    def execute(self):
+        """
+        Send the collected searches and return their ResultSets
+        """
+        searches, self.searches = self.searches, []
+        return self.conn.multi_search(searches, model=self.model, raise_on_error=self.raise_on_error)
+
+    def __len__(self):
+        return len(self.searches)
+
+
+class _Batch(object):
+    def __init__(self):
+        self.searches = []
+        self.results = None
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class SearchBatcher(object):
+    """
+    Coalesce the searches of several threads in _msearch requests.
+
+    The first search of a batch waits up to ``window`` seconds for the
+    searches of the other threads (or until the batch holds ``max_batch``
+    searches), then the batch is sent in a single request from its thread.
+    Every caller gets its own ResultSet, or its own exception. The callers
+    block: an AsyncES connection is rejected, use MultiSearch instead.
+
+    Example:
+
+        batcher = SearchBatcher(conn, window=0.005)
+        # from many threads
+        results = batcher.search(TermQuery("tag", "foo"), "test-index")
+    """
+
+    def __init__(self, conn, window=0.005, max_batch=50, model=None):
+        if getattr(conn, "asynchronous", False):
+            raise ValueError("SearchBatcher doesn't support the asynchronous connections")
+        self.conn = conn
+        self.window = window
+        self.max_batch = max_batch
+        self.model = model
+        self._batch = None
+        self._lock = threading.Lock()
+
+    def search(self, query, indices=None, doc_types=None, **query_params):
+        """
+        Execute a search in the next batch and return its ResultSet
+        """
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            pos = len(batch.searches)
+            batch.searches.append((query, indices, doc_types, query_params))
+            if len(batch.searches) >= self.max_batch:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            try:
+                batch.results = self.conn.multi_search(batch.searches, model=self.model,
+                                                       raise_on_error=False)
+            except Exception, e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        result = batch.results[pos]
+        if isinstance(result, Exception):
+            raise result
+        return result
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import izip
+import re
+import threading
+import weakref
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from .exceptions import QueryError
+from .query import Query
+from .utils import EqualityComparableUsingAttributeDictionary
+
+__all__ = ["QueryCache", "QueryTemplate", "Param", "freeze", "frozen_key", "structural_key"]
+
+_SCALARS = (basestring, bool, int, long, float, Decimal, datetime, date, type(None))
+
+#the structural keys of the frozen objects
+_frozen_keys = weakref.WeakKeyDictionary()
+
+
+def structural_key(obj):
+    """
+    Return a hashable key of a Search/Query/Filter tree: two trees have the
+    same key if they have the same classes and the same values, so they are
+    encoded to the same JSON. Raise TypeError if a value of the tree can't be
+    part of a key.
+    """
+    if isinstance(obj, _SCALARS):
+        return obj.__class__, obj
+    if isinstance(obj, EqualityComparableUsingAttributeDictionary):
+        frozen = _frozen_keys.get(obj)
+        if frozen is not None:
+            return frozen.key
+        return obj.__class__, _items_key(obj.__dict__)
+    if isinstance(obj, dict):
+        return dict, _items_key(obj)
+    if isinstance(obj, (list, tuple)):
+        return obj.__class__, tuple([structural_key(value) for value in obj])
+    if isinstance(obj, (set, frozenset)):
+        return obj.__class__, frozenset([structural_key(value) for value in obj])
+    if isinstance(obj, Param):
+        return Param, obj.name
+    if hasattr(obj, "__dict__"):
+        return obj.__class__, _items_key(obj.__dict__)
+    raise TypeError("%r can't be part of a structural key" % (obj,))
+
+
+def _items_key(d):
+    return tuple(sorted([(name, structural_key(value)) for name, value in d.iteritems()]))
+
+
+class FrozenKey(object):
+    """The structural key of a frozen object, with its hash computed once"""
+    __slots__ = ("key", "hash")
+
+    def __init__(self, key):
+        self.key = key
+        self.hash = hash(key)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, FrozenKey) and self.hash == other.hash and
+                                 self.key == other.key)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def freeze(obj):
+    """
+    Mark a Search/Query/Filter object as immutable, computing its structural
+    key once: the object, and the objects it contains, must not be changed
+    afterwards. Return the object.
+    """
+    if not isinstance(obj, EqualityComparableUsingAttributeDictionary):
+        raise TypeError("%r can't be frozen" % (obj,))
+    _frozen_keys[obj] = FrozenKey(structural_key(obj))
+    return obj
+
+
+def frozen_key(obj):
+    """Return the FrozenKey of a frozen object, None if it is not frozen"""
+    if isinstance(obj, EqualityComparableUsingAttributeDictionary):
+        return _frozen_keys.get(obj)
+    return None
+
+
+class QueryCache(object):
+    """
+    A LRU cache of the encoded JSON bodies of the frozen (see freeze())
+    Search/Query/Filter objects, by structural key: equal frozen objects share
+    the body encoded the first time, without serializing them again.
+
+    The objects which are not frozen are encoded every time: walking a tree
+    to compute its key costs more than encoding it. For queries built on
+    every request, use a QueryTemplate.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, obj, encode, namespace=None):
+        """
+        Return the body of obj from the cache, calling encode(obj) to build
+        it if missing. The bodies built by different encode functions must be
+        stored in different namespaces.
+        """
+        key = frozen_key(obj)
+        if key is None:
+            return encode(obj)
+        key = namespace, key
+        with self._lock:
+            body = self._entries.pop(key, None)
+            if body is not None:
+                self._entries[key] = body
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = encode(obj)
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_PARAM_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+_PARAM_TOKEN = u"\x00pyes-param:%s\x00"
+#an encoded param token, as found in the body
+_PARAM_TOKEN_RE = re.compile(r'"\\u0000pyes-param:([A-Za-z0-9_]+)\\u0000"')
+
+
+class Param(object):
+    """
+    A placeholder for a leaf value of a QueryTemplate, i.e. the value of
+    TermQuery("name", Param("name")).
+    """
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        if not _PARAM_NAME_RE.match(name):
+            raise ValueError("Invalid parameter name: %r" % name)
+        self.name = name
+
+    def __repr__(self):
+        return "Param(%r)" % self.name
+
+
+_param_encoders = {}
+
+
+def _param_encoder(encoder):
+    """Return a subclass of encoder encoding the params as tokens"""
+    param_encoder = _param_encoders.get(encoder)
+    if param_encoder is None:
+        class ParamEncoder(encoder):
+            def default(self, value):
+                if isinstance(value, Param):
+                    return _PARAM_TOKEN % value.name
+                return super(ParamEncoder, self).default(value)
+        param_encoder = _param_encoders[encoder] = ParamEncoder
+    return param_encoder
+
+
+class QueryTemplate(object):
+    """
+    A Search/Query/Filter tree whose leaf values can be Param placeholders.
+    The tree is serialized and encoded once: rendering the template only
+    encodes the values of the params.
+
+    The params must be values which the tree serializes unchanged: the
+    values of the terms, of the ranges, of the sizes and so on.
+
+    Example:
+
+        template = QueryTemplate(FilteredQuery(TermQuery("name", Param("name")),
+                                               TermFilter("age", Param("age"))))
+        conn.search_raw(template.bind(name="joe", age=32), "test-index")
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self._compiled = {}
+
+    def compile(self, encoder, search=True):
+        """
+        Return the fragments of the encoded body and the names of the params
+        between them. If search is truthy, a Query is encoded as a search.
+        """
+        compiled = self._compiled.get((encoder, search))
+        if compiled is None:
+            data = self.query
+            if search and isinstance(data, Query):
+                data = data.search()
+            if hasattr(data, "serialize"):
+                data = data.serialize()
+            parts = _PARAM_TOKEN_RE.split(json.dumps(data, cls=_param_encoder(encoder)))
+            compiled = self._compiled[(encoder, search)] = (parts[0::2], parts[1::2])
+        return compiled
+
+    def render(self, codec, values, search=True):
+        """
+        Return the body with the given values of the params, encoded by the
+        codec (a jsoncodec.JSONCodec)
+        """
+        fragments, names = self.compile(codec.encoder, search)
+        body = [fragments[0]]
+        for name, fragment in izip(names, fragments[1:]):
+            try:
+                value = values[name]
+            except KeyError:
+                raise QueryError("Missing value of the template parameter %r" % name)
+            body.append(codec.dumps(value))
+            body.append(fragment)
+        return "".join(body)
+
+    def bind(self, **values):
+        """
+        Return the template with the given values of the params, which can be
+        passed to ES.search_raw, ES.count and so on in place of a query
+        """
+        return BoundTemplate(self, values)
+
+
+class BoundTemplate(object):
+    """A QueryTemplate with the values of its params"""
+    __slots__ = ("template", "values")
+
+    def __init__(self, template, values):
+        self.template = template
+        self.values = values
+
+    def encode(self, codec, search=True):
+        return self.template.render(codec, self.values, search)
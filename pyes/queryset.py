@@ -13,14 +13,24 @@ import copy
 # The maximum number of items to display in a QuerySet.__repr__
 from .filters import ANDFilter, ORFilter, NotFilter, Filter, TermsFilter, TermFilter, RangeFilter, ExistsFilter
 from .query import MatchAllQuery, BoolQuery, FilteredQuery, Search
-from .exceptions import DoesNotExist, MultipleObjectsReturned
+from .exceptions import DoesNotExist, MultipleObjectsReturned, ReduceSearchPhaseException
 from .facets import Facet, TermFacet
+from .columnar import HIT_FIELDS
 from .models import ElasticSearchModel
 from .utils.compat import integer_types
 from .utils import ESRange
 
 REPR_OUTPUT_SIZE = 20
 
+# The page size of the searches exporting columns
+EXPORT_BULK_READ = 500
+
+# The page size of the scrolls of delete(), update() and values_list(flat=True)
+CHUNK_SIZE = 500
+
+# The time the scroll contexts are kept between two pages
+SCROLL = "10m"
+
 
 def generate_model(index, doc_type, es_url=None, es_kwargs={}):
     MyModel = type('MyModel', (ElasticSearchModel,), {})
@@ -28,6 +38,48 @@ def generate_model(index, doc_type, es_url=None, es_kwargs={}):
     return MyModel
 
 
+class FlatValuesList(object):
+    """
+    The values of a field of the hits of a QuerySet, returned by
+    values_list(field, flat=True).
+
+    Iterating over it scrolls the hits by pages of CHUNK_SIZE, without
+    caching them. len(), total, an index or a slice run a paged search of
+    the values, as a ResultSet.
+    """
+
+    def __init__(self, queryset, field):
+        self.queryset = queryset
+        self.field = field
+        self._results = None
+
+    def _value(self, conn, hit):
+        return hit.get("fields", {}).get(self.field, None)
+
+    def _get_results(self):
+        if self._results is None:
+            queryset = self.queryset
+            search = queryset._build_search()
+            search.facet.reset()
+            search.fields = [self.field]
+            self._results = queryset.connection.search(search, indices=queryset.index, doc_types=queryset.type,
+                                                       model=self._value)
+        return self._results
+
+    def __iter__(self):
+        return self.queryset._iter_chunks(CHUNK_SIZE, model=self._value, fields=[self.field])
+
+    @property
+    def total(self):
+        return self._get_results().total
+
+    def __len__(self):
+        return len(self._get_results())
+
+    def __getitem__(self, val):
+        return self._get_results()[val]
+
+
 class QuerySet(object):
     """
     Represents a lazy database lookup for a set of objects.
@@ -137,8 +189,9 @@ class QuerySet(object):
             query.size = self._size
         return query
 
-    def _do_query(self):
-        return self.connection.search(self._build_search(), indices=self.index, doc_types=self.type)
+    def _do_query(self, **kwargs):
+        return self.connection.search(self._build_search(), indices=self.index, doc_types=self.type,
+                                      **kwargs)
 
 
     def __len__(self):
@@ -253,16 +306,92 @@ class QuerySet(object):
         clone._start=number
         return clone
 
-    def iterator(self):
+    def iterator(self, prefetch=0, chunk_size=None):
         """
         An iterator over the results from applying this QuerySet to the
         database.
-        """
+
+        If prefetch is set, up to prefetch next pages are fetched in
+        background while iterating and the results are not cached.
+
+        If chunk_size is set, the results are scrolled by pages of
+        chunk_size, in the order of the QuerySet, holding only the current
+        page: the results are not cached, and can outgrow the memory.
+        """
+        if chunk_size:
+            for r in self._iter_chunks(chunk_size):
+                yield r
+            return
+        if prefetch:
+            results = self._do_query(prefetch=prefetch)
+            try:
+                for r in results:
+                    yield r
+            finally:
+                results.close()
+            return
         if not self._result_cache:
             len(self)
         for r in self._result_cache:
             yield r
 
+    def _can_scan(self):
+        """
+        Return if the results can be scanned: the scan ignores the sort and
+        the start
+        """
+        return not self._ordering and not self._start
+
+    def _iter_chunks(self, chunk_size, model=None, fields=None, scan=False):
+        """
+        Scroll the results by pages of chunk_size and yield the models of the
+        hits (the connection model if None), without caching them.
+
+        The hits hold the given fields only, if any. With scan, the results
+        are scanned, in no particular order: the pages hold chunk_size hits
+        per shard.
+
+        A size of the QuerySet up to chunk_size is read with a single search,
+        without scroll, and no page is requested past the size. The ES API
+        can't clear a scroll: the context of a scroll left before its end
+        is kept by the servers until SCROLL expires.
+        """
+        connection = self.connection
+        model = model or connection.model
+        search = self._build_search()
+        search.facet.reset()
+        limit = search.size
+        scroll = scan or limit is None or limit > chunk_size
+        search.size = chunk_size if limit is None or scan else min(chunk_size, limit)
+        if fields is not None:
+            search.fields = fields
+        query_params = {}
+        if scroll:
+            query_params["scroll"] = SCROLL
+        if scan:
+            query_params["search_type"] = "scan"
+        results = connection.search_raw(search, indices=self.index, doc_types=self.type, **query_params)
+        count = 0
+        # the first page of a scan has no hits
+        first = scan
+        while True:
+            hits = results["hits"]["hits"]
+            if not hits and not first:
+                return
+            first = False
+            for hit in hits:
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield model(connection, hit)
+            if not scroll or (limit is not None and count >= limit):
+                return
+            try:
+                results = connection.search_scroll(results["_scroll_id"], SCROLL)
+            except ReduceSearchPhaseException:
+                #as in ResultSet, there are no hits on the last iteration
+                return
+
     def aggregate(self, *args, **kwargs):
         """
         Returns a dictionary containing the calculations (aggregation)
@@ -413,28 +542,30 @@ class QuerySet(object):
 
     def delete(self):
         """
-        Deletes the records in the current QuerySet.
+        Deletes the records in the current QuerySet, scanning their ids and
+        deleting them with bulk requests. Returns the number of records
+        deleted.
         """
-        del_query = self._clone()
-
-        # The delete is actually 2 queries - one to find related objects,
-        # and one to delete. Make sure that the discovery of related
-        # objects is performed on the same database as the deletion.
-        del_query._clear_ordering()
-        self.connection.delete_by_query(self._build_query())
+        connection = self.connection
+        count = 0
+        for hit in self._iter_chunks(CHUNK_SIZE, model=lambda conn, hit: hit, fields=["_parent", "_routing"],
+                                     scan=self._can_scan()):
+            fields = hit.get("fields", {})
+            connection.delete(hit["_index"], hit["_type"], hit["_id"], bulk=True,
+                              parent=fields.get("_parent"), routing=fields.get("_routing"))
+            count += 1
+        connection.flush_bulk(True)
         # Clear the result cache, in case this QuerySet gets reused.
         self._result_cache = None
+        return count
 
     def update(self, **kwargs):
         """
         Updates all elements in the current QuerySet, setting all the given
         fields to the appropriate values.
         """
-        query = self._build_query()
         connection = self.connection
-        results = connection.search(query, indices=self.index, doc_types=self.type,
-                                             model=self.model, scan=True)
-        for item in results:
+        for item in self._iter_chunks(CHUNK_SIZE, model=self.model, scan=self._can_scan()):
             item.update(kwargs)
             item.save(bulk=True)
         connection.flush_bulk(True)
@@ -459,20 +590,31 @@ class QuerySet(object):
         return self.connection.search(search, indices=self.index, doc_types=self.type)
 
     def values_list(self, *fields, **kwargs):
+        """
+        Return the values of the fields of the hits. With dtypes (a list,
+        or a dict by field), return them in arrays as a columnar.Columns,
+        without building the models (see ResultSet.export_columns). With
+        flat, return the FlatValuesList of the field.
+        """
         flat = kwargs.pop('flat', False)
+        dtypes = kwargs.pop('dtypes', None)
         if kwargs:
             raise TypeError('Unexpected keyword arguments to values_list: %s'
                     % (kwargs.keys(),))
         if flat and len(fields) > 1:
             raise TypeError("'flat' is not valid when values_list is called with more than one field.")
         assert fields, "A least a field is required"
+        if flat:
+            return FlatValuesList(self, fields[0])
         search = self._build_search()
         search.facet.reset()
+        if dtypes is not None:
+            search.fields = [field for field in fields if field not in HIT_FIELDS]
+            search.bulk_read = min(EXPORT_BULK_READ, self._size or EXPORT_BULK_READ)
+            results = self.connection.search(search, indices=self.index, doc_types=self.type,
+                                             scan=self._can_scan())
+            return results.export_columns(fields, dtypes)
         search.fields=fields
-        if flat:
-            return self.connection.search(search, indices=self.index, doc_types=self.type,
-                                          model=lambda x,y: y.get("fields", {}).get(fields[0], None))
-
         return self.connection.search(search, indices=self.index, doc_types=self.type)
 
     def dates(self, field_name, kind, order='ASC'):
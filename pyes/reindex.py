@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import copy
+import sys
+import threading
+import time
+import Queue
+
+from . import logger
+from .exceptions import InvalidQuery
+from .models import BulkHeaders, ListBulker
+from .query import Search, Query
+from .scroll import ParallelScan, load_state, save_state, shard_slices
+
+__all__ = ["Reindexer", "ReindexProgress"]
+
+_STOP_WRITER = object()
+
+#the hits of ES 0.19 have _parent and _routing in their fields, only if asked
+_META_FIELDS = ("_parent", "_routing")
+
+
+class ReindexProgress(object):
+    """
+    The progress of a Reindexer run: the documents of the slices opened so
+    far (``total``), ``read``, ``written``, ``failed`` (rejected by the
+    target, see Reindexer.on_failure) and ``skipped`` (dropped by the
+    transform), and the slices done (counting the ones done by the previous
+    runs of a checkpoint).
+    """
+
+    def __init__(self, slices):
+        self.slices = slices
+        self.slices_done = 0
+        self.total = 0
+        self.read = 0
+        self.written = 0
+        self.failed = 0
+        self.skipped = 0
+        self.start_time = time.time()
+        self.end_time = None
+
+    @property
+    def elapsed(self):
+        return (self.end_time or time.time()) - self.start_time
+
+    @property
+    def rate(self):
+        """The documents written per second"""
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0.0
+        return self.written / elapsed
+
+    @property
+    def eta(self):
+        """The seconds left to write the documents read, None if unknown"""
+        rate = self.rate
+        if not rate or not self.total:
+            return None
+        return max(0, self.total - self.written - self.failed - self.skipped) / rate
+
+    def as_dict(self):
+        return {"slices": self.slices, "slices_done": self.slices_done, "total": self.total,
+                "read": self.read, "written": self.written, "failed": self.failed,
+                "skipped": self.skipped, "elapsed": self.elapsed, "rate": self.rate, "eta": self.eta}
+
+    def __repr__(self):
+        return "<ReindexProgress %d/%d docs, %d/%d slices, %.1f docs/s>" % (
+            self.written, self.total, self.slices_done, self.slices, self.rate)
+
+
+class Reindexer(object):
+    """
+    Copy the documents of a search to an index, client side: the stock ES
+    servers have no reindex API.
+
+    The source is scanned by ``readers`` concurrent scroll contexts (see
+    ParallelScan; a slice for every shard of the indices by default), and
+    the hits are written to ``target_index`` of ``target_conn`` (conn by
+    default) in bulk requests of ``bulk_size`` documents by ``writers``
+    threads. The rejected items are retried up to ``max_attempts`` times
+    (see ListBulker); the items still failed are counted and passed to
+    ``on_failure(failures)`` as BulkItemFailure objects.
+
+    ``transform(hit)`` is called with every raw hit (_id, _type, _source...)
+    from the writer threads and returns the hit to write, possibly changed,
+    or None to skip it. The documents keep their _id and _type (unless
+    ``target_doc_type`` is given), and their _parent and _routing, which are
+    requested in the fields of the hits.
+
+    ``max_rate`` limits the documents sent per second. ``on_progress`` is
+    called with the ReindexProgress every ``progress_interval`` seconds and
+    at the end.
+
+    With ``checkpoint``, the path of a JSON file, the slices whose documents
+    are all written are recorded in the file: a run stopped by an error (or
+    killed) is resumed by running a Reindexer with the same slices and
+    checkpoint, which copies again only the slices not done.
+
+    Example:
+
+        reindexer = Reindexer(conn, MatchAllQuery(), "articles-v2", indices="articles-v1",
+                              transform=upgrade_article, max_rate=5000,
+                              checkpoint="/var/tmp/articles-v2.json")
+        progress = reindexer.run()
+    """
+
+    def __init__(self, conn, query, target_index, indices=None, doc_types=None, target_conn=None,
+                 target_doc_type=None, transform=None, slices=None, readers=4, writers=2,
+                 bulk_size=500, op_type="index", max_rate=None, max_attempts=3, checkpoint=None,
+                 scroll="10m", scan_size=100, on_failure=None, on_progress=None,
+                 progress_interval=10.0):
+        if isinstance(query, Search):
+            search = query
+        elif isinstance(query, (Query, dict)):
+            search = Search(query)
+        else:
+            raise InvalidQuery("Reindexer must be supplied with a Search or Query object, or a dict")
+        search = copy.copy(search)
+        fields = list(search.fields) if search.fields is not None else ["_source"]
+        search.fields = fields + [field for field in _META_FIELDS if field not in fields]
+        self.conn = conn
+        self.search = search
+        self.target_index = target_index
+        self.indices = indices
+        self.doc_types = doc_types
+        self.target_conn = target_conn or conn
+        self.target_doc_type = target_doc_type
+        self.transform = transform
+        self.slices = slices
+        self.readers = readers
+        self.writers = writers
+        self.bulk_size = bulk_size
+        self.op_type = op_type
+        self.max_rate = max_rate
+        self.max_attempts = max_attempts
+        self.checkpoint = checkpoint
+        self.scroll = scroll
+        self.scan_size = scan_size
+        self.on_failure = on_failure
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.progress = None
+        self._headers = BulkHeaders()
+        self._lock = threading.Lock()
+        self._error = None
+        self._done = set()
+        self._scanned = set()
+        self._pending = {}
+
+    def run(self):
+        """
+        Copy the documents, return the ReindexProgress. Raise the first error
+        of a reader or a writer, after stopping the others.
+        """
+        slices = self.slices
+        if slices is None:
+            slices = shard_slices(self.conn, self.indices)
+        self._done = self._load_checkpoint(len(slices))
+        self._scanned = set()
+        self._pending = {}
+        self._error = None
+        progress = self.progress = ReindexProgress(len(slices))
+        progress.slices_done = len(self._done)
+        positions = [position for position in xrange(len(slices)) if position not in self._done]
+
+        if positions:
+            self._copy(slices, positions, progress)
+        progress.end_time = time.time()
+        self._report_progress()
+        return progress
+
+    def _copy(self, slices, positions, progress):
+        scan = ParallelScan(self.conn, self.search, indices=self.indices, doc_types=self.doc_types,
+                            slices=[slices[position] for position in positions], workers=self.readers,
+                            prefetch=self.readers * 2, scroll=self.scroll,
+                            query_params={"size": self.scan_size})
+        batches = Queue.Queue(maxsize=self.writers * 2)
+        writers = []
+        for i in xrange(self.writers):
+            writer = threading.Thread(target=self._writer, args=(batches,), name="pyes-reindex-writer-%d" % i)
+            writer.daemon = True
+            writer.start()
+            writers.append(writer)
+
+        sent = 0
+        last_report = time.time()
+        try:
+            for position, hits in scan.iter_pages():
+                if self._error is not None:
+                    break
+                position = positions[position]
+                if hits is None:
+                    with self._lock:
+                        self._scanned.add(position)
+                        if not self._pending.get(position):
+                            self._slice_done(position)
+                    continue
+                with self._lock:
+                    progress.total = scan.total
+                    progress.read += len(hits)
+                for start in xrange(0, len(hits), self.bulk_size):
+                    batch = hits[start:start + self.bulk_size]
+                    sent += len(batch)
+                    self._throttle(sent, progress.start_time)
+                    with self._lock:
+                        self._pending[position] = self._pending.get(position, 0) + 1
+                    batches.put((position, batch))
+                if time.time() - last_report >= self.progress_interval:
+                    last_report = time.time()
+                    self._report_progress()
+        finally:
+            scan.close()
+            for writer in writers:
+                batches.put(_STOP_WRITER)
+            for writer in writers:
+                writer.join()
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+    def _throttle(self, sent, start_time):
+        if self.max_rate:
+            delay = float(sent) / self.max_rate - (time.time() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _writer(self, batches):
+        failures = []
+        bulker = ListBulker(self.target_conn, bulk_size=self.bulk_size, max_attempts=self.max_attempts,
+                            on_dead_letter=lambda failed, bulk_result: failures.extend(failed))
+        while True:
+            batch = batches.get()
+            if batch is _STOP_WRITER:
+                return
+            if self._error is not None:
+                # drain the queue, so that the reader never blocks
+                continue
+            position, hits = batch
+            try:
+                skipped = self._add_hits(bulker, hits)
+                bulker.flush_bulk(True)
+            except Exception:
+                logger.exception("Reindex writer failed")
+                with self._lock:
+                    if self._error is None:
+                        self._error = sys.exc_info()
+                continue
+            if failures and self.on_failure is not None:
+                try:
+                    self.on_failure(failures)
+                except Exception:
+                    logger.exception("Error in the reindex failure callback %r", self.on_failure)
+            with self._lock:
+                progress = self.progress
+                progress.written += len(hits) - skipped - len(failures)
+                progress.failed += len(failures)
+                progress.skipped += skipped
+                self._pending[position] -= 1
+                if not self._pending[position] and position in self._scanned:
+                    self._slice_done(position)
+            del failures[:]
+
+    def _add_hits(self, bulker, hits):
+        """
+        Add the commands writing the hits to the bulker, return the number of
+        hits skipped by the transform
+        """
+        skipped = 0
+        transform = self.transform
+        dumps = self.target_conn.codec.dumps
+        for hit in hits:
+            if transform is not None:
+                hit = transform(hit)
+                if hit is None:
+                    skipped += 1
+                    continue
+            fields = hit.get("fields") or {}
+            header = self._headers.header(self.op_type, self.target_index,
+                                          self.target_doc_type or hit["_type"], hit.get("_id"),
+                                          parent=fields.get("_parent"), routing=fields.get("_routing"))
+            bulker.add_raw(header, dumps(hit["_source"]))
+        return skipped
+
+    def _slice_done(self, position):
+        """
+        Record a slice whose documents are all written. Must be called
+        holding the lock.
+        """
+        self._done.add(position)
+        self.progress.slices_done += 1
+        if self.checkpoint is not None:
+            self._save_checkpoint()
+
+    def _load_checkpoint(self, slices):
+        if self.checkpoint is None:
+            return set()
+        state = load_state(self.checkpoint)
+        if state is None:
+            return set()
+        if state["slices"] != slices:
+            raise ValueError("The checkpoint %s has %d slices, not %d" % (self.checkpoint, state["slices"], slices))
+        return set(state["done"])
+
+    def _save_checkpoint(self):
+        progress = self.progress
+        save_state(self.checkpoint, {"slices": progress.slices, "done": sorted(self._done),
+                                     "written": progress.written, "failed": progress.failed,
+                                     "skipped": progress.skipped})
+
+    def _report_progress(self):
+        progress = self.progress
+        logger.info("Reindex to %s: %r", self.target_index, progress)
+        if self.on_progress is not None:
+            try:
+                self.on_progress(progress)
+            except Exception:
+                logger.exception("Error in the reindex progress callback %r", self.on_progress)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from collections import OrderedDict
+import json
+import re
+import threading
+import time
+
+__all__ = ["ResponseCache"]
+
+#the endpoints whose GET responses can be cached
+CACHEABLE_ENDPOINTS = frozenset(["_search", "_count", "_mget"])
+
+#the indices of an entry which is invalidated by a write to any index
+ANY_INDEX = frozenset(["_all"])
+
+
+def path_indices(path):
+    """
+    Return the indices named by a request path, ANY_INDEX if the path is not
+    restricted to some indices (i.e. "/_search", "/_mget", "/test-*/_search")
+    """
+    name = path.lstrip("/").split("/", 1)[0]
+    if not name or name.startswith("_") or "*" in name:
+        return ANY_INDEX
+    return frozenset(name.split(","))
+
+
+_BULK_INDEX_RE = re.compile(r'"_index"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def bulk_indices(payload):
+    """
+    Return the indices written by a bulk payload, ANY_INDEX if none is named
+    """
+    names = set()
+    for name in _BULK_INDEX_RE.findall(payload):
+        name = str(name)
+        names.add(json.loads('"%s"' % name) if "\\" in name else name)
+    if not names or "_all" in names:
+        return ANY_INDEX
+    return frozenset(names)
+
+
+class CacheEntry(object):
+    __slots__ = ("response", "indices", "expires", "size")
+
+    def __init__(self, response, indices, expires):
+        self.response = response
+        self.indices = indices
+        self.expires = expires
+        self.size = len(response.body or "")
+
+
+class PendingPut(object):
+    """
+    A response being fetched to be cached: it is stale, and not stored, if
+    its indices are written before it is put
+    """
+    __slots__ = ("indices", "stale")
+
+    def __init__(self, indices):
+        self.indices = indices
+        self.stale = False
+
+
+class ResponseCache(object):
+    """
+    A cache of the responses of the idempotent GET requests: the searches
+    (without scroll), the counts and the mgets, keyed by path, body and
+    parameters.
+
+    The entries expire after ``ttl`` seconds (the refresh interval of ES by
+    default) and the least recently used ones are evicted when the responses
+    hold more than ``max_bytes``. The writes sent by the ES object owning the
+    cache invalidate the entries of their indices: index, delete, the bulk
+    requests and indices.refresh. The writes of other clients are seen when
+    the entries expire. A response fetched while its indices are written is
+    not stored.
+
+    A write through an alias invalidates the entries of its indices and of
+    their other aliases, and the other way round, once the aliases are known
+    (see set_aliases, loaded by ES every ``alias_ttl`` seconds): the entries
+    of the names missing in the aliases are then invalidated by every write.
+    Without aliases the names are taken as concrete indices.
+
+    The responses are stored undecoded: every hit returns new objects.
+    """
+
+    def __init__(self, ttl=1.0, max_bytes=16 * 1024 * 1024, alias_ttl=60.0):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.alias_ttl = alias_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._pending = set()
+        #(alias -> its indices, index -> its aliases), None if not loaded
+        self._aliases = None
+        self._aliases_expire = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(request):
+        """
+        Return if the response of a RestRequest can be cached
+        """
+        endpoint = request.uri.rstrip("/").rsplit("/", 1)[-1]
+        if endpoint not in CACHEABLE_ENDPOINTS:
+            return False
+        params = request.parameters
+        return not params or ("scroll" not in params and params.get("search_type") != "scan")
+
+    @staticmethod
+    def make_key(request):
+        params = request.parameters
+        return request.uri, request.body, tuple(sorted(params.items())) if params else ()
+
+    def get(self, key):
+        """
+        Return the response stored with key, None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                if entry.expires > time.time():
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return entry.response
+                self.size -= entry.size
+            self.misses += 1
+            return None
+
+    def begin(self, key):
+        """
+        Record that the response of key is being fetched: the returned
+        PendingPut must be passed to put, or to discard if the response is
+        not stored
+        """
+        pending = PendingPut(self._entry_indices(key[0]))
+        with self._lock:
+            self._pending.add(pending)
+        return pending
+
+    def discard(self, pending):
+        with self._lock:
+            self._pending.discard(pending)
+
+    def put(self, key, response, pending=None):
+        """
+        Store a response, evicting the least recently used entries over the
+        byte budget. With the PendingPut returned by begin, the response is
+        dropped if its indices were written since.
+        """
+        entry = CacheEntry(response, self._entry_indices(key[0]), time.time() + self.ttl)
+        with self._lock:
+            if pending is not None:
+                self._pending.discard(pending)
+                if pending.stale:
+                    return
+            if entry.size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                key, old = self._entries.popitem(last=False)
+                self.size -= old.size
+                self.evictions += 1
+
+    def invalidate(self, indices=None):
+        """
+        Remove the entries of the given indices, all the entries if indices
+        is None or ANY_INDEX
+        """
+        with self._lock:
+            if indices is None or indices is ANY_INDEX:
+                for pending in self._pending:
+                    pending.stale = True
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self.size = 0
+                return
+            indices = self._expand_aliases(indices)
+            for pending in self._pending:
+                if pending.indices is ANY_INDEX or not pending.indices.isdisjoint(indices):
+                    pending.stale = True
+            for key, entry in self._entries.items():
+                if entry.indices is ANY_INDEX or not entry.indices.isdisjoint(indices):
+                    del self._entries[key]
+                    self.size -= entry.size
+                    self.invalidations += 1
+
+    def aliases_expired(self):
+        return time.time() >= self._aliases_expire
+
+    def expire_aliases(self):
+        self._aliases_expire = 0
+
+    def set_aliases(self, aliases):
+        """
+        Set the aliases of the cluster, given as the response of GET /_aliases:
+        {index: {"aliases": {alias: {...}}}}
+        """
+        alias_indices = {}
+        index_aliases = {}
+        for index, value in aliases.iteritems():
+            if not isinstance(value, dict):
+                continue
+            names = frozenset(value.get("aliases") or ())
+            index_aliases[index] = names
+            for alias in names:
+                alias_indices.setdefault(alias, set()).add(index)
+        with self._lock:
+            self._aliases = alias_indices, index_aliases
+            self._aliases_expire = time.time() + self.alias_ttl
+
+    def _entry_indices(self, path):
+        """
+        Return the indices of the entries of a path: ANY_INDEX for a name that
+        is neither a known index nor a known alias
+        """
+        indices = path_indices(path)
+        aliases = self._aliases
+        if aliases is None or indices is ANY_INDEX:
+            return indices
+        alias_indices, index_aliases = aliases
+        for name in indices:
+            if name not in index_aliases and name not in alias_indices:
+                return ANY_INDEX
+        return indices
+
+    def _expand_aliases(self, names):
+        """
+        Return the written names with their indices and all the aliases of
+        these indices
+        """
+        if self._aliases is None:
+            return names
+        alias_indices, index_aliases = self._aliases
+        concrete = set()
+        for name in names:
+            concrete.update(alias_indices.get(name, (name,)))
+        expanded = set(names)
+        expanded.update(concrete)
+        for index in concrete:
+            expanded.update(index_aliases.get(index, ()))
+        return expanded
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        return {"entries": len(self._entries), "size": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from collections import deque
+import copy
+import os
+import sys
+import threading
+import time
+import Queue
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from . import logger
+from .exceptions import ElasticSearchException, ReduceSearchPhaseException
+from .filters import ANDFilter, IdsFilter, RangeFilter
+from .utils import ESRange, make_path
+
+__all__ = ["ScanSlice", "ParallelScan", "ResumableScan", "PagePrefetcher", "OrderedFetcher", "shard_slices",
+           "range_slices", "ids_slices"]
+
+#how often a blocked worker checks if the scan was closed
+_POLL_INTERVAL = 0.1
+
+_SLICE_DONE = object()
+
+_NO_MORE_PAGES = object()
+
+_STOP_WORKER = object()
+
+
+class ScanSlice(object):
+    """
+    A part of a parallel scan.
+
+    The search of the slice is restricted with ``filter`` (ANDed with the
+    filter of the search, if any) and sent to ``indices`` (the scan ones if
+    None) with the extra ``query_params`` (i.e. preference="_shards:0").
+    """
+
+    def __init__(self, filter=None, indices=None, **query_params):
+        self.filter = filter
+        self.indices = indices
+        self.query_params = query_params
+
+    def __repr__(self):
+        return "ScanSlice(filter=%r, indices=%r, query_params=%r)" % (self.filter, self.indices,
+                                                                       self.query_params)
+
+
+def shard_slices(conn, indices=None):
+    """
+    Return a slice for every shard of the indices, routed with the
+    ``_shards`` preference.
+
+    :param conn: an ES object
+    :param indices: an index or a list of indices (default_indices if None)
+    """
+    indices = conn._validate_indices(indices)
+    settings = conn._send_request('GET', make_path(','.join(indices), "_settings"))
+    slices = []
+    for index in sorted(settings.keys()):
+        index_settings = settings[index]["settings"]
+        shards = int(index_settings.get("index.number_of_shards", 1))
+        for shard in xrange(shards):
+            slices.append(ScanSlice(indices=[index], preference="_shards:%d" % shard))
+    return slices
+
+
+def range_slices(field, bounds):
+    """
+    Return a slice for every range between two consecutive bounds: the lower
+    bound is included, the upper one excluded. Use None as first/last bound
+    for an open range.
+
+    Example:
+
+    range_slices("date", [None, datetime(2012, 1, 1), datetime(2012, 6, 1), None])
+    """
+    slices = []
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        qrange = ESRange(field, from_value=lower, to_value=upper)
+        if lower is not None:
+            qrange.include_lower = True
+        if upper is not None:
+            qrange.include_upper = False
+        slices.append(ScanSlice(filter=RangeFilter(qrange)))
+    return slices
+
+
+def ids_slices(ids, count, doc_type=None):
+    """
+    Partition a list of ids in ``count`` slices
+    """
+    ids = list(ids)
+    step = -(-len(ids) // count)
+    return [ScanSlice(filter=IdsFilter(ids[pos:pos + step], type=doc_type))
+            for pos in xrange(0, len(ids), step or 1)]
+
+
+class ParallelScan(object):
+    """
+    Scan a search with several concurrent scroll contexts.
+
+    Every slice (see ScanSlice) opens its own scroll context, which is drained
+    by a pool of ``workers`` threads. The hits of all the slices are yielded
+    by a single iterator, with no ordering between the slices. At most
+    ``prefetch`` pages are fetched ahead of the consumer.
+
+    If the iteration is stopped early, ``close()`` stops the workers (it is
+    called when the iterator is garbage collected or closed).
+
+    ``iter_pages()`` iterates over the raw pages instead, telling the slice
+    of every page and when a slice is over.
+    """
+
+    def __init__(self, conn, search, indices=None, doc_types=None, slices=None,
+                 workers=4, prefetch=4, scroll="10m", model=None, query_params=None):
+        self.conn = conn
+        self.search = search
+        self.indices = indices
+        self.doc_types = doc_types
+        self.slices = slices
+        self.workers = workers
+        self.prefetch = prefetch
+        self.scroll = scroll
+        self.model = model or conn.model
+        self.query_params = query_params or {}
+        self.total = 0
+        self._pages = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def __iter__(self):
+        return self._iter_hits(self.iter_pages())
+
+    def iter_pages(self):
+        """
+        Start the scan and return an iterator over (position, hits) tuples:
+        the position of the slice in ``slices`` and the raw hits of a page of
+        this slice, None once the slice is scanned to its end.
+        """
+        if self._pages is not None:
+            raise RuntimeError("A ParallelScan can be iterated only once")
+        slices = self.slices
+        if slices is None:
+            slices = shard_slices(self.conn, self.indices)
+        tasks = Queue.Queue()
+        for position, scan_slice in enumerate(slices):
+            if not isinstance(scan_slice, ScanSlice):
+                scan_slice = ScanSlice(filter=scan_slice)
+            tasks.put((position, scan_slice))
+        self._pages = Queue.Queue(maxsize=self.prefetch)
+
+        workers = min(self.workers, tasks.qsize())
+        for i in xrange(workers):
+            thread = threading.Thread(target=self._worker, args=(tasks,),
+                                      name="pyes-scan-%d" % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return self._iter_pages(workers)
+
+    def _iter_pages(self, workers):
+        try:
+            while workers:
+                page = self._pages.get()
+                if page is _SLICE_DONE:
+                    workers -= 1
+                elif page[0] is None:
+                    # a worker failed: (None, (exc_type, exc_value, traceback))
+                    exc_info = page[1]
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                else:
+                    yield page
+        finally:
+            self.close()
+
+    def _iter_hits(self, pages):
+        model = self.model
+        conn = self.conn
+        for position, hits in pages:
+            if hits is not None:
+                for hit in hits:
+                    yield model(conn, hit)
+
+    def close(self):
+        """
+        Stop the workers
+        """
+        self._stopped.set()
+
+    def _put(self, page):
+        while not self._stopped.is_set():
+            try:
+                self._pages.put(page, timeout=_POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _worker(self, tasks):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    position, scan_slice = tasks.get_nowait()
+                except Queue.Empty:
+                    break
+                self._scan_slice(position, scan_slice)
+        except Exception:
+            logger.exception("Parallel scan worker failed")
+            self._put((None, sys.exc_info()))
+        self._put(_SLICE_DONE)
+
+    def _scan_slice(self, position, scan_slice):
+        search = self.search
+        if scan_slice.filter is not None:
+            search = copy.copy(search)
+            if search.filter:
+                search.filter = ANDFilter([search.filter, scan_slice.filter])
+            else:
+                search.filter = scan_slice.filter
+        query_params = dict(self.query_params)
+        query_params.update(scan_slice.query_params)
+        query_params.update(search_type="scan", scroll=self.scroll)
+        indices = scan_slice.indices or self.indices
+
+        results = self.conn.search_raw(search, indices=indices, doc_types=self.doc_types,
+                                       **query_params)
+        with self._lock:
+            self.total += results["hits"]["total"]
+        scroll_id = results["_scroll_id"]
+        while not self._stopped.is_set():
+            try:
+                results = self.conn.search_scroll(scroll_id, self.scroll)
+            except ReduceSearchPhaseException:
+                #as in ResultSet, there are no hits on the last iteration
+                hits = None
+            else:
+                hits = results["hits"]["hits"]
+            if not hits:
+                self._put((position, None))
+                break
+            if not self._put((position, hits)):
+                break
+            scroll_id = results["_scroll_id"]
+
+
+def load_state(path):
+    """
+    Return the JSON state stored in a file, None if the file is missing
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save_state(path, state):
+    """
+    Store a JSON state in a file: the state is written aside then renamed,
+    so that the file is never half written
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as state_file:
+        json.dump(state, state_file)
+    os.rename(tmp_path, path)
+
+
+class ResumableScan(object):
+    """
+    Scroll a search in a resumable way.
+
+    The hits are sorted on ``sort_field`` (then on _uid, to break the ties),
+    and the state of the scan is saved to the JSON file ``checkpoint`` every
+    ``checkpoint_interval`` seconds and when the iteration stops: the query,
+    the sort values of the last hit yielded (the watermark), the number of
+    hits yielded and the total.
+
+    A ResumableScan created with the checkpoint of an interrupted scan (of
+    the same query, indices, doc_types and sort_field) yields the hits after
+    the watermark: it opens a scroll restricted to the hits sorted after it,
+    search-after style. A scroll context expiring while the hits are
+    consumed is reopened the same way. A hit is saved as yielded once it is
+    returned by the iterator: the hits yielded since the last save are
+    yielded again if the process is killed.
+
+    Once the scan is over, the checkpoint is marked done: scanning again
+    yields nothing, until the file is removed.
+
+    The search must not have a sort of its own, nor a start. The sorted
+    scroll is slower than a scan (search_type=scan), which cannot be
+    resumed.
+
+    Example:
+
+        scan = conn.resumable_scan(MatchAllQuery(), "/var/tmp/export.json", "test-index")
+        for hit in scan:
+            ...
+    """
+
+    def __init__(self, conn, search, checkpoint, indices=None, doc_types=None, sort_field="_uid",
+                 size=100, scroll="10m", checkpoint_interval=5.0, model=None, query_params=None):
+        self.conn = conn
+        self.search = search
+        self.checkpoint = checkpoint
+        self.indices = indices
+        self.doc_types = doc_types
+        self.sort_field = sort_field
+        self.size = size
+        self.scroll = scroll
+        self.checkpoint_interval = checkpoint_interval
+        self.model = model or conn.model
+        self.query_params = query_params or {}
+        self.total = 0
+        self.count = 0
+        self.watermark = None
+        self.done = False
+        self._key = None
+        self._last_save = 0
+
+    def __iter__(self):
+        self._key = json.dumps([self.conn._encode_search(self.search), self.indices, self.doc_types,
+                                self.sort_field])
+        state = load_state(self.checkpoint)
+        if state is not None:
+            if state["scan"] != self._key:
+                raise ValueError("The checkpoint %s is the one of another scan" % self.checkpoint)
+            self.total = state["total"]
+            self.count = state["count"]
+            self.watermark = state["watermark"]
+            self.done = state["done"]
+        if self.done:
+            return iter(())
+        return self._iter_hits()
+
+    def save(self):
+        """
+        Save the state of the scan to the checkpoint
+        """
+        self._last_save = time.time()
+        save_state(self.checkpoint, {"scan": self._key, "total": self.total, "count": self.count,
+                                     "watermark": self.watermark, "done": self.done})
+
+    def _iter_hits(self):
+        model = self.model
+        conn = self.conn
+        try:
+            results = self._open_scroll()
+            if self.watermark is None:
+                self.total = results["hits"]["total"]
+            while True:
+                hits = results["hits"]["hits"]
+                if not hits:
+                    break
+                for hit in hits:
+                    sort = hit["sort"]
+                    watermark = self.watermark
+                    # the range filter includes the hits of the watermark value
+                    if watermark is not None and sort[0] == watermark[0] and sort <= watermark:
+                        continue
+                    if time.time() - self._last_save >= self.checkpoint_interval:
+                        self.save()
+                    self.count += 1
+                    self.watermark = sort
+                    yield model(conn, hit)
+                try:
+                    results = conn.search_scroll(results["_scroll_id"], self.scroll)
+                except ReduceSearchPhaseException:
+                    #as in ResultSet, there are no hits on the last iteration
+                    break
+                except ElasticSearchException:
+                    logger.warning("The scroll context of %s was lost, reopening it after %r",
+                                   self.checkpoint, self.watermark)
+                    results = self._open_scroll()
+            self.done = True
+        finally:
+            self.save()
+
+    def _open_scroll(self):
+        """
+        Open a scroll over the hits sorted from the watermark
+        """
+        search = copy.copy(self.search)
+        search.sort = [{self.sort_field: "asc"}]
+        if self.sort_field != "_uid":
+            search.sort.append({"_uid": "asc"})
+        search.size = self.size
+        if self.watermark is not None:
+            qrange = ESRange(self.sort_field, from_value=self.watermark[0], include_lower=True)
+            if search.filter:
+                search.filter = ANDFilter([search.filter, RangeFilter(qrange)])
+            else:
+                search.filter = RangeFilter(qrange)
+        query_params = dict(self.query_params)
+        query_params["scroll"] = self.scroll
+        return self.conn.search_raw(search, indices=self.indices, doc_types=self.doc_types, **query_params)
+
+
+class PagePrefetcher(object):
+    """
+    Fetch pages from a background thread, at most ``depth`` pages ahead of
+    the consumer.
+
+    ``fetch_page`` is called repeatedly to get the next page: it returns
+    the raw search results, or None when there are no more pages. Fetching
+    stops after a page without hits.
+    """
+
+    def __init__(self, fetch_page, depth=1):
+        self.fetch_page = fetch_page
+        self._pages = Queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, name="pyes-prefetch")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get(self):
+        """
+        Return the next page, or None if there are no more pages
+        """
+        if self._done:
+            return None
+        page = self._pages.get()
+        if page is _NO_MORE_PAGES:
+            self._done = True
+            return None
+        if isinstance(page, tuple):
+            # the fetch failed: (exc_type, exc_value, traceback)
+            self._done = True
+            raise page[0], page[1], page[2]
+        return page
+
+    def close(self):
+        """
+        Stop fetching pages
+        """
+        self._stopped.set()
+
+    def _put(self, page):
+        while not self._stopped.is_set():
+            try:
+                self._pages.put(page, timeout=_POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                page = self.fetch_page()
+                if page is None:
+                    break
+                if not self._put(page) or not page.get("hits", {}).get("hits"):
+                    break
+        except Exception:
+            self._put(sys.exc_info())
+            return
+        self._put(_NO_MORE_PAGES)
+
+
+class OrderedFetcher(object):
+    """
+    Call ``fetch(task)`` for every task from ``workers`` threads, yielding
+    the results in the order of the tasks. At most ``depth`` tasks (default:
+    ``workers``) are fetched ahead of the consumer.
+
+    If the iteration is stopped early, the tasks not started yet are
+    skipped.
+    """
+
+    def __init__(self, fetch, tasks, workers=4, depth=None):
+        self.fetch = fetch
+        self.tasks = tasks
+        self.workers = workers
+        self.depth = depth or workers
+        self._stopped = threading.Event()
+
+    def __iter__(self):
+        tasks = iter(self.tasks)
+        queue = Queue.Queue()
+        pending = deque()
+
+        def submit():
+            for task in tasks:
+                slot = Queue.Queue(maxsize=1)
+                queue.put((task, slot))
+                pending.append(slot)
+                return
+
+        for i in xrange(self.depth):
+            submit()
+        workers = min(self.workers, len(pending))
+        for i in xrange(workers):
+            thread = threading.Thread(target=self._worker, args=(queue,), name="pyes-fetch-%d" % i)
+            thread.daemon = True
+            thread.start()
+        try:
+            while pending:
+                result = pending.popleft().get()
+                if isinstance(result, tuple):
+                    # the fetch failed: (exc_type, exc_value, traceback)
+                    raise result[0], result[1], result[2]
+                submit()
+                yield result[0]
+        finally:
+            self.close()
+            for i in xrange(workers):
+                queue.put(_STOP_WORKER)
+
+    def close(self):
+        """
+        Skip the tasks not started yet
+        """
+        self._stopped.set()
+
+    def _worker(self, queue):
+        while True:
+            item = queue.get()
+            if item is _STOP_WORKER:
+                break
+            task, slot = item
+            if self._stopped.is_set():
+                continue
+            try:
+                slot.put([self.fetch(task)])
+            except Exception:
+                slot.put(sys.exc_info())
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import re
+import threading
+
+from . import logger
+
+__all__ = ["Sniffer", "parse_http_address"]
+
+#i.e. inet[/127.0.0.1:9200] or inet[hostname/127.0.0.1:9200]
+_INET_RE = re.compile(r"^inet\[([^/\]]*)/([^\]]+)\]$")
+
+#the shortest time between two sniffs triggered by failures
+_MIN_FAILURE_INTERVAL = 1.0
+
+
+def parse_http_address(address, scheme="http"):
+    """
+    Return the url of an ``http_address`` of the nodes info API, or None if
+    it can't be parsed
+    """
+    match = _INET_RE.match(address)
+    if match:
+        address = match.group(2)
+    elif address.startswith("inet["):
+        return None
+    return "%s://%s" % (scheme, address)
+
+
+class Sniffer(object):
+    """
+    Keep the servers of an ES object in sync with the nodes of the cluster.
+
+    The nodes info API is read every ``interval`` seconds (if not None) and,
+    if ``on_connection_fail`` is set, as soon as a server fails. The servers
+    joining the cluster are added to the http connection, the ones leaving it
+    are removed: the pools of the other servers are kept.
+    """
+
+    def __init__(self, conn, interval=None, on_connection_fail=False):
+        self.conn = conn
+        self.interval = interval
+        self.on_connection_fail = on_connection_fail
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pyes-sniffer")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def node_failed(self, node):
+        """
+        Called by the connection when a server fails
+        """
+        if self.on_connection_fail:
+            self._wakeup.set()
+
+    def sniff(self):
+        """
+        Read the nodes of the cluster and update the servers.
+
+        :return: the (added, removed) urls
+        """
+        data = self.conn.cluster.nodes_info()
+        self.conn.cluster_name = data.get("cluster_name", self.conn.cluster_name)
+        schemes = set(server.scheme for server in self.conn.servers if server.scheme in ["http", "https"])
+        scheme = "https" if schemes == set(["https"]) else "http"
+        urls = []
+        for nodedata in data.get("nodes", {}).values():
+            address = nodedata.get("http_address")
+            url = parse_http_address(address, scheme) if address else None
+            if url:
+                urls.append(url)
+        if not urls:
+            logger.warning("Sniffing found no http server: keeping %s", self.conn.servers)
+            return [], []
+        return self.conn._set_http_servers(urls)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            if self._stopped.is_set():
+                return
+            woken = self._wakeup.is_set()
+            self._wakeup.clear()
+            try:
+                self.sniff()
+            except ReferenceError:
+                #the ES object was garbage collected
+                return
+            except Exception:
+                logger.exception("Sniffing the cluster nodes failed")
+            if woken:
+                #don't sniff continuously while the servers keep failing
+                self._stopped.wait(_MIN_FAILURE_INTERVAL)
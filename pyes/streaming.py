@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from collections import deque
+import re
+
+__all__ = ["HitStream"]
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+#the characters which can follow a value
+_DELIMITERS = frozenset(",:]}")
+
+#yielded by the parser after every value which is not a hit
+_VALUE = object()
+
+
+class HitStream(object):
+    """
+    A search or scroll response decoded as it is read: the hits are decoded
+    and yielded one at a time, so that the memory used is bounded by a hit
+    (and a read chunk) rather than by the whole page.
+
+    The other values of the response are available as soon as they are
+    read: ``total``, ``max_score``, ``scroll_id``, ``took`` come before the
+    hits in the ES responses, ``facets`` after them. Reading a value which
+    follows the hits not iterated yet keeps these hits in memory.
+
+    The stream must be iterated to the end or closed to release its
+    connection.
+
+    Example:
+
+        stream = conn.search_raw(query, "test-index", size=5000, stream=True)
+        print stream.total
+        for hit in stream:
+            ...
+        print stream.facets
+    """
+
+    def __init__(self, chunks, decode, close=None, convert=None):
+        """
+        chunks: an iterable of byte strings, the response body
+        decode: a function decoding the JSON value at an index of a string,
+                returning the value and its end (see JSONCodec.raw_decode)
+        close: called once with True if the whole response was read, False
+               if the stream was closed before
+        convert: called with every hit, i.e. MappingDecoder.convert_document
+        """
+        self.response = {}
+        self._chunks = iter(chunks)
+        self._decode = decode
+        self._close = close
+        self._convert = convert
+        self._buffer = ""
+        self._pos = 0
+        self._pending = deque()
+        self._parser = self._parse()
+        self._done = False
+
+    def __iter__(self):
+        while True:
+            if self._pending:
+                yield self._pending.popleft()
+                continue
+            event = self._next_event()
+            if event is None:
+                return
+            if event is not _VALUE:
+                yield event
+
+    def close(self):
+        """
+        Stop reading the response, releasing its connection
+        """
+        self._finish(False)
+
+    def get(self, name, default=None):
+        """
+        Return a top level value of the response, reading up to it if needed
+        """
+        self._read_until(lambda: name in self.response)
+        return self.response.get(name, default)
+
+    def _get_hits_value(self, name, default=None):
+        self._read_until(lambda: name in self.response.get("hits", ()))
+        return self.response.get("hits", {}).get(name, default)
+
+    @property
+    def total(self):
+        return self._get_hits_value("total", 0)
+
+    @property
+    def max_score(self):
+        return self._get_hits_value("max_score")
+
+    @property
+    def scroll_id(self):
+        return self.get("_scroll_id")
+
+    @property
+    def took(self):
+        return self.get("took")
+
+    @property
+    def timed_out(self):
+        return self.get("timed_out")
+
+    @property
+    def shards(self):
+        return self.get("_shards")
+
+    @property
+    def facets(self):
+        return self.get("facets", {})
+
+    def _read_until(self, known):
+        while not known():
+            event = self._next_event()
+            if event is None:
+                return
+            if event is not _VALUE:
+                self._pending.append(event)
+
+    def _next_event(self):
+        """
+        Parse up to the next value, return None at the end of the response
+        """
+        if self._done:
+            return None
+        try:
+            return self._parser.next()
+        except StopIteration:
+            self._finish(True)
+            return None
+        except Exception:
+            self._finish(False)
+            raise
+
+    def _finish(self, complete):
+        if self._done:
+            return
+        self._done = True
+        self._buffer = ""
+        if self._close is not None:
+            self._close(complete)
+
+    def _parse(self):
+        """
+        Parse the response, yielding the hits as they are decoded and _VALUE
+        after the other values, which are stored in self.response
+        """
+        self._expect("{")
+        for key in self._keys():
+            if key == "hits" and self._skip_whitespace() == "{":
+                self._pos += 1
+                hits = self.response["hits"] = {}
+                for hits_key in self._keys():
+                    if hits_key == "hits" and self._skip_whitespace() == "[":
+                        self._pos += 1
+                        for hit in self._items():
+                            if self._convert is not None:
+                                self._convert(hit)
+                            yield hit
+                    else:
+                        hits[hits_key] = self._value()
+                        yield _VALUE
+            else:
+                self.response[key] = self._value()
+                yield _VALUE
+
+    def _keys(self):
+        """
+        Yield the keys of the object being read; the value of every key must
+        be read before the next one
+        """
+        if self._skip_whitespace() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            yield key
+            char = self._skip_whitespace()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or '}' at %d of the response" % self._pos)
+
+    def _items(self):
+        """
+        Yield the decoded values of the array being read
+        """
+        if self._skip_whitespace() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            char = self._skip_whitespace()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or ']' at %d of the response" % self._pos)
+
+    def _value(self):
+        """
+        Decode the value at the current position, reading more chunks until
+        it is whole. A value is known to be whole when a delimiter follows it:
+        a number could go on in the next chunk.
+        """
+        self._skip_whitespace()
+        needed = 0
+        exhausted = False
+        while True:
+            buffer = self._buffer
+            if len(buffer) - self._pos >= needed:
+                try:
+                    value, end = self._decode(buffer, self._pos)
+                except ValueError:
+                    # wait for twice the data before decoding again, so that
+                    # a big value is decoded a few times, not once per chunk
+                    needed = 2 * (len(buffer) - self._pos)
+                else:
+                    following = _WHITESPACE_RE.match(buffer, end).end()
+                    if following < len(buffer) and buffer[following] in _DELIMITERS:
+                        self._pos = end
+                        return value
+                    needed = len(buffer) - self._pos + 1
+            if not self._read_chunk():
+                if exhausted:
+                    raise ValueError("Truncated response")
+                # decode once more with all the data
+                exhausted = True
+                needed = 0
+
+    def _skip_whitespace(self):
+        """
+        Move to the next significant character and return it
+        """
+        while True:
+            self._pos = _WHITESPACE_RE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_chunk():
+                raise ValueError("Truncated response")
+
+    def _expect(self, char):
+        if self._skip_whitespace() != char:
+            raise ValueError("Expected %r at %d of the response" % (char, self._pos))
+        self._pos += 1
+
+    def _read_chunk(self):
+        """
+        Append the next chunk to the buffer, dropping the data already
+        decoded. Return False at the end of the response.
+        """
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
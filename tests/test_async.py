@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import unittest
+from .estestcase import ESTestCase
+from pyes.exceptions import NotFoundException, SearchPhaseExecutionException
+from pyes.multisearch import MultiSearch, SearchBatcher
+from pyes.query import MatchAllQuery, TermQuery
+
+try:
+    from tornado import gen, ioloop
+    from pyes.async_es import AsyncES
+except ImportError:
+    AsyncES = None
+
+
+@unittest.skipIf(AsyncES is None, "tornado is not installed")
+class AsyncESTestCase(ESTestCase):
+    def setUp(self):
+        super(AsyncESTestCase, self).setUp()
+        self.init_default_index()
+        for i in xrange(25):
+            self.conn.index({"name": "Joe Tester%d" % i, "parsedtext": "Joe Testere nice guy", "uuid": "11111",
+                             "position": i}, self.index_name, self.document_type, i, bulk=True)
+        self.conn.refresh(self.index_name)
+        self.async_conn = AsyncES(("http", "127.0.0.1", 9200), bulk_size=10)
+
+    def run_async(self, func):
+        return ioloop.IOLoop.current().run_sync(func)
+
+    def test_search_get_mget(self):
+        @gen.coroutine
+        def run():
+            results = yield self.async_conn.search(TermQuery("uuid", "11111"), self.index_name, size=5)
+            self.assertEqual(results.total, 25)
+            self.assertEqual(len([hit for hit in results]), 5)
+            doc = yield self.async_conn.get(self.index_name, self.document_type, 3)
+            self.assertEqual(doc.position, 3)
+            docs = yield self.async_conn.mget([1, 2], self.index_name, self.document_type)
+            self.assertEqual([doc.position for doc in docs], [1, 2])
+        self.run_async(run)
+
+    def test_bulk_and_scan(self):
+        @gen.coroutine
+        def run():
+            yield self.async_conn.index({"name": "Bill", "position": 100}, self.index_name,
+                                        self.document_type, 100, bulk=True)
+            bulk_result = yield self.async_conn.bulk()
+            self.assertEqual(len(bulk_result["items"]), 1)
+            yield self.async_conn.indices.refresh(self.index_name)
+
+            scroller = self.async_conn.scan(MatchAllQuery(), self.index_name, size=10)
+            positions = []
+            while True:
+                hits = yield scroller.next_page()
+                if not hits:
+                    break
+                positions.extend(hit.position for hit in hits)
+            self.assertEqual(sorted(positions), range(25) + [100])
+        self.run_async(run)
+
+
+@unittest.skipIf(AsyncES is None, "tornado is not installed")
+class AsyncESUnsupportedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.async_conn = AsyncES(("http", "127.0.0.1", 9200))
+
+    def tearDown(self):
+        self.async_conn.close()
+
+    def test_no_urllib3_pools(self):
+        self.assertEqual([node.pool for node in self.async_conn.connection.nodes], [None])
+
+    def test_blocking_methods(self):
+        self.assertRaises(ValueError, self.async_conn.parallel_scan, MatchAllQuery(), "test-index")
+        self.assertRaises(ValueError, self.async_conn.resumable_scan, MatchAllQuery(), "/tmp/checkpoint")
+        self.assertRaises(ValueError, self.async_conn.update, {"name": "Joe"}, "test-index", "test-type", 1)
+
+    def test_mget_chunks(self):
+        requests = []
+
+        @gen.coroutine
+        def send_request(method, path, body=None, params=None, headers=None, raw=False):
+            requests.append(params)
+            raise gen.Return({"docs": [dict(doc, _source={}, exists=doc["_id"] != 3) for doc in body["docs"]]})
+
+        self.async_conn._send_request = send_request
+        mget = lambda missing: ioloop.IOLoop.current().run_sync(
+            lambda: self.async_conn.mget(range(5), "test-index", "test-type", chunk_size=2, workers=2,
+                                         missing=missing))
+        self.assertEqual([doc._meta.id for doc in mget("skip")], [0, 1, 2, 4])
+        self.assertEqual(requests, [{}, {}, {}])
+        self.assertEqual(len(mget("include")), 5)
+        self.assertRaises(NotFoundException, mget, "raise")
+        self.assertRaises(ValueError, self.async_conn.iter_mget, range(5), "test-index", "test-type")
+
+    def test_multi_search(self):
+        bodies = []
+
+        @gen.coroutine
+        def send_request(method, path, body=None, params=None, headers=None, raw=False):
+            bodies.append(body)
+            raise gen.Return({"responses": [
+                {"hits": {"total": 2, "hits": [{"_id": "1", "_source": {"name": "Joe"}}]}},
+                {"error": "SearchPhaseExecutionException[Failed to execute phase [query]]", "status": 500}]})
+
+        self.async_conn._send_request = send_request
+        searches = MultiSearch(self.async_conn, raise_on_error=False)
+        searches.add(TermQuery("name", "joe"), "test-index", size=1)
+        searches.add(MatchAllQuery(), "test-index", "test-type", search_type="count")
+        joe, error = ioloop.IOLoop.current().run_sync(searches.execute)
+        self.assertEqual((joe.total, [hit.name for hit in joe]), (2, ["Joe"]))
+        self.assertTrue(isinstance(error, SearchPhaseExecutionException))
+        lines = bodies[0].split("\n")
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(self.async_conn.codec.loads(lines[1])["size"], 1)
+        self.assertEqual(self.async_conn.codec.loads(lines[2])["search_type"], "count")
+        self.assertRaises(SearchPhaseExecutionException, ioloop.IOLoop.current().run_sync,
+                          lambda: self.async_conn.multi_search([MatchAllQuery(), MatchAllQuery()]))
+        self.assertRaises(ValueError, SearchBatcher, self.async_conn)
+
+    def test_no_streaming(self):
+        self.assertRaises(ValueError, self.async_conn.search_raw, MatchAllQuery(), "test-index", stream=True)
+        self.assertRaises(ValueError, self.async_conn.search_scroll, "scroll-id", stream=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
-from .estestcase import ESTestCase
-from pyes.models import _is_bulk_item_ok, _raise_exception_if_bulk_item_failed
+import functools
+import json
+import threading
+import time
+import unittest
+from .estestcase import ESTestCase, get_conn
+from pyes.es import ES
+from pyes.models import _is_bulk_item_ok, _raise_exception_if_bulk_item_failed, _get_bulk_item_failures, \
+    BulkHeaders, ListBulker, ThreadedBulker
 from pyes.query import TermQuery
-from pyes.exceptions import BulkOperationException
+from pyes.exceptions import BulkOperationException, ElasticSearchException
 
 class BulkTestCase(ESTestCase):
     def setUp(self):
@@ -89,6 +96,47 @@ class BulkTestCase(ESTestCase):
 
         self.conn.refresh(self.index_name)
 
+    def test_bulk_bytes_flush(self):
+        self.conn.force_bulk()
+        self.conn.bulk_size = 100
+        self.conn.bulk_bytes = 300
+        self.conn.raise_on_bulk_item_failure = False
+
+        self.assertIsNone(self.conn.index({"name": "Joe Tester", "parsedtext": "Joe Testere nice guy" * 5},
+            self.index_name, self.document_type, 1, bulk=True))
+        self.assertEqual(len(self.conn.bulker.bulk_data), 1)
+        self.assertTrue(self.conn.bulker.bulk_data[0] < 300)
+
+        bulk_result = self.conn.index({"name": "Bill Baloney", "parsedtext": "Bill Testere nice guy" * 5},
+            self.index_name, self.document_type, 2, bulk=True)
+        self.assertEquals(len(bulk_result['items']), 1)
+        self.assertEqual(len(self.conn.bulker.bulk_data), 1)
+
+        bulk_result = self.conn.force_bulk()
+        self.assertEquals(len(bulk_result['items']), 1)
+        self.assertEqual(self.conn.bulker.bulk_data, [])
+        self.assertEqual(len(self.conn.bulker.bulk_payload), 0)
+        self.conn.bulk_bytes = None
+
+    def test_threaded_bulker(self):
+        failures = []
+        conn = get_conn(bulk_size=2,
+                        bulker_class=functools.partial(ThreadedBulker, workers=2, queue_size=1,
+                                                       on_bulk_item_failure=lambda errors, result: failures.extend(errors)))
+        for i in range(5):
+            self.assertIsNone(conn.index({"name": "Joe Tester %d" % i, "uuid": str(i), "position": i},
+                self.index_name, self.document_type, i, bulk=True))
+        self.assertIsNone(conn.index("invalid", self.index_name, self.document_type, 5, bulk=True))
+        bulk_result = conn.force_bulk()
+        self.assertTrue("items" in bulk_result)
+        self.assertFalse(conn.bulker)
+        self.assertEquals(len(failures), 1)
+        self.assertTrue("error" in failures[0]["index"])
+        conn.bulker.close()
+
+        conn.refresh(self.index_name)
+        self.assertEquals(conn.count(indices=self.index_name).count, 5)
+
     def test_error(self):
         self.conn.force_bulk()
         self.conn.bulk_size = 2
@@ -239,3 +287,170 @@ class BulkTestCase(ESTestCase):
         with self.assertRaises(BulkOperationException) as cm:
             self.conn.index(
                 "invalid", self.index_name, self.document_type, 8, bulk=True)
+
+    def test_bulk_item_failures(self):
+        create_ok = {'create': {'_type': 'test-type', '_id': '1', 'ok': True, '_version': 1, '_index': 'test-index'}}
+        self.assertTrue(_is_bulk_item_ok(create_ok))
+        self.assertTrue(_is_bulk_item_ok({'update': {'_id': '1', 'status': 200}}))
+        self.assertFalse(_is_bulk_item_ok({'index': {'_id': '1', 'status': 429,
+                                                     'error': 'EsRejectedExecutionException[rejected]'}}))
+
+        commands = ['{"create": {"_index": "test-index", "_type": "test-type", "_id": "1"}}\n{"name": "Joe"}',
+                    '{"index": {"_index": "test-index", "_type": "test-type", "_id": "2"}}\n"invalid"',
+                    '{"delete": {"_index": "test-index", "_type": "#foo", "_id": "3"}}']
+        payload = bytearray()
+        ends = []
+        for command in commands:
+            payload += command + "\n"
+            ends.append(len(payload))
+        bulk_result = {'took': 1, 'items': [
+            create_ok,
+            {'index': {'_type': 'test-type', '_id': '2', '_index': 'test-index',
+                       'error': 'ElasticSearchParseException[Failed to derive xcontent]'}},
+            {'delete': {'_type': '#foo', '_id': '3', '_index': 'test-index',
+                        'error': "InvalidTypeNameException[mapping type name [#foo] should not include '#' in it]"}}]}
+        failures = _get_bulk_item_failures(bulk_result, payload, ends)
+        self.assertEqual([failure.position for failure in failures], [1, 2])
+        self.assertEqual([failure.op for failure in failures], ["index", "delete"])
+        self.assertEqual([failure.action for failure in failures], commands[1:])
+        self.assertEqual(_get_bulk_item_failures({'errors': False, 'items': [{}]}), [])
+
+        with self.assertRaises(BulkOperationException) as cm:
+            _raise_exception_if_bulk_item_failed(bulk_result, payload, ends)
+        self.assertEqual(cm.exception.errors, bulk_result["items"][1:])
+        self.assertEqual([failure.action for failure in cm.exception.failures], commands[1:])
+
+        # the failed actions are sent again
+        self.conn.force_bulk()
+        self.conn.raise_on_bulk_item_failure = True
+        self.conn.index({"name": "Joe"}, self.index_name, self.document_type, 1, bulk=True, force_insert=True)
+        self.conn.index("invalid", self.index_name, self.document_type, 2, bulk=True)
+        with self.assertRaises(BulkOperationException) as cm:
+            self.conn.force_bulk()
+        self.assertEqual([failure.position for failure in cm.exception.failures], [1])
+        self.conn.bulker.add(cm.exception.failures[0].action.replace('"invalid"', '{"name": "Bill"}'))
+        self.assertTrue(_is_bulk_item_ok(self.conn.force_bulk()["items"][0]))
+
+    def test_bulk_retries(self):
+        rejected = {'status': 429, 'error': 'EsRejectedExecutionException[rejected execution]'}
+        responses = [
+            ElasticSearchException("Unavailable", 503),
+            {'took': 1, 'errors': True, 'items': [
+                {'index': {'_id': '1', 'status': 201}},
+                {'index': dict(rejected, _id='2')},
+                {'index': {'_id': '3', 'status': 400, 'error': 'MapperParsingException[failed to parse]'}},
+                {'index': dict(rejected, _id='4')}]},
+            {'took': 1, 'errors': True, 'items': [
+                {'index': {'_id': '2', 'status': 201}},
+                {'index': dict(rejected, _id='4')}]},
+            {'took': 1, 'errors': True, 'items': [
+                {'index': dict(rejected, _id='4')}]}]
+        sent = []
+        dead_letters = []
+
+        class ScriptedBulker(ListBulker):
+            def _post_bulk(self, payload):
+                sent.append(str(payload))
+                response = responses.pop(0)
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+        bulker = ScriptedBulker(self.conn, bulk_size=4, max_attempts=4, backoff=0.001,
+                                on_dead_letter=lambda failures, bulk_result: dead_letters.extend(failures))
+        commands = ['{"index": {"_id": "%d"}}\n{"num": %d}' % (num, num) for num in range(1, 5)]
+        for command in commands:
+            bulker.add(command)
+        bulk_result = bulker.flush_bulk(True)
+
+        # only the rejected items are sent again
+        self.assertEqual(len(sent), 4)
+        self.assertEqual(sent[2], "%s\n%s\n" % (commands[1], commands[3]))
+        self.assertEqual(sent[3], "%s\n" % commands[3])
+        self.assertTrue(_is_bulk_item_ok(bulk_result["items"][1]))
+        self.assertTrue(bulk_result["errors"])
+        # the mapping error and the rejection past the attempts budget
+        self.assertEqual([failure.position for failure in dead_letters], [2, 3])
+        self.assertEqual([failure.action for failure in dead_letters], [commands[2], commands[3]])
+
+    def test_bulk_raw(self):
+        headers = BulkHeaders()
+        self.assertEqual(headers.header("index", self.index_name, self.document_type, 1),
+                         '{"index":{"_index":"%s","_type":"%s","_id":1}}' % (self.index_name, self.document_type))
+        self.assertEqual(json.loads(headers.header("create", u"t\xe8st", 'a"b', "x y", parent="2", routing="r")),
+                         {"create": {"_index": u"t\xe8st", "_type": 'a"b', "_id": "x y", "_parent": "2",
+                                     "_routing": "r"}})
+
+        self.conn.force_bulk()
+        source = bytearray('{"name": "Joe T\xc3\xa8st"}')
+        self.conn.index(source, self.index_name, self.document_type, 1, bulk=True)
+        self.conn.index_raw_bulk(headers.header("index", self.index_name, self.document_type, 2) + "\n",
+                                 buffer('{"name": "Bill"}\n'))
+        self.conn.delete(self.index_name, self.document_type, 3, bulk=True)
+        self.assertEqual(str(self.conn.bulker.bulk_payload), "%s\n%s\n%s\n%s\n%s\n" % (
+            headers.header("index", self.index_name, self.document_type, 1), source,
+            headers.header("index", self.index_name, self.document_type, 2), '{"name": "Bill"}',
+            headers.header("delete", self.index_name, self.document_type, 3)))
+        self.conn.force_bulk()
+        self.conn.indices.refresh(self.index_name)
+        self.assertEqual(self.conn.get(self.index_name, self.document_type, 1).name, u"Joe T\xe8st")
+        self.assertEqual(self.conn.get(self.index_name, self.document_type, 2).name, u"Bill")
+
+
+class ThreadedBulkerTestCase(unittest.TestCase):
+    def make_bulker(self, workers, release):
+        class BlockingBulker(ThreadedBulker):
+            def _post_bulk(self, payload):
+                # the first batch waits for release, the others are sent at once
+                num = json.loads(str(payload).split("\n")[1])["num"]
+                if num == 1:
+                    release.wait(5)
+                return {"took": 1, "items": [{"index": {"_id": str(num), "ok": True}}]}
+
+        return BlockingBulker(None, bulk_size=1, workers=workers, queue_size=1)
+
+    def test_handoff_keeps_bulk_lock_free(self):
+        release = threading.Event()
+        bulker = self.make_bulker(1, release)
+        #the first batch is on the wire, the second one fills the queue
+        for num in (1, 2):
+            bulker.add('{"index": {}}\n{"num": %d}' % num)
+            bulker.flush_bulk()
+        time.sleep(0.05)
+        #the third one blocks its producer in the handoff
+        bulker.add('{"index": {}}\n{"num": 3}')
+        producer = threading.Thread(target=bulker.flush_bulk)
+        producer.start()
+        time.sleep(0.05)
+        self.assertTrue(producer.is_alive())
+        #the other producers can still add their commands
+        added = threading.Thread(target=bulker.add, args=('{"index": {}}\n{"num": 4}',))
+        added.start()
+        added.join(1)
+        self.assertFalse(added.is_alive())
+
+        release.set()
+        producer.join(5)
+        self.assertEqual(bulker.flush_bulk(True)["items"][0]["index"]["_id"], "4")
+        bulker.close()
+        self.assertEqual(bulker._senders, [])
+
+    def test_last_result_of_last_batch(self):
+        release = threading.Event()
+        bulker = self.make_bulker(2, release)
+        for num in (1, 2):
+            bulker.add('{"index": {}}\n{"num": %d}' % num)
+            bulker.flush_bulk()
+        #the second batch is sent while the first one is still on the wire
+        time.sleep(0.05)
+        self.assertEqual(bulker.last_result["items"][0]["index"]["_id"], "2")
+        release.set()
+        self.assertEqual(bulker.flush_bulk(True)["items"][0]["index"]["_id"], "2")
+        bulker.close()
+
+    def test_es_close_stops_senders(self):
+        conn = ES("http://127.0.0.1:9200", bulker_class=functools.partial(ThreadedBulker, workers=2))
+        conn.bulker._start_senders()
+        senders = conn.bulker._senders
+        conn.close()
+        self.assertFalse([sender for sender in senders if sender.is_alive()])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import math
+import unittest
+from pyes import columnar
+from pyes.columnar import ColumnBuilder, numpy
+
+HITS = [{"_id": "1", "_score": 1.5, "_source": {"name": "Joe", "age": 30, "address": {"zip": "00100"}}},
+        {"_id": "2", "_score": 0.5, "_source": {"name": "Bill", "age": None}},
+        {"_id": "3", "_score": 0.2, "fields": {"age": [12], "address.zip": "00200"}}]
+
+
+class ColumnBuilderTestCase(unittest.TestCase):
+    def build(self, use_numpy):
+        builder = ColumnBuilder(["_id", "_score", "age", "address.zip"],
+                                {"_score": "float64", "age": "int64"}, use_numpy=use_numpy, chunk_size=2)
+        for hit in HITS:
+            builder.add(hit)
+        return builder.finish()
+
+    def test_arrays(self):
+        columns = self.build(False)
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(columns["_id"], ["1", "2", "3"])
+        self.assertEqual(columns["_score"].tolist(), [1.5, 0.5, 0.2])
+        self.assertEqual(columns["age"].tolist(), [30, 0, 12])
+        self.assertEqual(columns.masks["age"].tolist(), [False, True, False])
+        self.assertEqual(columns["address.zip"], ["00100", None, "00200"])
+        self.assertEqual(columns.masks["address.zip"].tolist(), [False, True, False])
+
+    def test_dtypes(self):
+        self.assertRaises(ValueError, ColumnBuilder, ["_id", "age"], ["object"])
+        builder = ColumnBuilder(["age"], ["float64"], use_numpy=False)
+        builder.add({"_source": {}})
+        self.assertTrue(math.isnan(builder.finish()["age"][0]))
+
+    def test_without_numpy(self):
+        saved, columnar.numpy = columnar.numpy, None
+        try:
+            builder = ColumnBuilder(["age", "score"], ["int64", "float64"])
+            builder.add({"_source": {"age": "3", "score": "1.5"}})
+            builder.add({"_source": {"age": 4.0, "score": 2}})
+            columns = builder.finish()
+            self.assertRaises(RuntimeError, columns.masked, "age")
+        finally:
+            columnar.numpy = saved
+        self.assertEqual(columns["age"].tolist(), [3, 4])
+        self.assertEqual(columns["score"].tolist(), [1.5, 2.0])
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy(self):
+        columns = self.build(True)
+        self.assertEqual(columns["age"].dtype, numpy.int64)
+        self.assertEqual(columns["age"].tolist(), [30, 0, 12])
+        self.assertEqual(columns.masked("age").sum(), 42)
+        self.assertEqual(columns["address.zip"].tolist(), ["00100", None, "00200"])
+
+
+if __name__ == "__main__":
+    unittest.main()
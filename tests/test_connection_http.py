@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import unittest
+import zlib
+from urlparse import urlparse
+from pyes.connection_http import Connection, Node, least_outstanding, lowest_latency
+from pyes.exceptions import NoServerAvailable
+from pyes.sniffer import parse_http_address
+
+
+class ConnectionHttpTestCase(unittest.TestCase):
+    def test_least_outstanding(self):
+        nodes = [Node("http://127.0.0.1:9200"), Node("http://127.0.0.1:9201")]
+        nodes[0].outstanding = 2
+        nodes[1].outstanding = 1
+        self.assertTrue(least_outstanding(nodes) is nodes[1])
+
+    def test_lowest_latency(self):
+        nodes = [Node("http://127.0.0.1:9200"), Node("http://127.0.0.1:9201")]
+        nodes[0].record_latency(0.1)
+        nodes[1].record_latency(0.3)
+        self.assertTrue(lowest_latency(nodes) is nodes[0])
+        nodes[0].outstanding = 3
+        self.assertTrue(lowest_latency(nodes) is nodes[1])
+        nodes[1].record_latency(0.1)
+        self.assertAlmostEqual(nodes[1].latency, 0.24)
+
+    def test_pool_per_server(self):
+        conn = Connection([urlparse("http://127.0.0.1:9200"), urlparse("http://127.0.0.1:9201")],
+                          pool_maxsize=5)
+        self.assertEqual(len(conn.nodes), 2)
+        self.assertEqual([node.pool.port for node in conn.nodes], [9200, 9201])
+        self.assertEqual(conn.nodes[0].pool.pool.maxsize, 5)
+
+    def test_drop_node(self):
+        conn = Connection([urlparse("http://127.0.0.1:9200")], retry_time=3600)
+        node = conn.nodes[0]
+        conn._drop_node(node)
+        self.assertEqual(conn.nodes, [])
+        self.assertEqual(conn._inactive_nodes, [node])
+        self.assertRaises(NoServerAvailable, conn._get_node)
+
+    def test_update_servers(self):
+        conn = Connection([urlparse("http://127.0.0.1:9200"), urlparse("http://127.0.0.1:9201")])
+        kept = conn.nodes[0]
+        conn._drop_node(conn.nodes[1])
+        added, removed = conn.update_servers(["http://127.0.0.1:9200", "http://127.0.0.1:9202"])
+        self.assertEqual(added, ["http://127.0.0.1:9202"])
+        self.assertEqual(removed, ["http://127.0.0.1:9201"])
+        self.assertEqual([node.url for node in conn.nodes], ["http://127.0.0.1:9200", "http://127.0.0.1:9202"])
+        self.assertTrue(conn.nodes[0] is kept)
+        self.assertEqual(conn._inactive_nodes, [])
+
+    def test_compression(self):
+        body = bytearray('{"index": {"_index": "test-index"}}\n{"name": "Joe"}\n' * 10)
+        conn = Connection([urlparse("http://127.0.0.1:9200")], compression="gzip")
+        self.assertEqual(conn._headers["Accept-Encoding"], "gzip, deflate")
+        self.assertEqual(zlib.decompress(conn._compress(body), 16 + zlib.MAX_WBITS), str(body))
+        conn = Connection([urlparse("http://127.0.0.1:9200")], compression="deflate")
+        self.assertEqual(zlib.decompress(conn._compress(u"{\"name\": \"J\xf6e\"}")), '{"name": "J\xc3\xb6e"}')
+        self.assertRaises(ValueError, Connection, [urlparse("http://127.0.0.1:9200")], compression="lzma")
+
+    def test_parse_http_address(self):
+        self.assertEqual(parse_http_address("inet[/127.0.0.1:9200]"), "http://127.0.0.1:9200")
+        self.assertEqual(parse_http_address("inet[es1/10.0.0.1:9201]", "https"), "https://10.0.0.1:9201")
+        self.assertEqual(parse_http_address("inet[unparsable]"), None)
+
+
+class PingerTestCase(unittest.TestCase):
+    def test_close_stops_pinger(self):
+        conn = Connection([urlparse("http://127.0.0.1:9")], retry_time=3600)
+        node = conn.nodes[0]
+        conn._drop_node(node)
+        pinger = conn._pinger
+        self.assertTrue(pinger.is_alive())
+        conn.close()
+        pinger.join(5)
+        self.assertFalse(pinger.is_alive())
+        self.assertTrue(conn._pinger is None)
+        #a closed connection doesn't start pinging again
+        conn._inactive_nodes.remove(node)
+        conn._active_nodes.append(node)
+        conn._drop_node(node)
+        self.assertTrue(conn._pinger is None)
+
+    def test_ping_never_raises(self):
+        conn = Connection([urlparse("http://127.0.0.1:9")])
+        node = conn.nodes[0]
+        node.pool = None
+        self.assertFalse(conn._ping(node))
+
+
+if __name__ == '__main__':
+    unittest.main()
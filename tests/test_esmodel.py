@@ -3,7 +3,8 @@ from __future__ import absolute_import
 from copy import deepcopy
 import unittest
 from .estestcase import ESTestCase
-from pyes.models import DotDict
+from pyes.models import DotDict, ElasticSearchModel, SearchHit
+from pyes.query import TermQuery
 
 class ElasticSearchModelTestCase(ESTestCase):
     def setUp(self):
@@ -42,5 +43,34 @@ class ElasticSearchModelTestCase(ESTestCase):
         self.assertEqual(dotdict2["bar"]["baz"], "foo")
         self.assertEqual(type(dotdict2), DotDict)
 
+    def test_SearchHit(self):
+        hit = SearchHit(None, {"_index": "test-index", "_type": "test-type", "_id": "1", "_score": 1.5,
+                               "_source": {"name": "test", "val": 1}, "fields": {"_parent": "2"}})
+        self.assertEqual(hit.name, "test")
+        self.assertEqual(hit["val"], 1)
+        self.assertEqual(hit.missing, None)
+        self.assertEqual(hit._meta.id, "1")
+        self.assertEqual(hit._meta.score, 1.5)
+        self.assertEqual(hit._meta.parent, "2")
+        self.assertEqual(sorted(hit.keys()), ["name", "val"])
+        #the merged values and the metadata are built once
+        self.assertTrue(hit._values() is hit._values())
+        self.assertTrue(hit._meta is hit._meta)
+        self.assertTrue(hit._model is None)
+        hit.name = "changed"
+        self.assertTrue(isinstance(hit._model, ElasticSearchModel))
+        self.assertEqual(hit.name, "changed")
+        self.assertEqual(hit._meta.id, "1")
+
+    def test_search_SearchHit(self):
+        self.conn.index({"name": "Joe Tester", "val": 1}, self.index_name, self.document_type, 1)
+        self.conn.refresh(self.index_name)
+        hits = list(self.conn.search(TermQuery("name", "joe"), self.index_name, model=SearchHit))
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0].val, 1)
+        hits[0].val = 2
+        hits[0].save()
+        self.assertEqual(self.conn.get(self.index_name, self.document_type, 1).val, 2)
+
 if __name__ == "__main__":
     unittest.main()
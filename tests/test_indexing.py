@@ -4,7 +4,7 @@ import unittest
 from .estestcase import ESTestCase
 
 from pyes.query import TermQuery
-from pyes.exceptions import (IndexAlreadyExistsException,
+from pyes.exceptions import (IndexAlreadyExistsException, NotFoundException,
                           VersionConflictEngineException, DocumentAlreadyExistsException)
 from time import sleep
 
@@ -171,6 +171,20 @@ class IndexingTestCase(ESTestCase):
         results = self.conn.mget(["1", "2"], self.index_name, self.document_type)
         self.assertEqual(len(results), 2)
 
+    def testMultiGetChunks(self):
+        for i in range(10):
+            self.conn.index({"position": i}, self.index_name, self.document_type, i, bulk=True)
+        self.conn.force_bulk()
+        ids = [str(i) for i in range(12)]
+        results = self.conn.mget(ids, self.index_name, self.document_type, chunk_size=3, workers=2)
+        self.assertEqual([result._meta.id for result in results], ids)
+        results = self.conn.mget(ids, self.index_name, self.document_type, chunk_size=5, missing="skip")
+        self.assertEqual([result.position for result in results], range(10))
+        self.assertRaises(NotFoundException, self.conn.mget, ids, self.index_name, self.document_type,
+                          chunk_size=5, missing="raise")
+        results = self.conn.iter_mget(ids, self.index_name, self.document_type, chunk_size=4, missing="skip")
+        self.assertEqual([result.position for result in results], range(10))
+
     def testGetCountBySearch(self):
         self.conn.index({"name": "Joe Tester"}, self.index_name, self.document_type, 1)
         self.conn.index({"name": "Bill Baloney"}, self.index_name, self.document_type, 2)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import unittest
+from .estestcase import ESTestCase, get_conn
+from pyes.instrumentation import MemoryCollector, RequestEvent, body_size, endpoint_name
+from pyes.query import MatchAllQuery
+
+
+class EndpointTestCase(unittest.TestCase):
+    def test_endpoint_name(self):
+        self.assertEqual(endpoint_name("GET", "/test-index/test-type/_search"), "GET _search")
+        self.assertEqual(endpoint_name("GET", "/_search/scroll"), "GET _search/scroll")
+        self.assertEqual(endpoint_name("PUT", "/test-index/test-type/1"), "PUT <document>")
+        self.assertEqual(endpoint_name("DELETE", "/test-index"), "DELETE <index>")
+        self.assertEqual(endpoint_name("GET", "/"), "GET /")
+
+    def test_body_size(self):
+        self.assertEqual(body_size(u'{"name": "J\xf6e"}'), 16)
+        self.assertEqual(body_size(bytearray('{"name": "J\xc3\xb6e"}')), 16)
+
+    def test_collector(self):
+        collector = MemoryCollector()
+        for wire_time in (0.001, 0.003, 0.3):
+            event = RequestEvent("GET", "/test-index/_search")
+            event.wire_time = wire_time
+            event.took = 2
+            collector.request_finished(event)
+        stats = collector.stats()["GET _search"]
+        self.assertEqual(stats["count"], 3)
+        self.assertEqual(stats["avg_took_ms"], 2)
+        self.assertEqual(stats["p50_ms"], 5)
+        self.assertEqual(stats["p99_ms"], 500)
+
+    def test_compression_ratio(self):
+        collector = MemoryCollector()
+        event = RequestEvent("POST", "/_bulk")
+        self.assertEqual(event.request_compression_ratio, 1.0)
+        event.body_bytes, event.sent_bytes = 1000, 100
+        event.response_bytes, event.received_bytes = 300, 300
+        self.assertEqual(event.request_compression_ratio, 10.0)
+        collector.request_finished(event)
+        stats = collector.stats()["POST _bulk"]
+        self.assertEqual(stats["request_compression_ratio"], 10.0)
+        self.assertEqual(stats["response_compression_ratio"], 1.0)
+
+
+class InstrumentationTestCase(ESTestCase):
+    def test_memory_collector(self):
+        collector = MemoryCollector()
+        conn = get_conn(instrumentation=collector)
+        conn.index({"name": "Joe"}, self.index_name, self.document_type, 1)
+        conn.refresh(self.index_name)
+        conn.search_raw(MatchAllQuery(), self.index_name)
+        stats = collector.stats()
+        self.assertEqual(stats["PUT <document>"]["count"], 1)
+        self.assertEqual(stats["GET _search"]["count"], 1)
+        self.assertTrue(stats["PUT <document>"]["body_bytes"] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import unittest
+from datetime import datetime
+from pyes.es import json
+from pyes.jsoncodec import JSONCodec, ESJsonDecoder, JSON_ENGINES
+from pyes.models import DotDict
+
+BODY = json.dumps({"hits": {"total": 1, "hits": [
+    {"_id": "1", "_source": {"date": "2012-01-01T10:11:12", "code": "ABCDEFGHIJKLMNOPQRS",
+                             "dates": ["2013-02-03T00:00:00", "a"], "bad": "2012-13-01T10:11:12"}}]}})
+
+
+class JSONCodecTestCase(unittest.TestCase):
+    def test_same_as_decoder(self):
+        for engine in JSON_ENGINES:
+            decoded = JSONCodec(engine=engine).loads(BODY)
+            self.assertEqual(decoded, json.loads(BODY, cls=ESJsonDecoder))
+            source = decoded.hits.hits[0]._source
+            self.assertTrue(isinstance(source, DotDict))
+            self.assertEqual(source.date, datetime(2012, 1, 1, 10, 11, 12))
+            self.assertEqual(source.dates, [datetime(2013, 2, 3), "a"])
+            self.assertEqual(source.code, "ABCDEFGHIJKLMNOPQRS")
+            self.assertEqual(source.bad, "2012-13-01T10:11:12")
+
+    def test_without_datetimes(self):
+        decoded = JSONCodec(decode_datetimes=False).loads(BODY)
+        self.assertEqual(decoded.hits.hits[0]._source.date, "2012-01-01T10:11:12")
+
+    def test_plain(self):
+        decoded = JSONCodec().loads(BODY, wrap=False)
+        self.assertEqual(type(decoded["hits"]["hits"][0]), dict)
+        self.assertEqual(decoded["hits"]["hits"][0]["_source"]["date"], "2012-01-01T10:11:12")
+
+    def test_lazy_wrapping(self):
+        decoded = JSONCodec().loads(BODY)
+        #the nested objects are plain until read
+        self.assertEqual(type(dict.__getitem__(decoded, "hits")), dict)
+        hits = decoded["hits"]
+        self.assertTrue(hits is decoded.hits)
+        self.assertTrue(isinstance(hits.hits[0], DotDict))
+        self.assertTrue(all(isinstance(value, DotDict) for value in hits.hits[0].values()
+                            if isinstance(value, dict)))
+        self.assertEqual(JSONCodec().engine, "json")
+
+    def test_dumps(self):
+        self.assertEqual(JSONCodec().dumps({"date": datetime(2012, 1, 1)}), '{"date": "2012-01-01T00:00:00"}')
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, JSONCodec, engine="unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
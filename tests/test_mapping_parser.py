@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
-from tests.estestcase import ESTestCase
+from datetime import datetime
+from tests.estestcase import ESTestCase, get_conn
 from pyes import json, ES
-from pyes.mappings import Mapper
+from pyes.mappings import Mapper, convert_document, to_datetime
 
 class MapperTestCase(ESTestCase):
     def test_parser(self):
@@ -11,3 +12,38 @@ class MapperTestCase(ESTestCase):
 
         #mapping = self.conn.get_mapping()
         #self.dump(mapping)
+
+    def test_converters(self):
+        self.datamap = json.loads(self.get_datafile("map.json"))
+        mapper = Mapper(self.datamap)
+        doctype = dict(dict(mapper.indices)["testindex"])["mydoctype"]
+        converters = doctype.get_converter()
+        self.assertTrue("title" not in converters)
+        self.assertEqual(converters["price"]("1.5"), 1.5)
+        self.assertEqual(converters["firm"]["id"]("12"), 12)
+        self.assertEqual(to_datetime("2012-01-01T10:11:12.5+01:00"), datetime(2012, 1, 1, 9, 11, 12, 500000))
+        self.assertEqual(to_datetime("2012-01-01"), datetime(2012, 1, 1))
+        self.assertEqual(to_datetime("ABCDEFGHIJKLMNOPQRS"), "ABCDEFGHIJKLMNOPQRS")
+        self.assertEqual(to_datetime(0), datetime(1970, 1, 1))
+        doc = {"date": "2012-01-01", "count": ["1", "2"], "owner": [{"born": "2000-01-01T00:00:00"}]}
+        convert_document(doc, {"date": to_datetime, "count": int, "owner": {"born": to_datetime}})
+        self.assertEqual(doc, {"date": datetime(2012, 1, 1), "count": [1, 2],
+                               "owner": [{"born": datetime(2000, 1, 1)}]})
+
+    def test_mapping_decoding(self):
+        conn = get_conn(decode_datetimes="mapping")
+        mapping = {"date": {"type": "date", "store": "yes"},
+                   "position": {"type": "integer", "store": "yes"},
+                   "uuid": {"type": "string", "store": "yes", "index": "not_analyzed"}}
+        conn.create_index(self.index_name)
+        conn.put_mapping(self.document_type, {"properties": mapping}, self.index_name)
+        conn.index({"date": "2012-01-01T10:11:12", "position": "12", "uuid": "2012-01-01T10:11:12"},
+                   self.index_name, self.document_type, 1)
+        conn.refresh(self.index_name)
+        hit = conn.search_raw({"query": {"match_all": {}}, "fields": ["date", "_source"]},
+                              self.index_name).hits.hits[0]
+        self.assertEqual(hit._source, {"date": datetime(2012, 1, 1, 10, 11, 12), "position": 12,
+                                       "uuid": "2012-01-01T10:11:12"})
+        self.assertEqual(hit.fields["date"], datetime(2012, 1, 1, 10, 11, 12))
+        doc = conn.get(self.index_name, self.document_type, 1)
+        self.assertEqual(doc.position, 12)
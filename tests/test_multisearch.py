@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import threading
+import unittest
+from .estestcase import ESTestCase
+from pyes.exceptions import IndexMissingException
+from pyes.facets import TermFacet
+from pyes.multisearch import MultiSearch, SearchBatcher
+from pyes.query import MatchAllQuery, Search, TermQuery
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.calls = []
+
+    def multi_search(self, searches, model=None, raise_on_error=True):
+        self.calls.append(searches)
+        return [ValueError(query) if query == "bad" else query for query, indices, doc_types, params in searches]
+
+
+class SearchBatcherTestCase(unittest.TestCase):
+    def test_batcher(self):
+        conn = FakeConnection()
+        batcher = SearchBatcher(conn, window=0.5, max_batch=4)
+        results = {}
+
+        def search(query):
+            try:
+                results[query] = batcher.search(query, "test-index")
+            except ValueError:
+                results[query] = "error"
+
+        threads = [threading.Thread(target=search, args=(query,)) for query in ("a", "b", "bad", "c")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(conn.calls), 1)
+        self.assertEqual(results, {"a": "a", "b": "b", "bad": "error", "c": "c"})
+
+        self.assertEqual(batcher.search("d"), "d")
+        self.assertEqual(len(conn.calls), 2)
+
+
+class MultiSearchTestCase(ESTestCase):
+    def setUp(self):
+        super(MultiSearchTestCase, self).setUp()
+        self.init_default_index()
+        for i in range(15):
+            self.conn.index({"name": "Joe Tester" if i % 3 else "Bill Baloney", "position": i},
+                            self.index_name, self.document_type, i)
+        self.conn.indices.refresh(self.index_name)
+
+    def test_multi_search(self):
+        facets = Search(MatchAllQuery(), size=0)
+        facets.facet.add(TermFacet("name"))
+        results = self.conn.multi_search([(TermQuery("name", "joe"), self.index_name, self.document_type),
+                                          (facets, self.index_name, None),
+                                          MatchAllQuery()])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0].total, 10)
+        self.assertEqual(len(list(results[0])), 10)
+        self.assertEqual(results[1].facets.name.terms[0].term, "joe")
+        self.assertEqual(results[2].total, 15)
+
+    def test_multi_search_errors(self):
+        searches = MultiSearch(self.conn, raise_on_error=False)
+        searches.add(TermQuery("name", "joe"), self.index_name)
+        searches.add(MatchAllQuery(), "missing-index")
+        results = searches.execute()
+        self.assertEqual(results[0].total, 10)
+        self.assertTrue(isinstance(results[1], IndexMissingException))
+        self.assertEqual(len(searches), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
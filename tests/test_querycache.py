@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import unittest
+from .estestcase import ESTestCase, get_conn
+from pyes.exceptions import QueryError
+from pyes.filters import ANDFilter, TermFilter, RangeFilter
+from pyes.jsoncodec import JSONCodec
+from pyes.query import BoolQuery, FilteredQuery, MatchAllQuery, Search, TermQuery
+from pyes.querycache import Param, QueryCache, QueryTemplate, freeze, structural_key
+from pyes.utils import ESRange
+
+
+def make_query(name="joe", age=32):
+    return FilteredQuery(BoolQuery(must=[TermQuery("name", name)]),
+                         ANDFilter([TermFilter("age", age), RangeFilter(ESRange("date", "2012-01-01"))]))
+
+
+class QueryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codec = JSONCodec()
+        self.encode = lambda query: self.codec.dumps(query.serialize())
+
+    def test_structural_key(self):
+        self.assertEqual(structural_key(make_query()), structural_key(make_query()))
+        self.assertNotEqual(structural_key(make_query()), structural_key(make_query(age=33)))
+        self.assertNotEqual(structural_key(TermQuery("age", 1)), structural_key(TermQuery("age", 1.0)))
+        self.assertNotEqual(structural_key(TermQuery("age", 1)), structural_key(TermFilter("age", 1)))
+
+    def test_cache(self):
+        cache = QueryCache(maxsize=2)
+        body = cache.encode(freeze(make_query()), self.encode)
+        self.assertEqual(body, self.encode(make_query()))
+        self.assertTrue(cache.encode(freeze(make_query()), self.encode) is body)
+        self.assertEqual(cache.encode(freeze(make_query()), lambda query: "other", "other"), "other")
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        #the least recently used entry is evicted
+        cache.encode(freeze(make_query()), self.encode)
+        cache.encode(freeze(make_query(age=33)), self.encode)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.encode(freeze(make_query(age=33)), self.encode), self.encode(make_query(age=33)))
+        self.assertEqual(cache.stats()["hits"], 3)
+
+        #the objects which are not frozen are not cached
+        query = make_query()
+        cache.encode(query, self.encode)
+        query.query._must[0] = TermQuery("name", "bill")
+        self.assertEqual(cache.encode(query, self.encode), self.encode(make_query(name="bill")))
+        self.assertEqual(len(cache), 2)
+
+    def test_freeze(self):
+        query = freeze(make_query())
+        self.assertEqual(structural_key(query), structural_key(make_query()))
+        query.filter.filters.append(TermFilter("name", "joe"))
+        self.assertEqual(structural_key(query), structural_key(make_query()))
+        self.assertRaises(TypeError, freeze, {})
+
+    def test_template(self):
+        template = QueryTemplate(make_query(Param("name"), Param("age")))
+        self.assertEqual(template.render(self.codec, {"name": "bill", "age": 20}),
+                         self.codec.dumps(Search(make_query("bill", 20)).serialize()))
+        self.assertEqual(template.render(self.codec, {"name": u"b\xe8\"", "age": 0}, search=False),
+                         self.codec.dumps(make_query(u"b\xe8\"", 0).serialize()))
+        self.assertRaises(QueryError, template.render, self.codec, {"name": "bill"})
+        self.assertRaises(ValueError, Param, "a name")
+
+        template = QueryTemplate(Search(TermQuery("name", Param("name")), size=Param("size")))
+        self.assertEqual(template.bind(name="joe", size=5).encode(self.codec),
+                         self.codec.dumps(Search(TermQuery("name", "joe"), size=5).serialize()))
+
+
+class ESQueryCacheTestCase(ESTestCase):
+    def test_search_query_cache(self):
+        conn = get_conn(query_cache=16)
+        conn.index({"name": "joe", "age": 32}, self.index_name, self.document_type, 1)
+        conn.refresh(self.index_name)
+        for i in range(2):
+            result = conn.search_raw(freeze(TermQuery("name", "joe")), self.index_name)
+            self.assertEqual(result.hits.total, 1)
+            self.assertEqual(conn.count(freeze(TermQuery("name", "joe")), self.index_name).count, 1)
+        self.assertEqual(conn.query_cache.hits, 2)
+
+        template = QueryTemplate(TermQuery("name", Param("name")))
+        result = conn.search_raw(template.bind(name="joe"), self.index_name)
+        self.assertEqual(result.hits.total, 1)
+        self.assertEqual(conn.count(template.bind(name="bill"), self.index_name).count, 0)
+        self.assertEqual(len(conn.search(MatchAllQuery(), self.index_name)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -86,6 +86,9 @@ class QuerySetTests(ESTestCase):
         values = list(model.objects.values_list("uuid", flat=True))
         self.assertEqual(len(values), 3)
         self.assertEqual(values, [u'11111', u'22222',u'33333'])
+        values = model.objects.values_list("uuid", flat=True)
+        self.assertEqual((len(values), values.total), (3, 3))
+        self.assertEqual(values[1:], [u'22222', u'33333'])
         values = model.objects.dates("date", kind="year")
         self.assertEqual(len(values), 1)
         self.assertEqual(values, [datetime(2012, 1, 1, 0, 0)])
@@ -95,3 +98,26 @@ class QuerySetTests(ESTestCase):
         self.assertEqual(uuid_facets["total"], 3)
         self.assertEqual(uuid_facets["terms"][0]["count"], 1)
 
+
+    def test_values_list_columns(self):
+        model = generate_model(self.index_name, self.document_type)
+        columns = model.objects.order_by("position").values_list("_id", "position", "value",
+                                                                 dtypes=["object", "int64", "float64"])
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(list(columns["_id"]), ["1", "2", "3"])
+        self.assertEqual(list(columns["position"]), [1, 2, 3])
+        self.assertEqual(list(columns.masks["value"]), [True, True, True])
+
+    def test_iterator_chunks(self):
+        model = generate_model(self.index_name, self.document_type)
+        queryset = model.objects.order_by("position")
+        self.assertEqual([r.position for r in queryset.iterator(chunk_size=2)], [1, 2, 3])
+        self.assertIsNone(queryset._result_cache)
+        self.assertEqual([r.position for r in queryset.size(2).iterator(chunk_size=1)], [1, 2])
+
+        model.objects.update(value="updated")
+        self.conn.refresh(self.index_name)
+        self.assertEqual(list(model.objects.values_list("value", flat=True)), ["updated"] * 3)
+        self.assertEqual(model.objects.filter(position__gt=1).delete(), 2)
+        self.conn.refresh(self.index_name)
+        self.assertEqual(len(model.objects.all()), 1)
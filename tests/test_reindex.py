@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from .estestcase import ESTestCase
+from pyes.jsoncodec import JSONCodec
+from pyes.query import MatchAllQuery, Search
+from pyes.reindex import Reindexer, ReindexProgress
+
+
+class ReindexProgressTestCase(unittest.TestCase):
+    def test_rate(self):
+        progress = ReindexProgress(4)
+        progress.total = 300
+        progress.written = 100
+        progress.skipped = 50
+        progress.end_time = progress.start_time + 10
+        self.assertEqual(progress.rate, 10.0)
+        self.assertEqual(progress.eta, 15.0)
+        self.assertEqual(progress.as_dict()["slices"], 4)
+
+
+class FakeBulker(object):
+    def __init__(self):
+        self.commands = []
+
+    def add_raw(self, header, source=None):
+        self.commands.append((json.loads(header), json.loads(source)))
+
+
+class FakeConnection(object):
+    codec = JSONCodec()
+
+
+class ReindexHitsTestCase(unittest.TestCase):
+    def test_search_fields(self):
+        reindexer = Reindexer(None, MatchAllQuery(), "target")
+        self.assertEqual(reindexer.search.fields, ["_source", "_parent", "_routing"])
+        search = Search(MatchAllQuery(), fields=["_source", "_routing"])
+        reindexer = Reindexer(None, search, "target")
+        self.assertEqual(reindexer.search.fields, ["_source", "_routing", "_parent"])
+        self.assertEqual(search.fields, ["_source", "_routing"])
+
+    def test_child_document(self):
+        reindexer = Reindexer(None, MatchAllQuery(), "target", target_conn=FakeConnection())
+        bulker = FakeBulker()
+        hits = [{"_index": "source", "_type": "child", "_id": "2", "_source": {"name": "Joe"},
+                 "fields": {"_parent": "1", "_routing": "1"}},
+                {"_index": "source", "_type": "parent", "_id": "1", "_source": {"name": "Bill"}}]
+        self.assertEqual(reindexer._add_hits(bulker, hits), 0)
+        self.assertEqual(bulker.commands, [
+            ({"index": {"_index": "target", "_type": "child", "_id": "2", "_parent": "1", "_routing": "1"}},
+             {"name": "Joe"}),
+            ({"index": {"_index": "target", "_type": "parent", "_id": "1"}}, {"name": "Bill"})])
+
+
+class ReindexCheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.path, "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_checkpoint(self):
+        reindexer = Reindexer(None, MatchAllQuery(), "target", checkpoint=self.checkpoint)
+        self.assertEqual(reindexer._load_checkpoint(3), set())
+        reindexer.progress = ReindexProgress(3)
+        reindexer._slice_done(2)
+        reindexer._slice_done(0)
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(json.load(checkpoint)["done"], [0, 2])
+        self.assertEqual(reindexer._load_checkpoint(3), set([0, 2]))
+        #the checkpoint of other slices
+        self.assertRaises(ValueError, reindexer._load_checkpoint, 4)
+
+
+class ReindexTestCase(ESTestCase):
+    def setUp(self):
+        super(ReindexTestCase, self).setUp()
+        self.target_index = "test-index-reindex"
+        self.conn.delete_index_if_exists(self.target_index)
+        for num in range(100):
+            self.conn.index({"name": "Joe", "num": num}, self.index_name, self.document_type, num, bulk=True)
+        self.conn.force_bulk()
+        self.conn.refresh(self.index_name)
+
+    def tearDown(self):
+        super(ReindexTestCase, self).tearDown()
+        self.conn.delete_index_if_exists(self.target_index)
+
+    def test_reindex(self):
+        def transform(hit):
+            if hit["_source"]["num"] % 10 == 0:
+                return None
+            hit["_source"]["copied"] = True
+            return hit
+
+        progress = Reindexer(self.conn, MatchAllQuery(), self.target_index, indices=self.index_name,
+                             transform=transform, readers=2, bulk_size=20, scan_size=10).run()
+        self.assertEqual((progress.read, progress.written, progress.skipped, progress.failed), (100, 90, 10, 0))
+        self.assertEqual(progress.slices_done, progress.slices)
+        self.conn.refresh(self.target_index)
+        results = self.conn.search(MatchAllQuery(), self.target_index, self.document_type, size=100)
+        self.assertEqual(results.total, 90)
+        self.assertTrue(all(hit.copied for hit in results))
+
+    def test_reindex_child(self):
+        mapping = {"_parent": {"type": self.document_type}}
+        self.conn.put_mapping("test-child", mapping, self.index_name)
+        self.conn.create_index(self.target_index)
+        self.conn.put_mapping("test-child", mapping, self.target_index)
+        self.conn.index({"name": "Joe Junior"}, self.index_name, "test-child", 1, parent=1)
+        self.conn.refresh(self.index_name)
+
+        Reindexer(self.conn, MatchAllQuery(), self.target_index, indices=self.index_name).run()
+        self.conn.refresh(self.target_index)
+        child = self.conn.get(self.target_index, "test-child", 1, routing=1, fields=["_source", "_parent"],
+                              model=lambda conn, hit: hit)
+        self.assertEqual(child["fields"]["_parent"], "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
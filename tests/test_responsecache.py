@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import functools
+import threading
+import time
+import unittest
+from .estestcase import ESTestCase, get_conn
+from pyes.es import ES
+from pyes.fakettypes import Method, RestRequest, RestResponse
+from pyes.models import ThreadedBulker
+from pyes.query import TermQuery
+from pyes.responsecache import ANY_INDEX, ResponseCache, bulk_indices, path_indices
+
+
+def make_request(uri, body="", **params):
+    return RestRequest(method=Method.GET, uri=uri, parameters=params, headers={}, body=body)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_path_indices(self):
+        self.assertEqual(path_indices("/test-index/test-type/_search"), frozenset(["test-index"]))
+        self.assertEqual(path_indices("/index1,index2/_count"), frozenset(["index1", "index2"]))
+        self.assertTrue(path_indices("/_mget") is ANY_INDEX)
+        self.assertTrue(path_indices("/test-*/_search") is ANY_INDEX)
+
+    def test_bulk_indices(self):
+        payload = bytearray('{"index":{"_index":"index-a","_type":"t"}}\n{"name": "joe"}\n'
+                            '{"delete": {"_index" : "index-b", "_type": "t", "_id": 1}}\n')
+        self.assertEqual(bulk_indices(payload), frozenset(["index-a", "index-b"]))
+        self.assertTrue(bulk_indices('{"index": {"_type": "t"}}\n{}\n') is ANY_INDEX)
+
+    def test_cacheable(self):
+        self.assertTrue(ResponseCache.is_cacheable(make_request("/test-index/_search", size="10")))
+        self.assertTrue(ResponseCache.is_cacheable(make_request("/_mget")))
+        self.assertFalse(ResponseCache.is_cacheable(make_request("/test-index/_search", scroll="10m")))
+        self.assertFalse(ResponseCache.is_cacheable(make_request("/test-index/test-type/1")))
+
+    def test_cache(self):
+        cache = ResponseCache(ttl=0.05, max_bytes=20)
+        key = cache.make_key(make_request("/test-index/_count", '{"match_all": {}}'))
+        self.assertEqual(cache.get(key), None)
+        response = RestResponse(status=200, headers={}, body='{"count": 1}')
+        cache.put(key, response)
+        self.assertTrue(cache.get(key) is response)
+        self.assertEqual((cache.hits, cache.misses, cache.size), (1, 1, 12))
+
+        #expired
+        time.sleep(0.06)
+        self.assertEqual(cache.get(key), None)
+        self.assertEqual(cache.size, 0)
+
+        #the least recently used entry is evicted over the byte budget
+        other = cache.make_key(make_request("/other-index/_count"))
+        cache.put(key, response)
+        cache.put(other, response)
+        self.assertEqual((len(cache), cache.evictions), (1, 1))
+        self.assertTrue(cache.get(other) is response)
+
+        cache.invalidate(frozenset(["test-index"]))
+        self.assertEqual(len(cache), 1)
+        cache.invalidate(frozenset(["other-index"]))
+        self.assertEqual((len(cache), cache.size, cache.invalidations), (0, 0, 1))
+
+    def test_aliases(self):
+        cache = ResponseCache()
+        response = RestResponse(status=200, headers={}, body='{"count": 1}')
+        cache.set_aliases({"index-a": {"aliases": {"alias-a": {}, "alias-ab": {}}},
+                           "index-b": {"aliases": {"alias-ab": {}}},
+                           "index-c": {"aliases": {}}})
+        keys = dict((name, cache.make_key(make_request("/%s/_count" % name)))
+                    for name in ("index-a", "alias-a", "alias-ab", "index-b", "index-c", "new-alias"))
+
+        def fill():
+            cache.clear()
+            for key in keys.values():
+                cache.put(key, response)
+
+        def cached():
+            return sorted(name for name, key in keys.items() if key in cache._entries)
+
+        #a write to an index invalidates its aliases, and the unknown names
+        fill()
+        cache.invalidate(frozenset(["index-a"]))
+        self.assertEqual(cached(), ["index-b", "index-c"])
+        #a write through an alias invalidates its indices and their aliases
+        fill()
+        cache.invalidate(frozenset(["alias-a"]))
+        self.assertEqual(cached(), ["index-b", "index-c"])
+        fill()
+        cache.invalidate(frozenset(["index-c"]))
+        self.assertEqual(cached(), ["alias-a", "alias-ab", "index-a", "index-b"])
+
+    def test_stale_put(self):
+        cache = ResponseCache()
+        response = RestResponse(status=200, headers={}, body='{"count": 1}')
+        key = cache.make_key(make_request("/test-index/_count"))
+        #the index is written while the response is fetched
+        pending = cache.begin(key)
+        cache.invalidate(frozenset(["test-index"]))
+        cache.put(key, response, pending)
+        self.assertEqual(len(cache), 0)
+        #a write to another index keeps it
+        pending = cache.begin(key)
+        cache.invalidate(frozenset(["other-index"]))
+        cache.put(key, response, pending)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache._pending, set())
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.uris = []
+
+    def execute(self, request, event=None):
+        self.uris.append(request.uri)
+        if request.uri == "/_bulk":
+            return RestResponse(status=200, headers={}, body='{"took": 1, "items": []}')
+        if request.uri == "/_aliases":
+            return RestResponse(status=200, headers={},
+                                body='{"index-a": {"aliases": {"alias-a": {}}}, "index-b": {"aliases": {}}}')
+        return RestResponse(status=200, headers={}, body='{"count": 1}')
+
+
+class BulkInvalidationTestCase(unittest.TestCase):
+    def test_bulk_invalidates_its_indices(self):
+        conn = ES("http://127.0.0.1:9200", response_cache=True)
+        conn.connection.close()
+        conn.connection = FakeConnection()
+        #a raw command may write any index
+        conn.index_raw_bulk(conn.bulk_headers.header("index", "index-c", "test-type", 1), '{"name": "joe"}')
+        conn.force_bulk()
+        conn.count(TermQuery("name", "joe"), "index-b")
+        conn.count(TermQuery("name", "joe"), "index-b")
+        self.assertEqual(conn.response_cache.hits, 1)
+
+        #the bulk writing index-a keeps the cached count of index-b
+        conn.index({"name": "joe"}, "index-a", "test-type", 1, bulk=True)
+        conn.force_bulk()
+        conn.count(TermQuery("name", "joe"), "index-b")
+        self.assertEqual(conn.response_cache.hits, 2)
+        self.assertEqual(conn.connection.uris.count("/_bulk"), 2)
+        self.assertEqual(conn.connection.uris.count("/_aliases"), 1)
+
+        #the bulk writing index-a invalidates the count of its alias
+        conn.count(TermQuery("name", "joe"), "alias-a")
+        conn.index({"name": "joe"}, "index-a", "test-type", 2, bulk=True)
+        conn.force_bulk()
+        conn.count(TermQuery("name", "joe"), "alias-a")
+        self.assertEqual(conn.response_cache.hits, 2)
+
+    def test_threaded_bulker(self):
+        conn = ES("http://127.0.0.1:9200", bulk_size=2, response_cache=True,
+                  bulker_class=functools.partial(ThreadedBulker, workers=1, queue_size=1))
+        conn.connection.close()
+        conn.connection = FakeConnection()
+
+        def index():
+            for num in range(20):
+                conn.index({"name": "joe"}, "index-a", "test-type", num, bulk=True)
+            conn.force_bulk()
+
+        #the senders invalidate the cache while the producer waits for a free slot
+        producer = threading.Thread(target=index)
+        producer.daemon = True
+        producer.start()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(conn.connection.uris.count("/_bulk"), 10)
+        conn.close()
+
+
+class ESResponseCacheTestCase(ESTestCase):
+    def test_response_cache(self):
+        conn = get_conn(response_cache=True)
+        conn.index({"name": "joe"}, self.index_name, self.document_type, 1)
+        conn.indices.refresh(self.index_name)
+        self.assertEqual(conn.count(TermQuery("name", "joe"), self.index_name).count, 1)
+        self.assertEqual(conn.count(TermQuery("name", "joe"), self.index_name).count, 1)
+        self.assertEqual(conn.response_cache.hits, 1)
+
+        conn.index({"name": "joe"}, self.index_name, self.document_type, 2, bulk=True)
+        conn.indices.refresh(self.index_name)
+        self.assertEqual(conn.count(TermQuery("name", "joe"), self.index_name).count, 2)
+        self.assertEqual(conn.response_cache.hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
 from estestcase import ESTestCase
 from pyes.query import MatchAllQuery, Search
+from pyes.scroll import range_slices
 
 class ResultsetTestCase(ESTestCase):
     def setUp(self):
@@ -21,6 +25,50 @@ class ResultsetTestCase(ESTestCase):
         self.assertEqual(resultset[10].uuid, "11111")
         self.assertEqual(resultset.total, 1000)
 
+    def test_iterator_prefetch(self):
+        resultset = self.conn.search(Search(MatchAllQuery(), sort={'position': {'order': 'asc'}}, bulk_read=30),
+            self.index_name, self.document_type, prefetch=2)
+        self.assertEqual([r.position for r in resultset], range(1000))
+
+        resultset = self.conn.search(Search(MatchAllQuery(), bulk_read=30), self.index_name, self.document_type,
+            scan=True, prefetch=2)
+        self.assertEqual(len([r for r in resultset]), 1000)
+
+        resultset = self.conn.search(Search(MatchAllQuery(), bulk_read=30), self.index_name, self.document_type,
+            prefetch=2)
+        for i, r in enumerate(resultset):
+            if i == 40:
+                break
+        resultset.close()
+        self.assertIsNone(resultset._prefetcher)
+
+    def test_parallel_scan(self):
+        scan = self.conn.parallel_scan(Search(MatchAllQuery(), size=30), self.index_name, self.document_type,
+                                       workers=3, prefetch=2)
+        positions = [hit.position for hit in scan]
+        self.assertEqual(sorted(positions), range(1000))
+        self.assertEqual(scan.total, 1000)
+
+        scan = self.conn.parallel_scan(Search(MatchAllQuery(), size=30), self.index_name, self.document_type,
+                                       slices=range_slices("position", [None, 100, 500, None]))
+        self.assertEqual(sorted(hit.position for hit in scan), range(1000))
+
+    def test_resumable_scan(self):
+        checkpoint = os.path.join(tempfile.mkdtemp(), "scan.json")
+        scan = self.conn.resumable_scan(MatchAllQuery(), checkpoint, self.index_name, self.document_type,
+                                        sort_field="position", size=30)
+        positions = []
+        for hit in scan:
+            positions.append(hit.position)
+            if len(positions) == 500:
+                break
+        scan = self.conn.resumable_scan(MatchAllQuery(), checkpoint, self.index_name, self.document_type,
+                                        sort_field="position", size=30)
+        positions.extend(hit.position for hit in scan)
+        self.assertEqual(positions, range(1000))
+        self.assertEqual((scan.total, scan.count), (1000, 1000))
+        shutil.rmtree(os.path.dirname(checkpoint))
+
     def test_iterator_offset(self):
         # Query for a block of 10, starting at position 10:
         #
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pyes.exceptions import ElasticSearchException
+from pyes.query import MatchAllQuery, Search
+from pyes.scroll import OrderedFetcher, ResumableScan
+
+
+class OrderedFetcherTestCase(unittest.TestCase):
+    def test_order(self):
+        active = []
+        lock = threading.Lock()
+
+        def fetch(task):
+            with lock:
+                active.append(task)
+            #the first tasks are the slowest
+            time.sleep(0.01 * (10 - task))
+            return task * 2
+
+        self.assertEqual(list(OrderedFetcher(fetch, range(10), workers=4)), [task * 2 for task in range(10)])
+        self.assertEqual(sorted(active), range(10))
+
+    def test_error(self):
+        def fetch(task):
+            if task == 3:
+                raise ValueError(task)
+            return task
+
+        results = []
+        with self.assertRaises(ValueError):
+            for result in OrderedFetcher(fetch, range(10), workers=2):
+                results.append(result)
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_depth(self):
+        started = []
+        fetcher = OrderedFetcher(started.append, range(100), workers=2, depth=3)
+        iterator = iter(fetcher)
+        next(iterator)
+        time.sleep(0.05)
+        iterator.close()
+        self.assertTrue(len(started) <= 4)
+
+
+class SortedScrollConnection(object):
+    """
+    Serve the scrolls of a ResumableScan over documents of ``num`` values,
+    three documents per value
+    """
+
+    def __init__(self, num):
+        self.docs = [{"_id": "%d-%d" % (value, pos), "sort": [value, "test-type#%d-%d" % (value, pos)]}
+                     for value in range(num) for pos in range(3)]
+        self.scrolls = {}
+        self.expire = False
+
+    @staticmethod
+    def model(conn, hit):
+        return hit["_id"]
+
+    def _encode_search(self, search):
+        return repr(search.serialize())
+
+    def search_raw(self, search, indices=None, doc_types=None, **query_params):
+        docs = self.docs
+        if search.filter:
+            lower = search.filter.ranges[0].from_value
+            docs = [doc for doc in docs if doc["sort"][0] >= lower]
+        scroll_id = str(len(self.scrolls))
+        self.scrolls[scroll_id] = (docs, search.size)
+        return self.search_scroll(scroll_id)
+
+    def search_scroll(self, scroll_id, scroll="10m"):
+        if self.expire:
+            self.expire = False
+            raise ElasticSearchException("SearchContextMissingException")
+        docs, size = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (docs[size:], size)
+        return {"_scroll_id": scroll_id, "hits": {"total": len(docs), "hits": docs[:size]}}
+
+
+class ResumableScanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.path, "scan.json")
+        self.conn = SortedScrollConnection(10)
+        self.ids = [doc["_id"] for doc in self.conn.docs]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def scan(self):
+        return ResumableScan(self.conn, Search(MatchAllQuery()), self.checkpoint, sort_field="value", size=4,
+                             checkpoint_interval=0)
+
+    def test_resume(self):
+        scan = self.scan()
+        iterator = iter(scan)
+        ids = [next(iterator) for i in range(13)]
+        iterator.close()
+        self.assertEqual((scan.count, scan.total, scan.done), (13, 30, False))
+
+        scan = self.scan()
+        ids.extend(scan)
+        self.assertEqual(ids, self.ids)
+        self.assertEqual((scan.count, scan.total, scan.done), (30, 30, True))
+        #the scan is done
+        self.assertEqual(list(self.scan()), [])
+
+    def test_expired_context(self):
+        scan = self.scan()
+        iterator = iter(scan)
+        ids = [next(iterator) for i in range(4)]
+        self.conn.expire = True
+        ids.extend(iterator)
+        self.assertEqual(ids, self.ids)
+
+    def test_other_scan(self):
+        iterator = iter(self.scan())
+        next(iterator)
+        iterator.close()
+        scan = ResumableScan(self.conn, Search(MatchAllQuery()), self.checkpoint, sort_field="date")
+        self.assertRaises(ValueError, iter, scan)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from datetime import datetime
+import gc
+import unittest
+from .estestcase import ESTestCase
+from pyes.es import ResultSet
+from pyes.jsoncodec import JSONCodec
+from pyes.query import MatchAllQuery, Search
+from pyes.streaming import HitStream
+
+RESPONSE = ('{"_scroll_id": "c2Nhbjs", "took": 12, "timed_out": false, '
+            '"hits": {"total": 3, "max_score": 1.5, "hits": ['
+            '{"_id": "1", "_source": {"date": "2012-01-01T00:00:00"}}, {"_id": "\\u00e8"} ,'
+            '{"_id": "3", "_source": {"value": 12345, "score": -1.5e3}}]}, '
+            '"facets": {"tag": {"_type": "terms", "terms": []}}}')
+
+
+def chunked(data, size):
+    return [data[pos:pos + size] for pos in range(0, len(data), size)]
+
+
+class HitStreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codec = JSONCodec()
+
+    def test_chunks(self):
+        for size in (1, 2, 3, 7, 64, len(RESPONSE)):
+            closed = []
+            stream = HitStream(chunked(RESPONSE, size), self.codec.raw_decode, closed.append)
+            self.assertEqual(stream.total, 3)
+            self.assertEqual(stream.scroll_id, "c2Nhbjs")
+            hits = list(stream)
+            self.assertEqual([hit._id for hit in hits], ["1", u"\xe8", "3"])
+            self.assertEqual(hits[0]._source.date, datetime(2012, 1, 1))
+            self.assertEqual(hits[2]._source.value, 12345)
+            self.assertEqual(hits[2]._source.score, -1500.0)
+            self.assertEqual(stream.facets, {"tag": {"_type": "terms", "terms": []}})
+            self.assertEqual(stream.max_score, 1.5)
+            self.assertEqual(closed, [True])
+
+    def test_facets_before_hits(self):
+        stream = HitStream(chunked(RESPONSE, 10), self.codec.raw_decode)
+        self.assertEqual(stream.facets["tag"]["_type"], "terms")
+        self.assertEqual(len(list(stream)), 3)
+
+    def test_close(self):
+        closed = []
+        stream = HitStream(chunked(RESPONSE, 10), self.codec.raw_decode, closed.append)
+        self.assertEqual(iter(stream).next()._id, "1")
+        stream.close()
+        self.assertEqual(list(stream), [])
+        self.assertEqual(closed, [False])
+
+    def test_truncated(self):
+        closed = []
+        stream = HitStream(chunked(RESPONSE[:150], 10), self.codec.raw_decode, closed.append)
+        self.assertRaises(ValueError, list, stream)
+        self.assertEqual(closed, [False])
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = []
+        self.codec = JSONCodec()
+
+    def search_raw(self, search, indices=None, doc_types=None, stream=False, **query_params):
+        return HitStream(chunked(RESPONSE, 10), self.codec.raw_decode, self.closed.append)
+
+
+class ResultSetStreamTestCase(unittest.TestCase):
+    def test_abandoned_resultset_closes_its_response(self):
+        conn = FakeConnection()
+        results = ResultSet(conn, Search(MatchAllQuery()), query_params={}, model=lambda conn, hit: hit,
+                            stream=True)
+        self.assertEqual(results.next()._id, "1")
+        #the generator of the hits doesn't keep the resultset in a cycle
+        del results
+        gc.collect()
+        self.assertEqual(gc.garbage, [])
+        self.assertEqual(conn.closed, [False])
+
+
+class StreamingTestCase(ESTestCase):
+    def setUp(self):
+        super(StreamingTestCase, self).setUp()
+        for num in range(25):
+            self.conn.index({"name": "Joe", "num": num}, self.index_name, self.document_type, num, bulk=True)
+        self.conn.force_bulk()
+        self.conn.refresh(self.index_name)
+
+    def test_search_raw_stream(self):
+        stream = self.conn.search_raw(MatchAllQuery(), self.index_name, size=30, stream=True)
+        self.assertEqual(stream.total, 25)
+        self.assertEqual(sorted(hit._source.num for hit in stream), range(25))
+
+    def test_resultset_stream(self):
+        results = self.conn.search(Search(MatchAllQuery(), bulk_read=10), self.index_name, stream=True)
+        self.assertEqual(len(results), 25)
+        self.assertEqual(sorted(hit.num for hit in results), range(25))
+        results = self.conn.search(MatchAllQuery(), self.index_name, scan=True, stream=True)
+        self.assertEqual(sorted(hit.num for hit in results), range(25))
+
+
+if __name__ == "__main__":
+    unittest.main()